@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# DirectoryTrends.py
+#
+# Crawl the configured directories once and feed every configured sink, the
+# InfluxDB writer and the email report, from the same collection pass. With a
+# "clusters" list, all of the clusters are crawled concurrently into the same
+# sinks and every InfluxDB point is tagged with its cluster.
+#
+# The directorytrends launcher runs this script with a command in front:
+#   directorytrends collect - feed the sinks of --sinks or of the config file
+#   directorytrends report  - only build and mail the email report
+#   directorytrends push    - only write the points to InfluxDB
+# The InfluxDB client and the HTML report libraries are only imported by the
+# sinks that use them, so short runs do not pay for the backends they skip.
+
+# Standard Python libaries
+import sys
+
+#  Import local Python libraries
+from utils.Logger import Logger
+from utils import ArgParsing
+from utils import Authentication
+from utils.Daemon import Scheduler, run_daemon
+from utils.Pipeline import run_pipeline, run_clusters_pipeline
+from utils.Telemetry import RunTelemetry
+from utils.ConfigFileParser import ConfigFileParser
+
+
+# Define the name of the Program, Description, and Version.
+progname = "DirectoryTrends"
+progdesc = "Qumulo DirectoryTrends - Show the capacity changes of the defined directories daily and weekly basis."
+progvers = "6.1.0"
+
+DEFAULT_SINKS = ["influxdb", "email"]
+
+# The sinks of each command of the directorytrends launcher, None for the configured ones
+COMMANDS = {
+    "collect": None,
+    "report": ["email"],
+    "push": ["influxdb"],
+}
+
+logger = Logger()
+
+def get_sink_names(args, configs, command_sinks=None):
+    # A command of the launcher overrides the --sinks option, which overrides
+    # the "sinks" list of the config file
+    if command_sinks:
+        return command_sinks
+    if args.sinks:
+        return args.sinks
+    if configs.sink_names is None:
+        return DEFAULT_SINKS
+    return configs.sink_names
+
+def build_sinks(sink_names, configs, cluster, write_api=None):
+    sinks = []
+    for sink_name in sink_names:
+        # Import the backend of a sink only when it is used
+        if sink_name == "influxdb":
+            from utils.InfluxDBSink import InfluxDBSink
+            sinks.append(InfluxDBSink(configs, logger, write_api))
+        elif sink_name == "email":
+            from utils.EmailSink import EmailSink, email_settings
+            sinks.append(EmailSink(configs, logger, email_settings(configs), cluster))
+        else:
+            raise Exception(f'Unknown sink "{sink_name}"')
+    return sinks
+
+def cluster_config(configs, cluster_entry):
+    # A cluster of the "clusters" list may override dir_paths and max_depth
+    directories = dict(configs["directories"])
+    for key in ("dir_paths", "max_depth"):
+        if key in cluster_entry:
+            directories[key] = cluster_entry[key]
+    return configs.derive(cluster=cluster_entry, directories=directories)
+
+def login_clusters(configs):
+    # Log into every cluster of the "clusters" list, skipping the ones that cannot be reached
+    targets = []
+    for cluster_entry in configs.cluster_entries:
+        cluster_configs = cluster_config(configs, cluster_entry)
+        try:
+            rc = Authentication.login_with_configs(cluster_configs)
+            cluster = cluster_entry.get("name") or rc.cluster.get_cluster_conf()["cluster_name"]
+        except (SystemExit, Exception):
+            logger.error(f"Skipping cluster {cluster_entry['address']}")
+            continue
+        targets.append((cluster, rc, cluster_configs))
+    
+    if not targets:
+        raise Exception("None of the clusters could be reached")
+    return targets
+
+def retarget(targets, configs):
+    # Give the logged in clusters their part of a reloaded config. They are
+    # matched by address, a cluster that was added to the list needs a restart.
+    if "clusters" not in configs:
+        return [(cluster, rc, configs) for cluster, rc, cluster_configs in targets]
+    
+    entries = {(entry["address"], entry["port"]): entry for entry in configs.cluster_entries}
+    retargeted = []
+    for cluster, rc, cluster_configs in targets:
+        entry = cluster_configs["cluster"]
+        entry = entries.get((entry["address"], entry["port"]), entry)
+        retargeted.append((cluster, rc, cluster_config(configs, entry)))
+    return retargeted
+
+def collect(args, targets, configs, sink_names, write_api=None, telemetry=None):
+    cluster = ", ".join(target[0] for target in targets)
+    logger.info(f"Capacity details are being collected for {', '.join(sink_names)}")
+    
+    if "clusters" not in configs:
+        rc = targets[0][1]
+        Authentication.call_with_relogin(
+            rc, lambda: run_pipeline(args, rc, configs, build_sinks(sink_names, configs, cluster, write_api),
+                                     logger, telemetry),
+            args, configs)
+        return
+    
+    # Each cluster logs in again on its own when its session expired
+    run_clusters_pipeline(args, targets, configs, build_sinks(sink_names, configs, cluster, write_api),
+                          logger, telemetry,
+                          lambda rc, cluster_configs, crawl: Authentication.call_with_relogin(
+                              rc, crawl, configs=cluster_configs))
+
+def run(args, targets, configs, telemetry=None, command_sinks=None, parser=None):
+    sink_names = get_sink_names(args, configs, command_sinks)
+    if telemetry is None:
+        telemetry = RunTelemetry(progname, logger)
+    
+    if not args.daemon:
+        try:
+            collect(args, targets, configs, sink_names, telemetry=telemetry)
+        finally:
+            telemetry.publish(configs)
+        return
+    
+    def reload(reloaded):
+        nonlocal targets
+        if ("clusters" in reloaded) != ("clusters" in configs):
+            logger.error(f'Switching between "cluster" and "clusters" needs a restart, '
+                         f'keeping the previous configuration')
+            return None
+        targets = retarget(targets, reloaded)
+        return reloaded
+    
+    def cycle(configs, write_api, cycle_telemetry):
+        collect(args, targets, configs, get_sink_names(args, configs, command_sinks), write_api, cycle_telemetry)
+    
+    # Keep the cluster sessions and the InfluxDB client open across cycles. A new
+    # InfluxDB connection or a newly added influxdb sink needs a new client.
+    scheduler = Scheduler(*Scheduler.get_settings(args, configs), logger)
+    run_daemon(cycle, parser, scheduler, progname, args, configs, telemetry, reload,
+               lambda configs: "influxdb" in get_sink_names(args, configs, command_sinks), logger)
+
+def main(command_sinks=None, entry=progname):    
+    args = ArgParsing.main()
+    
+    if not args.config_file:
+        logger.error(f"No configuration file was defined.")
+        sys.exit(1)
+    
+    telemetry = RunTelemetry(entry, logger)
+    
+    # Get the configuration file so that we can figure out which sinks to feed
+    config = ConfigFileParser(args.config_file, logger)
+    
+    # Validate the config
+    try:
+        with telemetry.phase("config"):
+            config.validate()
+            configs = config.get_configs()
+    except Exception as err:
+        logger.error(f'Configuration would not validate, error is {err}')
+        sys.exit(1)
+    
+    try:
+        with telemetry.phase("login"):
+            if "clusters" in configs:
+                targets = login_clusters(configs)
+            else:
+                if args.cluster:
+                    rc = Authentication.login_with_args(args)
+                else:
+                    rc = Authentication.login_with_configs(configs)
+                targets = [(rc.cluster.get_cluster_conf()["cluster_name"], rc, configs)]
+    except:
+        sys.exit(1)
+    
+    try:
+        run(args, targets, configs, telemetry, command_sinks, config)
+    except Exception as err:
+        logger.error(f'Collection failed, error is {err}')
+        sys.exit(1)
+
+
+def cli():
+    # directorytrends <command> [options] - the command picks the sinks and the
+    # rest of the command line is parsed as usual
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"usage: directorytrends {{{','.join(COMMANDS)}}} --config-file CONFIG_FILE [options]\n\n"
+              f"  collect  crawl once and feed the sinks of --sinks or of the config file\n"
+              f"  report   crawl once and only mail the email report\n"
+              f"  push     crawl once and only write the points to InfluxDB\n\n"
+              f"Run directorytrends <command> --help for the options.",
+              file=sys.stderr)
+        sys.exit(0 if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help") else 2)
+    
+    command = sys.argv.pop(1)
+    main(COMMANDS[command], f"directorytrends-{command}")
+
+        
+if __name__ == "__main__":
+    main()
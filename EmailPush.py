@@ -26,22 +26,16 @@
 #
 
 import sys
-import os
-from os import path
-import time
-import json
-import functools
-import platform
-
-import dominate
-from dominate.tags import table, tr, td, th, span
 
 #  Import local Python libraries
 # from operators import SMBShares, NFSExports, DirQuotas, Replications
 from utils.Logger import Logger
 from utils import ArgParsing
 from utils import Authentication
-from utils.Email import Email
+from utils.Daemon import Scheduler, run_daemon
+from utils.EmailSink import EmailSink, email_settings
+from utils.Pipeline import run_pipeline
+from utils.Telemetry import RunTelemetry
 from utils.ConfigFileParser import ConfigFileParser
 
 
@@ -52,84 +46,22 @@ progvers = "6.1.0"
 
 logger = Logger()
 
-def check_capacity(args, rc):
-    CONFIG_FILE_PATH = args.config_file
-    with open(CONFIG_FILE_PATH, "r") as configFile:
-        config = json.load(configFile)
-        directories = config["directories"]["dir_paths"]
-        dir_capacity_usages = []
-        
-        for directory in directories:
-            dir_aggregates = rc.fs.read_dir_aggregates(path=directory, max_depth=config["directories"]["max_depth"], recursive=True)
-            for dir_aggregate in dir_aggregates:
-                usages = {}
-                path = rc.fs.get_file_attr(path=directory)["path"]
-                usages["data"] = round(int(dir_aggregate["total_data"]) / 10 ** 9, 2)
-                usages["metadata"] = round(int(dir_aggregate["total_meta"]) / 10 ** 9, 2)
-                usages["directory"] = path
-                dir_capacity_usages.append(usages) 
+def check_capacity(args, rc, telemetry=None, config=None):
+    # main loads and validates the config once and passes it in
+    if config is None:
+        config = ConfigFileParser.load(args.config_file, logger)
     
-    with open("./config/previous_dir_usages.json", "r") as previousUsages:
-        previous_dir_usages = json.load(previousUsages)
-        
-        doc = dominate.document(title='Qumulo Storage Report')
-
-        with doc:
-            with table():
-                with tr():
-                    with th(style="text-align:left"):
-                        span("Directory")
-                    with th(style="text-align:center"):
-                        span("Data Change")
-                    with th(style="text-align:center"):
-                        span("Metadata Change")
-                for dir_capacity_usage in dir_capacity_usages:
-                    with tr():
-                        directory = dir_capacity_usage["directory"]
-
-                        if directory in previous_dir_usages:
-                            data_change = round(dir_capacity_usage["data"] - previous_dir_usages[directory]["data"], 2)
-                            if data_change > 0:
-                                data_change = "+" + str(data_change) + " GB"
-                            else:
-                                data_change = str(data_change) + " GB"
-                                
-                            metadata_change = round(dir_capacity_usage["metadata"] - previous_dir_usages[directory]["metadata"], 2)
-                            if metadata_change > 0:
-                                metadata_change = "+" + str(metadata_change) + " GB"
-                            else:
-                                metadata_change = str(metadata_change) + " GB"
-                                
-                            previous_dir_usages[directory]["data"] = dir_capacity_usage["data"]
-                            previous_dir_usages[directory]["metadata"] = dir_capacity_usage["metadata"]
-                            
-                            with td(style="text-align:left"):
-                                span(directory)
-                            with td(style="text-align:center"):
-                                span(data_change) 
-                            with td(style="text-align:center"):
-                                span(metadata_change)
-                
-                        else:
-                            usages = {}
-                            usages["data"] = dir_capacity_usage["data"]
-                            usages["metadata"] = dir_capacity_usage["metadata"]
-                            previous_dir_usages[directory] = usages
-                        
-                            with td(style="text-align:left"):
-                                span(directory)
-                            with td(style="text-align:center"):
-                                span("New directory") 
-                            with td(style="text-align:center"):
-                                span("New directory")      
-                
-    with open("./config/previous_dir_usages.json", "w") as previousUsagesFile:
-        json.dump(previous_dir_usages, previousUsagesFile, indent=4)
+    email_sink = EmailSink(config, logger)
+    run_pipeline(args, rc, config, [email_sink], logger, telemetry)
     
-    return doc
+    return email_sink
 
 def main():    
     args = ArgParsing.main()
+    config = None
+    configs = None
+    settings = {}
+    telemetry = RunTelemetry("EmailPush", logger)
     
     if args.config_file:
         # Get the configuration file so that we can figure out how often to run the program
@@ -137,26 +69,22 @@ def main():
         
         # Validate the config
         try:
-            config.validate()
-            configs = config.get_configs()
+            with telemetry.phase("config"):
+                config.validate()
+                configs = config.get_configs()
                 
             try:
-                if args.cluster:
-                    rc = Authentication.login_with_args(args)
-                else:
-                    rc = Authentication.login_with_configs(configs)
+                with telemetry.phase("login"):
+                    if args.cluster:
+                        rc = Authentication.login_with_args(args)
+                    else:
+                        rc = Authentication.login_with_configs(configs)
             except:
                 sys.exit(1)
                 
             try:
                 cluster = rc.cluster.get_cluster_conf()["cluster_name"]
-                email_from = configs['email']['from']
-                email_to = configs['email']['to']
-                email_login = configs['email']['login']
-                email_password = configs['email']['password']
-                email_server = configs['email']['server']
-                email_port = configs['email']['port']
-                email_use = configs['email']['use']
+                settings.update(email_settings(configs))
             except:
                 sys.exit(1)
             
@@ -174,27 +102,40 @@ def main():
         try:
             cluster = rc.cluster.get_cluster_conf()["cluster_name"]
             if args.email:
-                email_from = args.email.email_from
-                email_to = args.email.email_to
-                email_login = args.email.login
-                email_password = args.email.password
-                email_server = args.email.server
-                email_port = args.email.port
-                email_use = args.email.use
+                settings.update({"from": args.email.email_from, "to": args.email.email_to,
+                                 "login": args.email.login, "password": args.email.password,
+                                 "server": args.email.server, "port": args.email.port,
+                                 "use": args.email.use})
         except:
             sys.exit(1)
 
-    capacity_changes = check_capacity(args, rc)
+    # Build a subject line
+    subject = f'Latest directory trend report for "{cluster}"'
 
-    email = Email(logger= logger)
+    def send_report(telemetry, configs):
+        email_sink = check_capacity(args, rc, telemetry, configs)
 
-    # Build a subject and message line
-    subject = f'Latest directory trend report for "{cluster}"'
-    message = capacity_changes
+        # The team reports of the routing rules go out over the same SMTP session
+        with telemetry.phase("smtp_send"):
+            email_sink.send_report(settings, subject)
+
+    if not args.daemon:
+        try:
+            Authentication.call_with_relogin(rc, lambda: send_report(telemetry, configs), args, configs)
+        finally:
+            telemetry.publish(configs)
+        return
+
+    def reload(configs):
+        settings.update(email_settings(configs))
+        return configs
+
+    def report_run(configs, write_api, run_telemetry):
+        Authentication.call_with_relogin(rc, lambda: send_report(run_telemetry, configs), args, configs)
 
-    email.send_mail(email_from, email_to, subject, message,
-                    email_server, email_port, email_login,
-                    email_password, email_use)
+    # Keep the cluster session open and send a report every interval, a new cluster needs a restart
+    scheduler = Scheduler(*Scheduler.get_settings(args, configs), logger)
+    run_daemon(report_run, config, scheduler, "EmailPush", args, configs, telemetry, reload, logger=logger)
 
         
 if __name__ == "__main__":
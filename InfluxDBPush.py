@@ -26,24 +26,16 @@
 #
 
 # Standard Python libaries
-import datetime
 import sys
-import os
-from os import path
-import time
-import json
-import functools
-import platform
-
-# InfluxDB libraries
-from influxdb_client import InfluxDBClient, Point, WriteOptions
-from influxdb_client.client.write_api import SYNCHRONOUS
 
 #  Import local Python libraries
 from utils.Logger import Logger
 from utils import ArgParsing
 from utils import Authentication
-from utils.Email import Email
+from utils.Daemon import Scheduler, run_daemon
+from utils.InfluxDBSink import InfluxDBSink
+from utils.Pipeline import run_pipeline
+from utils.Telemetry import RunTelemetry
 from utils.ConfigFileParser import ConfigFileParser
 
 
@@ -54,71 +46,47 @@ progvers = "6.1.0"
 
 logger = Logger()
 
-def write_data_points(config, write_api, path, capacity, data, metadata, dir_count, file_count, current_time):
-    data_points = [
-        Point("CapacityDetails")
-        .tag("path", path)
-        .field("capacity", capacity)
-        .time(time=current_time),
-        Point("CapacityDetails")
-        .tag("path", path)
-        .field("data_capacity", data)
-        .time(time=current_time),
-        Point("CapacityDetails")
-        .tag("path", path)
-        .field("metadata_capacity", metadata)
-        .time(time=current_time),
-        Point("CapacityDetails")
-        .tag("path", path)
-        .field("dir_count", dir_count)
-        .time(time=current_time),
-        Point("CapacityDetails")
-        .tag("path", path)
-        .field("file_count", file_count)
-        .time(time=current_time)
-    ]
-    write_api.write(bucket=config["influxdb"]["bucket_name"], record=data_points)
-
-def check_capacity(args, rc):
-    CONFIG_FILE_PATH = args.config_file
+def check_capacity(args, rc, write_api=None, telemetry=None, config=None):
+    # main loads and validates the config once and passes it in
+    if config is None:
+        config = ConfigFileParser.load(args.config_file, logger)
     
-    with open(CONFIG_FILE_PATH, "r") as configFile:
-        config = json.load(configFile)
-        directories = config["directories"]["dir_paths"]
-        
-        # Create an instance of the InfluxDB client
-        influxdb_address = config["influxdb"]["address"]
-        client = InfluxDBClient(
-            url=f"http://{influxdb_address}:8086",
-            token=config["influxdb"]["token"],
-            org=config["influxdb"]["org_name"],
-        )
-        
-        # Create a write API instance
-        write_api = client.write_api()
-        
-        current_time = datetime.datetime.utcnow()
-        
-        for directory in directories:
-            dir_aggregates = rc.fs.read_dir_aggregates(path=directory, max_depth=config["directories"]["max_depth"], recursive=True)
-            for dir_aggregate in dir_aggregates:
-                usages = {}
-                path = dir_aggregate["path"]
-                capacity = int(dir_aggregate["total_capacity"])
-                data = int(dir_aggregate["total_data"])
-                metadata = int(dir_aggregate["total_meta"])
-                file_count = int(dir_aggregate["total_files"])
-                dir_count = int(dir_aggregate["total_directories"])
-            
-            # Write the data point to InfluxDB
-            write_data_points(config, write_api, path, capacity, data, metadata, dir_count, file_count, current_time)
+    # The daemon passes in a write API that lives across cycles
+    run_pipeline(args, rc, config, [InfluxDBSink(config, logger, write_api)], logger, telemetry)
 
-    # Close the write API and InfluxDB client
-    write_api.close()
-    client.close()
+def run(args, rc, configs=None, telemetry=None, parser=None):
+    if telemetry is None:
+        telemetry = RunTelemetry("InfluxDBPush", logger)
+    
+    if not args.daemon:
+        logger.info(f"Capacity details are being collected")
+        try:
+            Authentication.call_with_relogin(rc, lambda: check_capacity(args, rc, telemetry=telemetry, config=configs),
+                                             args, configs)
+        finally:
+            telemetry.publish(configs)
+        return
+    
+    if parser is None:
+        parser = ConfigFileParser(args.config_file, logger)
+        parser.validate()
+    if configs is None:
+        configs = parser.get_configs()
+    
+    def cycle(configs, write_api, cycle_telemetry):
+        logger.info(f"Capacity details are being collected")
+        Authentication.call_with_relogin(rc, lambda: check_capacity(args, rc, write_api, cycle_telemetry, configs),
+                                         args, configs)
+    
+    # Keep the cluster session and the InfluxDB client open across cycles. Only a
+    # change of the InfluxDB connection needs a new client, a new cluster needs a restart.
+    scheduler = Scheduler(*Scheduler.get_settings(args, configs), logger)
+    run_daemon(cycle, parser, scheduler, "InfluxDBPush", args, configs, telemetry,
+               use_influxdb=lambda configs: True, logger=logger)
 
 def main():    
     args = ArgParsing.main()
+    telemetry = RunTelemetry("InfluxDBPush", logger)
     
     if args.config_file:
         # Get the configuration file so that we can figure out how often to run the program
@@ -126,20 +94,21 @@ def main():
         
         # Validate the config
         try:
-            config.validate()
-            configs = config.get_configs()
+            with telemetry.phase("config"):
+                config.validate()
+                configs = config.get_configs()
                 
             try:
-                if args.cluster:
-                    rc = Authentication.login_with_args(args)
-                else:
-                    rc = Authentication.login_with_configs(configs)
+                with telemetry.phase("login"):
+                    if args.cluster:
+                        rc = Authentication.login_with_args(args)
+                    else:
+                        rc = Authentication.login_with_configs(configs)
             except:
                 sys.exit(1)
                 
             try:
-                logger.info(f"Capacity details are being collected")
-                check_capacity(args, rc)
+                run(args, rc, configs, telemetry, config)
             except:
                 sys.exit(1)
             
@@ -155,8 +124,7 @@ def main():
             sys.exit(1)
             
         try:
-            logger.info(f"Capacity details are being collected")
-            check_capacity(args, rc)
+            run(args, rc)
         except:
             sys.exit(1)
 
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_arg_parsing.py
+#
+
+# Import Python system libraries
+import sys
+import unittest
+from unittest import mock
+
+#  Import local Python libraries
+from utils import ArgParsing
+
+
+def parse(*argv):
+    with mock.patch.object(sys, "argv", ["DirectoryTrends.py"] + list(argv)):
+        return ArgParsing.main()
+
+
+class TestParseArgs(unittest.TestCase):
+
+    def test_sinks_keep_email(self):
+        args = parse("--sinks", "influxdb", "email")
+        self.assertEqual(args.sinks, ["influxdb", "email"])
+        self.assertIsNone(args.email)
+
+    def test_email_only_sink(self):
+        args = parse("--sinks", "email")
+        self.assertEqual(args.sinks, ["email"])
+        self.assertIsNone(args.email)
+
+    def test_email_sub_command_after_sinks(self):
+        args = parse("--sinks", "email", "email", "--to", "ops@example.com")
+        self.assertEqual(args.sinks, ["email"])
+        self.assertEqual(args.email.email_to, "ops@example.com")
+
+    def test_email_sub_command_without_sinks(self):
+        args = parse("--config-file", "config.json", "email", "--server", "smtp.example.com")
+        self.assertIsNone(args.sinks)
+        self.assertEqual(args.config_file, "config.json")
+        self.assertEqual(args.email.server, "smtp.example.com")
+
+    def test_sub_command_ends_sinks(self):
+        args = parse("--sinks", "influxdb", "daemon", "--interval", "60")
+        self.assertEqual(args.sinks, ["influxdb"])
+        self.assertEqual(args.daemon.interval, "60")
+        self.assertIsNone(args.email)
+
+
+if __name__ == "__main__":
+    unittest.main()
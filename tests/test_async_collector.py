@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_async_collector.py
+#
+
+# Import Python system libraries
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+#  Import local Python libraries
+from utils.Collector import Collector
+from utils.ConfigFileParser import Config
+from utils.CrawlState import CrawlState
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+from FakeQumulo import FakeQumuloServer, FakeTree
+
+try:
+    import aiohttp
+    from qumulo.rest_client import RestClient
+    from utils.AsyncCollector import AsyncCollector
+    from Benchmark import make_certificate
+except ImportError:
+    aiohttp = None
+
+
+def collect_paths(collector, roots):
+    return sorted((dir_aggregate["path"], dir_aggregate["total_data"])
+                  for directory, dir_aggregates, elapsed in collector.collect(roots)
+                  for dir_aggregate in dir_aggregates)
+
+
+# Both collectors read the same FakeQumulo tree over HTTPS, the threaded one
+# through the qumulo RestClient and the asyncio one through aiohttp
+
+
+@unittest.skipIf(aiohttp is None or shutil.which("openssl") is None,
+                 "needs aiohttp, the qumulo_api bindings and openssl")
+class TestAsyncCollector(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        certfile, keyfile = make_certificate(cls.directory.name)
+        cls.tree = FakeTree(width=4, depth=3, files=1, file_size=1024)
+        cls.server = FakeQumuloServer(cls.tree, certfile=certfile, keyfile=keyfile).start()
+        cls.rc = RestClient("127.0.0.1", cls.server.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.tree.page_size = 0
+        self.roots = ["/dir0", "/dir1", "/dir2/dir3"]
+        self.state_index = 0
+
+    def config(self, max_depth, **directories):
+        directories = dict(directories, dir_paths=self.roots, max_depth=max_depth,
+                           asyncio={"enabled": True, "scheme": "https", "max_connections": 4})
+        return Config({"directories": directories})
+
+    def crawl_state(self):
+        self.state_index += 1
+        return CrawlState(os.path.join(self.directory.name, f"{self.id()}-{self.state_index}.db"))
+
+    def compare(self, config, adaptive=False):
+        shard_workers, shard_paths = Collector.get_shard(config)
+        threaded_state = self.crawl_state() if adaptive else None
+        threaded = Collector(self.rc, max_depth=config.max_depth, max_workers=2, crawl_state=threaded_state,
+                             shard_workers=shard_workers, shard_paths=shard_paths)
+        async_state = self.crawl_state() if adaptive else None
+        asynchronous = AsyncCollector.from_client(self.rc, config, crawl_state=async_state)
+
+        expected = collect_paths(threaded, self.roots)
+        self.assertEqual(collect_paths(asynchronous, self.roots), expected)
+        for crawl_state in (threaded_state, async_state):
+            if crawl_state is not None:
+                crawl_state.close()
+        return expected
+
+    def test_recursive(self):
+        paths = self.compare(self.config(2))
+        self.assertEqual(len(paths), 2 * (1 + 4 + 16) + 1 + 4)
+
+    def test_adaptive(self):
+        paths = self.compare(self.config(2, adaptive={"enabled": True}), adaptive=True)
+        self.assertEqual(len(paths), 2 * (1 + 4 + 16) + 1 + 4)
+
+    def test_paged_adaptive(self):
+        self.tree.page_size = 3
+        paths = self.compare(self.config(2, adaptive={"enabled": True}), adaptive=True)
+        self.assertEqual(len(paths), 2 * (1 + 4 + 16) + 1 + 4)
+
+    def test_paged_shard(self):
+        self.tree.page_size = 3
+        paths = self.compare(self.config(2, shard={"enabled": True, "paths": ["/dir0"]}))
+        self.assertEqual(len(paths), 2 * (1 + 4 + 16) + 1 + 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
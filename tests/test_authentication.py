@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_authentication.py
+#
+
+# Import Python system libraries
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+#  Import local Python libraries
+from utils.SessionCache import SessionCache
+
+
+class TestSessionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, "cache", "sessions.json")
+        self.cache = SessionCache(self.cache_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_get_remove(self):
+        self.assertIsNone(self.cache.get("qumulo", 8000, "admin"))
+        self.cache.put("qumulo", 8000, "admin", "token-1")
+        self.cache.put("qumulo", 8000, "other", "token-2")
+        self.assertEqual(self.cache.get("qumulo", 8000, "admin"), "token-1")
+
+        self.cache.remove("qumulo", 8000, "admin")
+        self.assertIsNone(self.cache.get("qumulo", 8000, "admin"))
+        self.assertEqual(SessionCache(self.cache_path).get("qumulo", 8000, "other"), "token-2")
+
+    def test_files_are_private(self):
+        self.cache.put("qumulo", 8000, "admin", "token")
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_path).st_mode), 0o600)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_path + ".lock").st_mode), 0o600)
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(self.cache_path)).st_mode), 0o700)
+
+        # The update went through a temporary file that was moved over the cache
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.cache_path))),
+                         ["sessions.json", "sessions.json.lock"])
+
+    def test_unreadable_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, "w") as cache_file:
+            cache_file.write("{broken")
+        self.assertIsNone(self.cache.get("qumulo", 8000, "admin"))
+
+        # The broken file is not replaced by a partial one either
+        self.cache.put("qumulo", 8000, "admin", "token")
+        with open(self.cache_path) as cache_file:
+            self.assertEqual(cache_file.read(), "{broken")
+
+
+# The Qumulo bindings are only needed by the login tests
+try:
+    from qumulo.lib.request import RequestError
+    from utils import Authentication
+except ImportError:
+    Authentication = None
+
+
+#
+# A RestClient stand-in. Bearer tokens in `valid` are accepted, logging in with
+# the password hands out the next token.
+
+
+class FakeRestClient(object):
+    valid = set()
+    logins = 0
+
+    def __init__(self, address, port, credentials=None):
+        self.conninfo = mock.Mock(host=address, port=port)
+        self.credentials = credentials
+        self.auth = mock.Mock()
+        self.auth.who_am_i.side_effect = self.who_am_i
+
+    def who_am_i(self):
+        if self.credentials is None or self.credentials.bearer_token not in FakeRestClient.valid:
+            raise RequestError(401, "Unauthorized")
+        return {"name": "admin"}
+
+    def login(self, username, password):
+        FakeRestClient.logins += 1
+        token = f"token-{FakeRestClient.logins}"
+        FakeRestClient.valid.add(token)
+        self.credentials = mock.Mock(bearer_token=token)
+
+
+@unittest.skipIf(Authentication is None, "needs the qumulo_api bindings")
+class TestLogin(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SessionCache(os.path.join(self.directory.name, "sessions.json"))
+        FakeRestClient.valid = set()
+        FakeRestClient.logins = 0
+
+        patches = [mock.patch.object(Authentication, "session_cache", self.cache),
+                   mock.patch.object(Authentication, "RestClient", FakeRestClient)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cached_token_is_reused(self):
+        FakeRestClient.valid.add("cached")
+        self.cache.put("qumulo", 8000, "admin", "cached")
+
+        rc = Authentication.login_with_password("qumulo", 8000, "admin", "secret")
+        self.assertEqual(rc.credentials.bearer_token, "cached")
+        self.assertEqual(FakeRestClient.logins, 0)
+
+    def test_stale_token_falls_back_to_the_password(self):
+        self.cache.put("qumulo", 8000, "admin", "stale")
+
+        rc = Authentication.login_with_password("qumulo", 8000, "admin", "secret")
+        self.assertEqual(rc.credentials.bearer_token, "token-1")
+        self.assertEqual(FakeRestClient.logins, 1)
+        self.assertEqual(self.cache.get("qumulo", 8000, "admin"), "token-1")
+
+    def test_other_errors_of_the_cached_session_are_raised(self):
+        self.cache.put("qumulo", 8000, "admin", "cached")
+        with mock.patch.object(FakeRestClient, "who_am_i", side_effect=RequestError(500, "Internal")):
+            with self.assertRaises(RequestError):
+                Authentication.login_with_password("qumulo", 8000, "admin", "secret")
+        self.assertEqual(self.cache.get("qumulo", 8000, "admin"), "cached")
+
+    def test_is_auth_error(self):
+        self.assertTrue(Authentication.is_auth_error(RequestError(401, "Unauthorized")))
+        self.assertFalse(Authentication.is_auth_error(RequestError(403, "Forbidden")))
+        self.assertFalse(Authentication.is_auth_error(RequestError(500, "Internal")))
+        self.assertFalse(Authentication.is_auth_error(ConnectionError("refused")))
+
+    def test_call_with_relogin(self):
+        rc = FakeRestClient("qumulo", 8000)
+        configs = {"cluster": {"username": "admin", "password": "secret"}}
+        calls = []
+
+        def func():
+            calls.append(rc.credentials)
+            rc.who_am_i()
+            return "done"
+
+        self.assertEqual(Authentication.call_with_relogin(rc, func, configs=configs), "done")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.cache.get("qumulo", 8000, "admin"), "token-1")
+
+    def test_call_with_relogin_only_retries_auth_errors(self):
+        rc = FakeRestClient("qumulo", 8000)
+        func = mock.Mock(side_effect=ConnectionError("refused"))
+        with self.assertRaises(ConnectionError):
+            Authentication.call_with_relogin(rc, func, configs={"cluster": {"username": "a", "password": "b"}})
+        func.assert_called_once()
+        self.assertEqual(FakeRestClient.logins, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
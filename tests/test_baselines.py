@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_baselines.py
+#
+
+# Import Python system libraries
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+#  Import local Python libraries
+from utils.Baselines import BaselineCache, InfluxDBBaselines, build_query, flux_string, invalidate_cache
+from utils.History import DAY
+from utils.Stats import DirStats
+
+NOW = 1700000000
+AGES = [DAY, 7 * DAY]
+
+
+class TestFluxQuery(unittest.TestCase):
+
+    def test_flux_string(self):
+        self.assertEqual(flux_string("capacity"), '"capacity"')
+        self.assertEqual(flux_string('a"b'), '"a\\"b"')
+        self.assertEqual(flux_string("a\\b"), '"a\\\\b"')
+        self.assertEqual(flux_string("${bucket}"), '"\\${bucket}"')
+        self.assertEqual(flux_string("$5 {x}"), '"$5 {x}"')
+        self.assertEqual(flux_string('\\"'), '"\\\\\\""')
+
+    def test_build_query(self):
+        query = build_query("capacity", AGES)
+
+        # A sub-query per window, cut off a little before its age, and one for the known paths
+        self.assertIn('w86400 = from(bucket: "capacity")\n  |> range(start: -1209600s, stop: -77760s)\n', query)
+        self.assertIn('w604800 = from(bucket: "capacity")\n  |> range(start: -1209600s, stop: -544320s)\n', query)
+        self.assertIn('known = from(bucket: "capacity")\n  |> range(start: -1209600s, stop: now())\n', query)
+        self.assertEqual(query.count('r._measurement == "CapacityDetails" and '
+                                     '(r._field == "data_capacity" or r._field == "metadata_capacity")'), 3)
+        self.assertEqual(query.count("|> last()"), 3)
+        self.assertTrue(query.endswith("union(tables: [w86400, w604800, known])\n"))
+
+    def test_build_query_is_stable_and_escaped(self):
+        self.assertEqual(build_query("capacity", AGES), build_query("capacity", AGES))
+        self.assertIn('from(bucket: "my \\"bucket\\"")', build_query('my "bucket"', AGES))
+
+
+class TestBaselineCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, "baseline_cache.db")
+        self.cache = BaselineCache(self.cache_path, ttl=3600)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_expiry(self):
+        rows = [["/a/", "w86400", "data_capacity", 10]]
+        self.assertIsNone(self.cache.get("q", NOW))
+        self.cache.put("q", rows, NOW)
+        self.assertEqual(self.cache.get("q", NOW + 3599), rows)
+        self.assertIsNone(self.cache.get("q", NOW + 3600))
+        self.assertIsNone(self.cache.get("other", NOW))
+
+    def test_put_drops_expired_entries(self):
+        self.cache.put("old", [], NOW)
+        self.cache.put("new", [], NOW + 3600)
+        self.assertEqual(self.cache.db.execute("SELECT COUNT(*) FROM query_results").fetchone()[0], 1)
+
+    def test_invalidate(self):
+        self.cache.put("q", [], NOW)
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get("q", NOW))
+
+    def test_invalidate_cache_of_an_influxdb_source(self):
+        self.cache.put("q", [], NOW)
+        config = {"history": {"source": "sqlite", "cache_path": self.cache_path}}
+        invalidate_cache(config)
+        self.assertEqual(self.cache.get("q", NOW), [])
+
+        config["history"]["source"] = "influxdb"
+        invalidate_cache(config)
+        self.assertIsNone(self.cache.get("q", NOW))
+
+
+class TestInfluxDBBaselines(unittest.TestCase):
+
+    def test_baselines(self):
+        rows = [["/a/", "known", "data_capacity", 30], ["/a/", "known", "metadata_capacity", 3],
+                ["/a/", "w86400", "data_capacity", 20], ["/a/", "w86400", "metadata_capacity", 2],
+                ["/b/", "known", "data_capacity", 5],
+                ["/b/", "w604800", "data_capacity", 4]]
+        baselines = InfluxDBBaselines(rows, AGES)
+        self.assertEqual(baselines.baselines("/a/", NOW, AGES), [(None, 20, 2), None])
+
+        # A window without both fields is not a baseline, a path that no point has is new
+        self.assertEqual(baselines.baselines("/b/", NOW, AGES), [None, None])
+        self.assertIsNone(baselines.baselines("/c/", NOW, AGES))
+
+
+class FakeWriteApi(object):
+    def __init__(self):
+        self.payloads = []
+
+    def write(self, bucket, record, write_precision):
+        self.payloads.append(record)
+
+
+class TestSinkInvalidatesTheCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, "baseline_cache.db")
+        self.config = {"influxdb": {"bucket_name": "capacity"},
+                       "history": {"source": "influxdb", "cache_path": self.cache_path}}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_sink(self, paths):
+        # Imported here, the sink needs influxdb_client
+        from utils.InfluxDBSink import InfluxDBSink
+
+        sink = InfluxDBSink(self.config, write_api=FakeWriteApi())
+        sink.open()
+        for path in paths:
+            sink.write(DirStats(path, 2, 1, 1, 1, 0))
+        sink.close()
+
+    def test_a_write_empties_the_cache(self):
+        # The report of the previous cycle cached a result without /new/
+        query = build_query("capacity", AGES)
+        cache = BaselineCache(self.cache_path)
+        cache.put(query, [["/old/", "known", "data_capacity", 1]])
+
+        self.run_sink([])
+        self.assertIsNotNone(cache.get(query))
+
+        self.run_sink(["/new/"])
+        with mock.patch("utils.Baselines.query_rows", return_value=[["/new/", "known", "data_capacity", 1]]):
+            baselines = InfluxDBBaselines.load(self.config, AGES)
+        self.assertIsNotNone(baselines.baselines("/new/", NOW, AGES))
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_change_tracker.py
+#
+
+# Import Python system libraries
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+#  Import local Python libraries
+from utils.ChangeTracker import ChangeTracker
+from utils.Stats import DirStats
+
+NOW = 1700000000
+HEARTBEAT = 3600
+
+
+def stats(path, data, cluster=None):
+    return DirStats(path, data + 1, data, 1, 2, 3, cluster)
+
+
+class TestChangeTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.directory.name, "last_written.db")
+        self.tracker = ChangeTracker(self.state_path, HEARTBEAT)
+
+    def tearDown(self):
+        self.tracker.db.close()
+        self.directory.cleanup()
+
+    def test_unchanged_values_are_skipped(self):
+        self.assertTrue(self.tracker.should_write(stats("/a/", 10), NOW))
+        self.tracker.mark_written([stats("/a/", 10)], NOW)
+
+        self.assertFalse(self.tracker.should_write(stats("/a/", 10), NOW + 60))
+        self.assertTrue(self.tracker.should_write(stats("/a/", 11), NOW + 60))
+        self.assertEqual((self.tracker.changed, self.tracker.heartbeats, self.tracker.skipped), (2, 0, 1))
+
+    def test_clusters_are_tracked_apart(self):
+        self.tracker.mark_written([stats("/a/", 10, "c1")], NOW)
+        self.assertFalse(self.tracker.should_write(stats("/a/", 10, "c1"), NOW))
+        self.assertTrue(self.tracker.should_write(stats("/a/", 10, "c2"), NOW))
+
+    def test_heartbeat(self):
+        self.tracker.mark_written([stats("/a/", 10)], NOW)
+        self.assertFalse(self.tracker.should_write(stats("/a/", 10), NOW + HEARTBEAT - 1))
+        self.assertTrue(self.tracker.should_write(stats("/a/", 10), NOW + HEARTBEAT))
+        self.assertEqual(self.tracker.heartbeats, 1)
+
+        # The heartbeat write starts a new interval
+        self.tracker.mark_written([stats("/a/", 10)], NOW + HEARTBEAT)
+        self.assertFalse(self.tracker.should_write(stats("/a/", 10), NOW + 2 * HEARTBEAT - 1))
+
+    def test_state_outlives_the_tracker(self):
+        self.tracker.mark_written([stats("/a/", 10)], NOW)
+        self.tracker.close()
+        self.tracker = ChangeTracker(self.state_path, HEARTBEAT)
+        self.assertFalse(self.tracker.should_write(stats("/a/", 10), NOW + 60))
+
+
+class FailingWriteApi(object):
+    def __init__(self, failures):
+        self.failures = failures
+        self.payloads = []
+
+    def write(self, bucket, record, write_precision):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("refused")
+        self.payloads.append(record)
+
+
+class TestChangeOnlySink(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = {"influxdb": {
+            "bucket_name": "b", "batch_size": 2, "change_only": True,
+            "state_path": os.path.join(self.directory.name, "last_written.db"),
+            "spool": {"enabled": True, "path": os.path.join(self.directory.name, "spool"), "replay_wait": 0}}}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_sink(self, write_api, records):
+        # Imported here, the sink needs influxdb_client
+        from utils.InfluxDBSink import InfluxDBSink
+
+        # The spool of the failed run is replayed through a client of its own
+        replay = (mock.Mock(), FailingWriteApi(0))
+        with mock.patch("utils.InfluxDBSink.create_write_api", return_value=replay):
+            sink = InfluxDBSink(self.config, write_api=write_api)
+            sink.open()
+            for record in records:
+                sink.write(record)
+            sink.close()
+        return sink
+
+    def test_failed_write_is_not_marked_written(self):
+        records = [stats("/a/", 1), stats("/b/", 2), stats("/c/", 3)]
+
+        # The first batch fails and the rest of the run goes to the spool
+        sink = self.run_sink(FailingWriteApi(1), records)
+        self.assertEqual(sink.batcher.lines_spooled, 3)
+
+        # So the next run writes every row again
+        write_api = FailingWriteApi(0)
+        sink = self.run_sink(write_api, records)
+        self.assertEqual(sink.batcher.lines_written, 3)
+
+        # And now that they were accepted, a third run skips them
+        sink = self.run_sink(FailingWriteApi(0), records)
+        self.assertEqual(sink.batcher.lines_written, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
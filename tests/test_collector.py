@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_collector.py
+#
+
+# Import Python system libraries
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+#  Import local Python libraries
+from utils.Collector import Collector
+from utils.CrawlState import CrawlState
+
+Response = namedtuple("Response", ["data", "etag"])
+
+
+#
+# A RestClient stand-in that serves a tree of `width` subdirectories per
+# directory, `depth` levels deep. With a page_size, directory listings are
+# split into pages linked with paging.next, like the aggregates endpoint.
+
+
+class FakeTree(object):
+    def __init__(self, width, depth, page_size=None):
+        self.width = width
+        self.depth = depth
+        self.page_size = page_size
+        self.data = {}
+        self.requests = 0
+
+    def children(self, path):
+        if len([part for part in path.split("/") if part]) > self.depth:
+            return []
+        return [f"dir{index}" for index in range(self.width)]
+
+    def aggregate(self, path, after=0, paged=True):
+        entries = [{"name": name, "type": "FS_FILE_TYPE_DIRECTORY"} for name in self.children(path)]
+        entries.append({"name": "file", "type": "FS_FILE_TYPE_FILE"})
+        data = self.data.get(path, 1000)
+        dir_aggregate = {"path": path, "total_capacity": str(data + 10), "total_data": str(data),
+                         "total_meta": "10", "total_files": "1", "total_directories": str(len(entries) - 1)}
+        if not paged or self.page_size is None:
+            dir_aggregate["files"] = entries
+            return dir_aggregate
+
+        dir_aggregate["files"] = entries[after:after + self.page_size]
+        dir_aggregate["paging"] = {}
+        if after + self.page_size < len(entries):
+            dir_aggregate["paging"]["next"] = f"/v1/files/{path}/aggregates/?after={after + self.page_size}"
+        return dir_aggregate
+
+    def recursive(self, path, max_depth):
+        dir_aggregates = []
+        level = [path]
+        for depth in range(max_depth + 1):
+            dir_aggregates.extend(self.aggregate(current, paged=False) for current in level)
+            level = [current + name + "/" for current in level for name in self.children(current)]
+        return dir_aggregates
+
+
+class FakeFs(object):
+    def __init__(self, tree):
+        self.tree = tree
+
+    def read_dir_aggregates(self, path, recursive=False, max_depth=None):
+        self.tree.requests += 1
+        path = path if path.endswith("/") else path + "/"
+        if recursive:
+            return self.tree.recursive(path, max_depth)
+        return self.tree.aggregate(path)
+
+
+class FakeConnection(object):
+    def __init__(self, tree):
+        self.tree = tree
+
+    def send_request(self, method, uri):
+        self.tree.requests += 1
+        url = urlsplit(uri)
+        path = url.path[len("/v1/files/"):-len("aggregates/")]
+        return Response(self.tree.aggregate(path, int(parse_qs(url.query)["after"][0])), None)
+
+
+class FakeRestClient(object):
+    def __init__(self, tree):
+        self.tree = tree
+        self.fs = FakeFs(tree)
+        self.conninfo = FakeConnection(tree)
+
+    def clone(self):
+        return FakeRestClient(self.tree)
+
+
+def collect_paths(collector, roots):
+    return [dir_aggregate["path"]
+            for directory, dir_aggregates, elapsed in collector.collect(roots)
+            for dir_aggregate in dir_aggregates]
+
+
+class TestCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.directory.name, "crawl_state.db")
+
+        # Five subdirectories per directory, listed two entries per page
+        self.tree = FakeTree(width=5, depth=2, page_size=2)
+        self.rc = FakeRestClient(self.tree)
+        self.all_paths = [dir_aggregate["path"] for dir_aggregate in self.tree.recursive("/root/", 2)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_recursive_crawl(self):
+        collector = Collector(self.rc, max_depth=2)
+        self.assertEqual(collect_paths(collector, ["/root"]), self.all_paths)
+        self.assertEqual(self.tree.requests, 1)
+
+    def test_serial_crawl_keeps_the_root_order(self):
+        collector = Collector(self.rc, max_depth=0)
+        self.assertEqual(collect_paths(collector, ["/c", "/a", "/b"]), ["/c/", "/a/", "/b/"])
+
+    def test_threaded_crawl_reads_every_root(self):
+        roots = [f"/root{index}" for index in range(10)]
+        collector = Collector(self.rc, max_depth=1, max_workers=4)
+        paths = collect_paths(collector, roots)
+        self.assertEqual(len(paths), 10 * 6)
+        self.assertEqual(sorted(collector.latencies), sorted(roots))
+        self.assertEqual(self.tree.requests, 10)
+
+    def test_adaptive_crawl_follows_paging(self):
+        crawl_state = CrawlState(self.state_path)
+        collector = Collector(self.rc, max_depth=2, crawl_state=crawl_state)
+        self.assertEqual(sorted(collect_paths(collector, ["/root/"])), sorted(self.all_paths))
+        self.assertEqual(collector.requests, self.tree.requests)
+        crawl_state.close()
+
+    def test_threaded_adaptive_crawl_follows_paging(self):
+        crawl_state = CrawlState(self.state_path)
+        collector = Collector(self.rc, max_depth=2, max_workers=4, crawl_state=crawl_state)
+        self.assertEqual(sorted(collect_paths(collector, ["/root/", "/other/"])),
+                         sorted(self.all_paths + [path.replace("/root/", "/other/") for path in self.all_paths]))
+        crawl_state.close()
+
+    def test_adaptive_crawl_skips_stable_subtrees(self):
+        crawl_state = CrawlState(self.state_path)
+        collect_paths(Collector(self.rc, max_depth=2, crawl_state=crawl_state), ["/root/"])
+        crawl_state.close()
+
+        # Only the totals of /root/dir3/ moved
+        self.tree.data["/root/"] = 2000
+        self.tree.data["/root/dir3/"] = 2000
+        crawl_state = CrawlState(self.state_path)
+        paths = collect_paths(Collector(self.rc, max_depth=2, crawl_state=crawl_state), ["/root/"])
+        crawl_state.close()
+        self.assertEqual(sorted(paths), sorted(["/root/"] + [f"/root/dir{index}/" for index in range(5)]
+                                               + [f"/root/dir3/dir{index}/" for index in range(5)]))
+    def test_incomplete_run_does_not_update_the_crawl_state(self):
+        crawl_state = CrawlState(self.state_path)
+        collect_paths(Collector(self.rc, max_depth=2, crawl_state=crawl_state), ["/root/"])
+        crawl_state.close(complete=False)
+
+        # Nothing was kept, so the next run reads the whole tree again
+        crawl_state = CrawlState(self.state_path)
+        paths = collect_paths(Collector(self.rc, max_depth=2, crawl_state=crawl_state), ["/root/"])
+        crawl_state.close()
+        self.assertEqual(len(paths), len(self.all_paths))
+
+    def test_sharded_crawl_matches_the_recursive_crawl(self):
+        collector = Collector(self.rc, max_depth=2, shard_workers=3)
+        paths = collect_paths(collector, ["/root"])
+
+        # The root, then every subtree in path order, each breadth first
+        subtrees = sorted(self.all_paths[1:], key=lambda path: path.split("/")[2])
+        self.assertEqual(paths, ["/root/"] + subtrees)
+        # Three pages of the root listing and one recursive call per subtree
+        self.assertEqual(collector.requests, 3 + 5)
+
+    def test_sharded_adaptive_crawl(self):
+        crawl_state = CrawlState(self.state_path)
+        collector = Collector(self.rc, max_depth=2, crawl_state=crawl_state, shard_workers=3)
+        self.assertEqual(sorted(collect_paths(collector, ["/root/"])), sorted(self.all_paths))
+        crawl_state.close()
+
+    def test_shard_paths(self):
+        collector = Collector(self.rc, max_depth=2, shard_workers=3, shard_paths=["/other"])
+        self.assertEqual(collect_paths(collector, ["/root"]), self.all_paths)
+        self.assertEqual(collector.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
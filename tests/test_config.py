@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_config.py
+#
+
+# Import Python system libraries
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+#  Import local Python libraries
+from utils.ConfigFileParser import Config, ConfigFileParser, get_validator
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+
+
+class TestGetValidator(unittest.TestCase):
+
+    def test_same_schema_is_compiled_once(self):
+        schema_text = json.dumps({"type": "object", "required": ["a"]})
+        validator = get_validator(schema_text)
+        self.assertIs(get_validator(schema_text), validator)
+        self.assertIsNot(get_validator(json.dumps({"type": "object"})), validator)
+
+    def test_invalid_schema(self):
+        with self.assertRaises(Exception):
+            get_validator(json.dumps({"type": "no-such-type"}))
+
+
+class TestConfigReload(unittest.TestCase):
+
+    def setUp(self):
+        self.ticks = 0
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.directory.name, "config.json")
+        self.schema_path = os.path.join(self.directory.name, "config.schema.json")
+        shutil.copy(os.path.join(CONFIG_DIR, "config.schema.json"), self.schema_path)
+        with open(os.path.join(CONFIG_DIR, "config.json")) as config_file:
+            self.config = json.load(config_file)
+        self.write_config(self.config)
+
+        self.logger = mock.Mock()
+        self.parser = ConfigFileParser(self.config_path, self.logger)
+        self.parser.validate()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_config(self, config, text=None):
+        with open(self.config_path, "w") as config_file:
+            config_file.write(json.dumps(config) if text is None else text)
+        self.touch(self.config_path)
+
+    def touch(self, path):
+        # Move the modification time a second on, the test is faster than the file system clock
+        self.ticks += 1
+        mtime = os.stat(path).st_mtime_ns + self.ticks * 10 ** 9
+        os.utime(path, ns=(mtime, mtime))
+
+    def test_loaded_config(self):
+        configs = self.parser.get_configs()
+        self.assertIsInstance(configs, Config)
+        self.assertEqual(configs.path, self.config_path)
+        self.assertEqual(configs.dir_paths, [str(path) for path in self.config["directories"]["dir_paths"]])
+
+    def test_unchanged_file_is_not_read_again(self):
+        with mock.patch("builtins.open") as mocked_open:
+            self.assertIsNone(self.parser.reload())
+        mocked_open.assert_not_called()
+
+    def test_changed_file_is_reloaded(self):
+        self.config["directories"]["dir_paths"] = ["/reloaded"]
+        self.write_config(self.config)
+
+        configs = self.parser.reload()
+        self.assertEqual(configs.dir_paths, ["/reloaded"])
+        self.assertIs(self.parser.get_configs(), configs)
+        self.assertIsNone(self.parser.reload())
+
+    def test_invalid_file_keeps_the_previous_config(self):
+        previous = self.parser.get_configs()
+        self.write_config(None, "{broken")
+
+        self.assertIsNone(self.parser.reload())
+        self.assertIs(self.parser.get_configs(), previous)
+        self.logger.error.assert_called()
+
+        # It is not validated again until it changes once more
+        self.logger.error.reset_mock()
+        self.assertIsNone(self.parser.reload())
+        self.logger.error.assert_not_called()
+
+    def test_config_that_does_not_validate(self):
+        del self.config["directories"]
+        self.write_config(self.config)
+        self.assertIsNone(self.parser.reload())
+        self.assertIn("directories", self.parser.get_configs())
+
+    def test_changed_schema_is_reloaded(self):
+        self.touch(self.schema_path)
+        self.assertIsNotNone(self.parser.reload())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_daemon.py
+#
+
+# Import Python system libraries
+import random
+import unittest
+from unittest import mock
+
+#  Import local Python libraries
+from utils.ConfigFileParser import Config
+from utils.Daemon import Scheduler, run_daemon
+
+
+#
+# A clock that only moves when the scheduler waits or a cycle takes time, so the
+# cycles start at exact instants. The scheduler stops after `cycles` cycles.
+
+
+START = 1000.0
+
+
+class FakeClock(object):
+    def __init__(self, cycles):
+        self.now = START
+        self.cycles = cycles
+        self.starts = []
+        self.waits = []
+
+    def monotonic(self):
+        return self.now
+
+    def wait(self, delay):
+        self.waits.append(delay)
+        self.now += delay
+        return False
+
+    def is_set(self):
+        return len(self.starts) >= self.cycles
+
+
+def run_scheduler(scheduler, durations, cycle=None):
+    # Run one cycle per duration and return the start times, relative to the start of the daemon
+    clock = FakeClock(len(durations))
+    scheduler.stopped = clock
+
+    def timed_cycle():
+        clock.starts.append(clock.now)
+        if cycle is not None:
+            cycle(len(clock.starts))
+        clock.now += durations[len(clock.starts) - 1]
+
+    with mock.patch("utils.Daemon.time.monotonic", clock.monotonic), mock.patch("utils.Daemon.signal.signal"):
+        scheduler.run(timed_cycle)
+    return [start - START for start in clock.starts], clock
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_cycles_are_anchored_to_the_start(self):
+        starts, clock = run_scheduler(Scheduler(interval=10), [3, 4, 1, 9])
+        self.assertEqual(starts, [0, 10, 20, 30])
+
+    def test_slow_cycle_skips_the_missed_slots(self):
+        starts, clock = run_scheduler(Scheduler(interval=10), [25, 1, 1])
+        self.assertEqual(starts, [0, 30, 40])
+
+    def test_failing_cycle_does_not_stop_the_daemon(self):
+        def cycle(count):
+            if count == 1:
+                raise Exception("cluster unreachable")
+
+        logger = mock.Mock()
+        starts, clock = run_scheduler(Scheduler(interval=10, logger=logger), [1, 1], cycle)
+        self.assertEqual(starts, [0, 10])
+        logger.error.assert_called_once()
+
+    def test_jitter_stays_within_bounds(self):
+        random.seed(7)
+        starts, clock = run_scheduler(Scheduler(interval=60, jitter=5), [1] * 50)
+        offsets = [start - 60 * index for index, start in enumerate(starts)]
+        self.assertTrue(all(0 <= offset <= 5 for offset in offsets), offsets)
+        self.assertGreater(len(set(offsets)), 1)
+
+    def test_reschedule_applies_from_the_next_cycle(self):
+        scheduler = Scheduler(interval=10, logger=mock.Mock())
+
+        def cycle(count):
+            if count == 2:
+                scheduler.reschedule(30, 0)
+
+        starts, clock = run_scheduler(scheduler, [1, 1, 1, 1], cycle)
+        self.assertEqual(starts, [0, 10, 40, 70])
+
+    def test_reschedule_bounds_and_unchanged_settings(self):
+        logger = mock.Mock()
+        scheduler = Scheduler(interval=10, jitter=2, logger=logger)
+        scheduler.reschedule(10, 2)
+        logger.info.assert_not_called()
+
+        scheduler.reschedule(0, -5)
+        self.assertEqual((scheduler.interval, scheduler.jitter), (1, 0))
+        logger.info.assert_called_once()
+
+
+class FakeParser(object):
+    def __init__(self, configs):
+        # The configs returned by the reloads of the following cycles
+        self.configs = list(configs)
+
+    def reload(self):
+        return self.configs.pop(0) if self.configs else None
+
+
+class FakeScheduler(object):
+    def __init__(self, cycles):
+        self.cycles = cycles
+        self.settings = []
+
+    def run(self, cycle):
+        for count in range(self.cycles):
+            cycle()
+
+    def reschedule(self, interval, jitter):
+        self.settings.append((interval, jitter))
+
+
+def config(address, interval=60):
+    return Config({"influxdb": {"address": address}, "daemon": {"interval": interval}})
+
+
+class TestRunDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.args = mock.Mock(daemon=mock.Mock(interval=None, jitter=None))
+        self.clients = []
+        self.cycles = []
+
+    def create_write_api(self, configs):
+        client = mock.Mock(address=configs["influxdb"]["address"])
+        self.clients.append(client)
+        return client, mock.Mock(client=client)
+
+    def cycle(self, configs, write_api, telemetry):
+        self.cycles.append((configs["influxdb"]["address"], write_api.client.address, telemetry))
+
+    def test_reload_swaps_the_influxdb_client(self):
+        startup = mock.MagicMock()
+        parser = FakeParser([None, config("a", 120), config("b", 120)])
+        scheduler = FakeScheduler(3)
+
+        with mock.patch("utils.InfluxDBSink.create_write_api", self.create_write_api):
+            run_daemon(self.cycle, parser, scheduler, "Test", self.args, config("a"), startup,
+                       use_influxdb=lambda configs: True)
+
+        self.assertEqual([cycle[:2] for cycle in self.cycles], [("a", "a"), ("a", "a"), ("b", "b")])
+        self.assertEqual(scheduler.settings, [(120, 0), (120, 0)])
+
+        # The first cycle reports the startup telemetry, the others their own
+        self.assertIs(self.cycles[0][2], startup)
+        self.assertIsNot(self.cycles[1][2], startup)
+        startup.publish.assert_called_once()
+
+        # The client of "a" was closed when "b" replaced it, and "b" at the end
+        self.assertEqual(len(self.clients), 2)
+        self.clients[0].close.assert_called_once()
+        self.clients[1].close.assert_called_once()
+
+    def test_rejected_reload_keeps_the_configuration(self):
+        parser = FakeParser([config("b")])
+
+        with mock.patch("utils.InfluxDBSink.create_write_api", self.create_write_api):
+            run_daemon(self.cycle, parser, FakeScheduler(1), "Test", self.args, config("a"),
+                       on_reload=lambda configs: None, use_influxdb=lambda configs: True)
+
+        self.assertEqual(self.cycles[0][:2], ("a", "a"))
+        self.assertEqual(len(self.clients), 1)
+
+    def test_without_influxdb(self):
+        write_apis = []
+        run_daemon(lambda configs, write_api, telemetry: write_apis.append(write_api),
+                   FakeParser([]), FakeScheduler(2), "Test", self.args, config("a"))
+        self.assertEqual(write_apis, [None, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
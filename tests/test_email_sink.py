@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_email_sink.py
+#
+
+# Import Python system libraries
+import csv
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+#  Import local Python libraries
+from utils.EmailSink import ATTACHMENT_NAME, RANKINGS, EmailSink, Report, csv_header, get_routes, route_owner
+from utils.Stats import DirStats
+from utils.Trends import Trend
+
+GB = 10 ** 9
+
+
+def stats(path, data, metadata=100, cluster=None):
+    return DirStats(path, data + metadata, data, metadata, 1, 0, cluster)
+
+
+# changes - The (data changes, metadata changes) of the 1, 7 and 30 day windows
+def changes(data_changes, metadata_changes=(0, 0, 0)):
+    return list(data_changes), list(metadata_changes)
+
+
+def read_attachment(report):
+    (name, content), = report.attachments()
+    with io.TextIOWrapper(gzip.GzipFile(fileobj=io.BytesIO(content)), encoding="utf-8", newline="") as rows:
+        return name, list(csv.reader(rows))
+
+
+class TestReportAttachment(unittest.TestCase):
+
+    def test_every_row_is_attached(self):
+        # A tiny spool size moves the attachment to disk after a few rows
+        report = Report(max_rows=2, spool_size=64)
+        for index in range(50):
+            report.add(stats(f"/projects/p{index}/", index * GB), changes([index, None, None]))
+        report.finish()
+
+        name, rows = read_attachment(report)
+        self.assertEqual(name, ATTACHMENT_NAME)
+        self.assertEqual(rows[0], csv_header())
+        self.assertEqual(len(rows), 1 + 50)
+        self.assertEqual([row[0] for row in rows[1:]], [f"/projects/p{index}/" for index in range(50)])
+        self.assertEqual(rows[8], ["/projects/p7/", str(7 * GB), "100", "0", "7", "", "", "0", "0", "0"])
+
+        # Only the rankings are in the HTML, the attachment has every row
+        self.assertIn("/projects/p49/", report.html)
+        self.assertNotIn("/projects/p3/", report.html)
+
+    def test_new_directory_and_quoted_path(self):
+        report = Report()
+        report.add(stats('/home/a,b "c"/', 5 * GB, cluster="qumulo"), None)
+        report.add(stats("/home/d/", GB), changes([-GB, 2 * GB, None], [0, -10, None]))
+        report.finish()
+
+        name, rows = read_attachment(report)
+        self.assertEqual(rows[1:], [
+            ['qumulo:/home/a,b "c"/', str(5 * GB), "100", "1", "", "", "", "", "", ""],
+            ["/home/d/", str(GB), "100", "0", str(-GB), str(2 * GB), "", "0", "-10", ""],
+        ])
+
+    def test_trend_columns(self):
+        report = Report(trends=True)
+        trending = stats("/data/", 10 * GB)
+        trending.trend = Trend(1.5 * GB, 15.0, None)
+        report.add(trending, changes([GB, GB, GB]))
+        report.add(stats("/new/", GB), None)
+        report.finish()
+
+        name, rows = read_attachment(report)
+        self.assertEqual(rows[0][-3:], ["data_growth_per_day", "data_growth_rate", "days_to_threshold"])
+        self.assertEqual(rows[1][-3:], [str(1.5 * GB), "15.0", ""])
+        self.assertEqual(rows[2][-3:], ["", "", ""])
+
+    def test_no_attachment(self):
+        report = Report(attach_csv=False)
+        report.add(stats("/data/", GB), None)
+        report.finish()
+        self.assertEqual(report.attachments(), [])
+        self.assertNotIn(ATTACHMENT_NAME, report.html)
+
+
+
+
+class TestReportRankings(unittest.TestCase):
+
+    def ranked(self, report, title):
+        index = [ranking[0] for ranking in RANKINGS].index(title)
+        return [(score, row[0]) for score, row in report.rankings[index].items()]
+
+    def test_growth_and_shrink_are_ranked_apart(self):
+        report = Report(max_rows=2)
+        for path, change in [("/a/", 3), ("/b/", -5), ("/c/", 7), ("/d/", -1), ("/e/", 0), ("/f/", 3)]:
+            report.add(stats(path, 100 * GB), changes([change * GB, None, None]))
+
+        # Shrinks are ranked by their size, the tie between /a/ and /f/ keeps /a/
+        self.assertEqual(self.ranked(report, "Largest data growth"), [(7 * GB, "/c/"), (3 * GB, "/a/")])
+        self.assertEqual(self.ranked(report, "Largest data shrink"), [(5 * GB, "/b/"), (1 * GB, "/d/")])
+
+        report.finish()
+        self.assertIn("/c/", report.html)
+        self.assertNotIn("/f/", report.html)
+        self.assertIn("2 other directories: 1 grew by +3.0 GB, 1 did not change.", report.html)
+
+    def test_new_directory_ranks_by_its_size(self):
+        report = Report(max_rows=1)
+        report.add(stats("/old/", 100 * GB), changes([2 * GB, None, None]))
+        report.add(stats("/new/", 5 * GB), None)
+        self.assertEqual(self.ranked(report, "Largest data growth"), [(5 * GB, "/new/")])
+        self.assertEqual(self.ranked(report, "Fastest relative data growth")[0][1], "/old/")
+
+
+ROUTES = [
+    {"name": "engineering", "to": "eng@example.com", "prefixes": ["/projects"]},
+    {"name": "ml", "to": ["ml@example.com", "lead@example.com"], "prefixes": ["/projects/ml/", "/scratch/ml"]},
+    {"name": "home", "to": "it@example.com", "prefixes": ["/home/"]},
+]
+
+
+class TestRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.teams, self.prefixes = get_routes({"email": {"routes": ROUTES}})
+
+    def test_get_routes(self):
+        self.assertEqual(self.teams, {"engineering": "eng@example.com",
+                                      "ml": ["ml@example.com", "lead@example.com"],
+                                      "home": "it@example.com"})
+        self.assertEqual(self.prefixes, {"/projects/": "engineering", "/projects/ml/": "ml",
+                                         "/scratch/ml/": "ml", "/home/": "home"})
+
+    def test_nested_prefix_wins(self):
+        self.assertEqual(route_owner(self.prefixes, "/projects/ml/"), "ml")
+        self.assertEqual(route_owner(self.prefixes, "/projects/ml/models/v2/"), "ml")
+        self.assertEqual(route_owner(self.prefixes, "/projects/web/"), "engineering")
+        self.assertEqual(route_owner(self.prefixes, "/projects"), "engineering")
+
+    def test_prefixes_match_whole_path_components(self):
+        self.assertEqual(route_owner(self.prefixes, "/projects/mlops/"), "engineering")
+        self.assertIsNone(route_owner(self.prefixes, "/projects2/"))
+        self.assertIsNone(route_owner(self.prefixes, "/homes/a/"))
+        self.assertIsNone(route_owner(self.prefixes, "/scratch/"))
+
+    def test_unrouted(self):
+        self.assertIsNone(route_owner(self.prefixes, "/"))
+        self.assertIsNone(route_owner(self.prefixes, "/archive/2020/"))
+        self.assertIsNone(route_owner({}, "/projects/"))
+
+    def test_root_prefix_catches_the_rest(self):
+        teams, prefixes = get_routes({"email": {"routes": ROUTES + [{"name": "ops", "to": "ops@example.com",
+                                                                     "prefixes": ["/"]}]}})
+        self.assertEqual(route_owner(prefixes, "/archive/2020/"), "ops")
+        self.assertEqual(route_owner(prefixes, "/home/a/"), "home")
+
+
+class TestEmailSinkRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        config = {"email": {"routes": ROUTES},
+                  "history": {"db_path": os.path.join(self.directory.name, "history.db")}}
+        self.sink = EmailSink(config)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_team_reports(self):
+        self.sink.open()
+        for path in ("/projects/", "/projects/web/", "/projects/ml/", "/scratch/ml/a/", "/archive/", "/"):
+            self.sink.write(stats(path, GB))
+        self.sink.close()
+
+        # Every directory is in the main report, the unrouted ones only there
+        self.assertEqual(self.sink.main_report.rows, 6)
+        self.assertEqual({name: report.rows for name, report in self.sink.team_reports.items()},
+                         {"engineering": 2, "ml": 2})
+        ml = self.sink.team_reports["ml"]
+        self.assertEqual(ml.to, ["ml@example.com", "lead@example.com"])
+        name, rows = read_attachment(ml)
+        self.assertEqual([row[0] for row in rows[1:]], ["/projects/ml/", "/scratch/ml/a/"])
+        self.assertTrue(ml.html.startswith("<!DOCTYPE html>"))
+        self.assertIn("ml: 2 of 2 directories", ml.html)
+        self.assertEqual(self.sink.counters()["team_reports"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_history.py
+#
+
+# Import Python system libraries
+import os
+import tempfile
+import unittest
+
+#  Import local Python libraries
+from utils.History import HistoryStore, DAY, RAW_DAYS
+
+NOW = 1700000000
+AGES = [DAY, 7 * DAY, 30 * DAY]
+
+
+def row(path, data, metadata=1):
+    return (path, data + metadata, data, metadata, 1, 1)
+
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.history = HistoryStore(os.path.join(self.directory.name, "history.db"), retention_days=60)
+
+    def tearDown(self):
+        self.history.close()
+        self.directory.cleanup()
+
+    def test_new_path_has_no_baselines(self):
+        self.assertIsNone(self.history.baselines("/a/", NOW, AGES))
+
+    def test_current_run_does_not_count(self):
+        self.history.append(NOW, [row("/a/", 10)])
+        self.assertIsNone(self.history.baselines("/a/", NOW, AGES))
+
+    def test_baselines_pick_the_newest_snapshot_of_each_window(self):
+        for age, data in ((40 * DAY, 1), (8 * DAY, 2), (7 * DAY - 60, 3), (DAY, 4), (3600, 5)):
+            self.history.append(NOW - age, [row("/a/", data)])
+
+        baselines = self.history.baselines("/a/", NOW, AGES)
+        self.assertEqual([baseline[1] for baseline in baselines], [4, 3, 1])
+        self.assertEqual(baselines[0], (NOW - DAY, 4, 1))
+
+    def test_short_history_leaves_windows_empty(self):
+        self.history.append(NOW - 3600, [row("/a/", 5)])
+        self.assertEqual(self.history.baselines("/a/", NOW, AGES), [None, None, None])
+
+    def test_paths_do_not_mix(self):
+        self.history.append(NOW - DAY, [row("/a/", 1), row("/b/", 2)])
+        self.assertEqual(self.history.baselines("/b/", NOW, AGES)[0][1], 2)
+        self.assertIsNone(self.history.baselines("/c/", NOW, AGES))
+
+    def test_prune_and_discard(self):
+        self.history.append(NOW - 61 * DAY, [row("/a/", 1)])
+        self.history.append(NOW - DAY, [row("/a/", 2)])
+        self.history.append(NOW, [row("/a/", 3)])
+
+        self.history.prune(NOW)
+        self.history.discard(NOW)
+        timestamps = [timestamp for (timestamp,) in self.history.db.execute("SELECT timestamp FROM snapshots")]
+        self.assertEqual(timestamps, [NOW - DAY])
+
+    def test_prune_keeps_one_snapshot_per_path_and_day(self):
+        # A daemon run every six hours over ten days
+        start = NOW - NOW % DAY - 10 * DAY
+        for timestamp in range(start, NOW + 1, 6 * 3600):
+            self.history.append(timestamp, [row("/a/", timestamp), row("/b/", timestamp)])
+
+        self.history.prune(NOW)
+        timestamps = [timestamp for (timestamp,) in
+                      self.history.db.execute("SELECT timestamp FROM snapshots WHERE path = '/a/' ORDER BY timestamp")]
+        thinned_until = NOW - RAW_DAYS * DAY - (NOW - RAW_DAYS * DAY) % DAY
+        older = [timestamp for timestamp in timestamps if timestamp < thinned_until]
+        self.assertEqual(older, [day + DAY - 6 * 3600 for day in range(start, thinned_until, DAY)])
+        self.assertEqual(timestamps[len(older):], list(range(thinned_until, NOW + 1, 6 * 3600)))
+        self.assertEqual(self.history.db.execute("SELECT COUNT(*) FROM snapshots WHERE path = '/b/'").fetchone()[0],
+                         len(timestamps))
+
+        # The weekly baseline is the newest snapshot of its day
+        self.assertEqual(self.history.baselines("/a/", NOW, AGES)[1][0], thinned_until - 4 * DAY - 6 * 3600)
+
+        # A later prune only thins the days it did not see yet
+        self.history.append(start, [row("/a/", 0)])
+        self.history.prune(NOW)
+        self.assertEqual(self.history.db.execute("SELECT COUNT(*) FROM snapshots WHERE path = '/a/'").fetchone()[0],
+                         len(timestamps) + 1)
+
+    def test_window(self):
+        for age in (3 * DAY, 2 * DAY, DAY):
+            self.history.append(NOW - age, [row("/a/", age), row("/b/", 2 * age)])
+        self.history.append(NOW, [row("/a/", 0)])
+
+        rows = list(self.history.window(["/b/", "/a/"], NOW - 2 * DAY, NOW))
+        self.assertEqual(rows, [(0, NOW - 2 * DAY, 4 * DAY), (0, NOW - DAY, 2 * DAY),
+                                (1, NOW - 2 * DAY, 2 * DAY), (1, NOW - DAY, DAY)])
+
+    def test_series(self):
+        self.history.put_series([("/a/", NOW, b"a"), ("/b/", NOW - 61 * DAY, b"b")])
+        self.history.put_series([("/a/", NOW, b"aa")])
+        self.assertEqual(list(self.history.series(["/c/", "/b/", "/a/"])), [(1, b"b"), (2, b"aa")])
+
+        # Series that no run updated within the retention period go
+        self.history.prune(NOW)
+        self.assertEqual(list(self.history.series(["/a/", "/b/"])), [(0, b"aa")])
+
+    def test_discarded_runs(self):
+        self.history.discard(NOW - 61 * DAY)
+        self.history.discard(NOW - DAY)
+        self.history.discard(NOW - DAY)
+        self.assertEqual(self.history.discarded(NOW - 2 * DAY), [NOW - DAY])
+        self.history.prune(NOW)
+        self.assertEqual(self.history.discarded(0), [NOW - DAY])
+
+    def test_prune_uses_the_timestamp_index(self):
+        plan = self.history.db.execute("EXPLAIN QUERY PLAN DELETE FROM snapshots WHERE timestamp < 0").fetchall()
+        self.assertIn("snapshots_timestamp", plan[0][-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_line_protocol.py
+#
+
+# Import Python system libraries
+import unittest
+
+#  Import local Python libraries
+from utils.LineProtocol import encode_line, encode_typed_line, escape_tag
+
+
+class TestLineProtocol(unittest.TestCase):
+
+    def test_escape_tag(self):
+        self.assertEqual(escape_tag("a b,c=d"), "a\\ b\\,c\\=d")
+        self.assertEqual(escape_tag(42), "42")
+
+    def test_escape_tag_line_breaks(self):
+        # A directory name may hold a line break, which would split the row
+        self.assertEqual(escape_tag("/a\nb\r/"), "/a\\nb\\r/")
+        line = encode_line("m", {"path": "/x\ny/"}, {"f": 1}, 1)
+        self.assertEqual(line.splitlines(), [line])
+
+    def test_escape_tag_backslashes(self):
+        # A trailing backslash must not escape the comma or space after it
+        self.assertEqual(escape_tag("dir\\"), "dir\\\\")
+        self.assertEqual(escape_tag("a\\b"), "a\\\\b")
+        line = encode_line("m", {"cluster": "c", "path": "/x\\"}, {"f": 1}, 1)
+        self.assertEqual(line, "m,cluster=c,path=/x\\\\ f=1i 1")
+
+    def test_encode_line_escapes_tags_and_sorts_them(self):
+        line = encode_line("CapacityDetails", {"path": "/My Dir,x=1/", "cluster": "a"},
+                           {"data_capacity": 10, "metadata_capacity": 2.0}, 1700000000.7)
+        self.assertEqual(line, "CapacityDetails,cluster=a,path=/My\\ Dir\\,x\\=1/ "
+                               "data_capacity=10i,metadata_capacity=2i 1700000000")
+
+    def test_encode_line_escapes_measurement_and_field_keys(self):
+        line = encode_line("Capacity Details", {}, {"data size": 1}, 1)
+        self.assertEqual(line, "Capacity\\ Details data\\ size=1i 1")
+
+    def test_encode_typed_line(self):
+        line = encode_typed_line("m", {"path": "/a/"},
+                                 {"count": 3, "rate": 0.5, "ok": True, "note": 'say "hi" \\ bye'}, 5)
+        self.assertEqual(line, 'm,path=/a/ count=3i,rate=0.5,ok=true,note="say \\"hi\\" \\\\ bye" 5')
+
+
+if __name__ == "__main__":
+    unittest.main()
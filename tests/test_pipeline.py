@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_pipeline.py
+#
+
+# Import Python system libraries
+import os
+import tempfile
+import unittest
+
+#  Import local Python libraries
+from test_collector import FakeFs, FakeRestClient, FakeTree
+from utils.ConfigFileParser import Config
+from utils.Pipeline import run_clusters_pipeline
+from utils.Telemetry import RunTelemetry
+
+
+# An error like the RequestError of an expired session
+class SessionExpired(Exception):
+    pass
+
+
+# A cluster whose reads fail once `fail_after` of them went through
+class FailingFs(FakeFs):
+    def __init__(self, tree, fail_after, error):
+        super().__init__(tree)
+        self.fail_after = fail_after
+        self.error = error
+
+    def read_dir_aggregates(self, path, recursive=False, max_depth=None):
+        if self.fail_after is not None and self.tree.requests >= self.fail_after:
+            self.fail_after = None
+            raise self.error
+        return super().read_dir_aggregates(path, recursive, max_depth)
+
+
+def failing_client(tree, fail_after, error):
+    rc = FakeRestClient(tree)
+    rc.fs = FailingFs(tree, fail_after, error)
+    return rc
+
+
+class RecordingSink(object):
+    name = "recording"
+
+    def __init__(self):
+        self.paths = []
+        self.complete = None
+
+    def open(self):
+        pass
+
+    def write(self, stats):
+        self.paths.append((stats.cluster, stats.path))
+
+    def close(self, complete=True):
+        self.complete = complete
+
+
+# call stand-in that logs in again once on SessionExpired, like call_with_relogin
+def relogin_call(rc, config, crawl):
+    try:
+        return crawl()
+    except SessionExpired:
+        rc.relogins = getattr(rc, "relogins", 0) + 1
+        return crawl()
+
+
+class TestClustersPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.directory.name, "crawl_state.db")
+        self.config = Config({"directories": {"dir_paths": ["/a", "/b"], "max_depth": 1,
+                                              "adaptive": {"enabled": True, "state_path": self.state_path}}})
+        self.good_tree = FakeTree(width=2, depth=1)
+        self.bad_tree = FakeTree(width=2, depth=1)
+        self.sink = RecordingSink()
+        self.telemetry = RunTelemetry("test")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_clusters(self, targets, call=None):
+        return run_clusters_pipeline(None, targets, self.config, [self.sink], telemetry=self.telemetry, call=call)
+
+    def drilled(self):
+        # A new crawl of an unchanged tree only drills into what the last runs did not keep
+        tree = FakeTree(width=2, depth=1)
+        run_clusters_pipeline(None, [("good", FakeRestClient(tree), self.config),
+                                     ("bad", FakeRestClient(tree), self.config)],
+                              self.config, [RecordingSink()])
+        return tree.requests
+
+    def test_failing_cluster_does_not_stop_the_others(self):
+        targets = [("good", FakeRestClient(self.good_tree), self.config),
+                   ("bad", failing_client(self.bad_tree, 3, Exception("connection reset")), self.config)]
+        self.run_clusters(targets)
+
+        good_paths = [path for cluster, path in self.sink.paths if cluster == "good"]
+        self.assertEqual(sorted(good_paths), ["/a/", "/a/dir0/", "/a/dir1/", "/b/", "/b/dir0/", "/b/dir1/"])
+        self.assertTrue(self.sink.complete)
+        self.assertEqual(self.telemetry.failed_phases, ["collect_bad"])
+
+        # The totals of the good cluster were kept, those of the failed one were not:
+        # its roots are drilled into again and the good ones are skipped
+        self.assertEqual(self.drilled(), 2 + 2 * (1 + 2))
+
+    def test_every_cluster_failing_fails_the_run(self):
+        targets = [("bad", failing_client(self.bad_tree, 0, Exception("connection reset")), self.config),
+                   ("worse", failing_client(self.good_tree, 1, Exception("connection refused")), self.config)]
+        with self.assertRaises(Exception):
+            self.run_clusters(targets)
+        self.assertFalse(self.sink.complete)
+        self.assertEqual(sorted(self.telemetry.failed_phases), ["collect_bad", "collect_worse", "pipeline"])
+
+    def test_expired_session_is_renewed_per_cluster(self):
+        rc = failing_client(self.bad_tree, 0, SessionExpired())
+        targets = [("good", FakeRestClient(self.good_tree), self.config), ("bad", rc, self.config)]
+        self.run_clusters(targets, relogin_call)
+
+        self.assertEqual(rc.relogins, 1)
+        self.assertEqual(len(self.sink.paths), 2 * 6)
+        self.assertEqual(len(set(self.sink.paths)), 2 * 6)
+        self.assertEqual(self.telemetry.failed_phases, [])
+
+    def test_session_expiring_midway_fails_that_cluster_only(self):
+        # The first root of the cluster already reached the sinks when the session expires
+        rc = failing_client(self.bad_tree, 3, SessionExpired())
+        targets = [("good", FakeRestClient(self.good_tree), self.config), ("bad", rc, self.config)]
+        self.run_clusters(targets, relogin_call)
+
+        bad_paths = [path for cluster, path in self.sink.paths if cluster == "bad"]
+        self.assertEqual(sorted(bad_paths), ["/a/", "/a/dir0/", "/a/dir1/"])
+        self.assertEqual(self.telemetry.failed_phases, ["collect_bad"])
+
+
+if __name__ == "__main__":
+    unittest.main()
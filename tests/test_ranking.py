@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_ranking.py
+#
+
+# Import Python system libraries
+import random
+import unittest
+
+#  Import local Python libraries
+from utils.Ranking import TopK
+
+
+class TestTopK(unittest.TestCase):
+
+    def test_keeps_the_highest_scores(self):
+        ranking = TopK(3)
+        for score, item in [(5, "a"), (1, "b"), (9, "c"), (7, "d"), (3, "e")]:
+            ranking.push(score, item)
+        self.assertEqual(ranking.items(), [(9, "c"), (7, "d"), (5, "a")])
+        self.assertEqual(len(ranking), 3)
+        self.assertEqual(ranking.pushed, 5)
+
+    def test_evicts_the_lowest(self):
+        ranking = TopK(2)
+        ranking.push(1, "low")
+        ranking.push(2, "middle")
+        ranking.push(3, "high")
+        self.assertEqual(ranking.items(), [(3, "high"), (2, "middle")])
+        ranking.push(2.5, "upper")
+        self.assertEqual(ranking.items(), [(3, "high"), (2.5, "upper")])
+
+    def test_ties_keep_the_earlier_item(self):
+        ranking = TopK(2)
+        for item in ("first", "second", "third"):
+            ranking.push(4, item)
+        self.assertEqual(ranking.items(), [(4, "first"), (4, "second")])
+
+        # A tie with the lowest kept score does not evict it, a higher score does
+        ranking.push(4, "fourth")
+        self.assertEqual(ranking.items(), [(4, "first"), (4, "second")])
+        ranking.push(5, "fifth")
+        self.assertEqual(ranking.items(), [(5, "fifth"), (4, "first")])
+
+    def test_ties_of_unorderable_items(self):
+        ranking = TopK(2)
+        ranking.push(1, {"path": "/a/"})
+        ranking.push(1, {"path": "/b/"})
+        ranking.push(1, {"path": "/c/"})
+        self.assertEqual([item["path"] for score, item in ranking.items()], ["/a/", "/b/"])
+
+    def test_at_least_one(self):
+        ranking = TopK(0)
+        ranking.push(1, "a")
+        ranking.push(2, "b")
+        self.assertEqual(ranking.items(), [(2, "b")])
+
+    def test_matches_a_stable_sort(self):
+        generator = random.Random(7)
+        stream = [(generator.randint(0, 20), index) for index in range(1000)]
+        ranking = TopK(25)
+        for score, item in stream:
+            ranking.push(score, item)
+        self.assertEqual(ranking.items(), sorted(stream, key=lambda entry: -entry[0])[:25])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_spool.py
+#
+
+# Import Python system libraries
+import os
+import tempfile
+import time
+import unittest
+
+#  Import local Python libraries
+from utils.LineProtocol import LineProtocolBatcher
+from utils.Spool import Spool, QUARANTINE_DIR
+
+
+# An error like the ApiException of influxdb_client, with the HTTP status of the answer
+class WriteError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool = Spool(self.directory.name, replay_rate=0, replay_batch_bytes=1024 * 1024,
+                           replay_max_attempts=2)
+        self.written = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, payload):
+        if "bad" in payload:
+            raise WriteError(400)
+        self.written.append(payload)
+
+    def test_replay_in_order_and_remove(self):
+        for payload in ("a 1", "b 2", "c 3"):
+            self.spool.append(payload)
+
+        self.spool.replay(self.write)
+        self.assertEqual(self.written, ["a 1\nb 2\nc 3"])
+        self.assertEqual(self.spool.segments(), [])
+        self.assertEqual(self.spool.replayed, 3)
+
+    def test_small_batches(self):
+        self.spool.replay_batch_bytes = 1
+        for payload in ("a 1", "b 2"):
+            self.spool.append(payload)
+
+        self.spool.replay(self.write)
+        self.assertEqual(self.written, ["a 1", "b 2"])
+
+    def test_rejected_segment_does_not_block_the_others(self):
+        for payload in ("a 1", "bad", "c 3"):
+            self.spool.append(payload)
+
+        self.spool.replay(self.write)
+        self.assertEqual(self.written, ["a 1", "c 3"])
+        self.assertEqual(len(self.spool.segments()), 1)
+
+        # The second rejection moves the segment to quarantine
+        self.spool.replay(self.write)
+        self.assertEqual(self.spool.segments(), [])
+        self.assertEqual(self.spool.quarantined, 1)
+        quarantined = os.listdir(os.path.join(self.directory.name, QUARANTINE_DIR))
+        self.assertEqual(len(quarantined), 1)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), [QUARANTINE_DIR])
+
+    def test_unreachable_influxdb_keeps_every_segment(self):
+        for payload in ("a 1", "b 2"):
+            self.spool.append(payload)
+
+        def unreachable(payload):
+            raise ConnectionError("refused")
+
+        for attempt in range(3):
+            self.spool.replay(unreachable)
+        self.assertEqual(len(self.spool.segments()), 2)
+        self.assertEqual(self.spool.quarantined, 0)
+
+        self.spool.replay(self.write)
+        self.assertEqual(self.written, ["a 1\nb 2"])
+
+    def test_server_errors_are_not_rejections(self):
+        self.spool.append("a 1")
+
+        def overloaded(payload):
+            raise WriteError(503)
+
+        for attempt in range(3):
+            self.spool.replay(overloaded)
+        self.assertEqual(len(self.spool.segments()), 1)
+
+    def test_background_replay(self):
+        self.spool.append("a 1")
+        self.spool.start_replay(self.write)
+        self.spool.stop_replay()
+        self.assertEqual(self.written, ["a 1"])
+
+    def test_stop_replay_leaves_the_rest_to_the_next_run(self):
+        for index in range(5):
+            self.spool.append(f"a {index}")
+        spool = Spool(self.directory.name, replay_rate=0, replay_batch_bytes=1, replay_wait=0.1)
+
+        def slow_write(payload):
+            time.sleep(0.2)
+            self.written.append(payload)
+
+        start = time.monotonic()
+        spool.start_replay(slow_write)
+        spool.stop_replay()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.written, ["a 0"])
+        self.assertEqual(len(spool.segments()), 4)
+
+
+# A write API that fails the first write, then accepts the others
+class FailingWriteApi(object):
+    def __init__(self):
+        self.records = []
+
+    def write(self, bucket, record, write_precision):
+        if not self.records:
+            self.records.append(None)
+            raise WriteError(503)
+        self.records.append(record)
+
+
+class TestBatcherSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool = Spool(self.directory.name, replay_rate=0)
+        self.write_api = FailingWriteApi()
+        self.flushes = []
+        self.batcher = LineProtocolBatcher(self.write_api, "bucket", batch_size=2, spool=self.spool,
+                                           on_flush=self.flushes.append)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_spool_after_the_first_failure(self):
+        for index in range(5):
+            self.batcher.add(f"a {index}")
+        self.batcher.flush()
+
+        # Only the first write reached InfluxDB, the rest of the run went to the spool
+        self.assertEqual(self.write_api.records, [None])
+        self.assertTrue(self.batcher.failed)
+        self.assertEqual(self.batcher.lines_spooled, 5)
+        self.assertEqual(self.batcher.lines_written, 0)
+        self.assertEqual(self.flushes, [False, False, False])
+
+        written = []
+        self.spool.replay(written.append)
+        self.assertEqual(written, ["a 0\na 1\na 2\na 3\na 4"])
+
+    def test_no_spool_raises(self):
+        batcher = LineProtocolBatcher(FailingWriteApi(), "bucket", batch_size=1)
+        with self.assertRaises(WriteError):
+            batcher.add("a 0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_stats.py
+#
+
+# Import Python system libraries
+import unittest
+
+#  Import local Python libraries
+from utils.Stats import DirStats, StatsColumns
+
+
+def aggregate(path, data):
+    return {"path": path, "total_capacity": str(data + 1), "total_data": str(data), "total_meta": "1",
+            "total_files": "2", "total_directories": "3", "files": [{"name": "x"}]}
+
+
+class TestStatsColumns(unittest.TestCase):
+
+    def test_from_aggregates(self):
+        columns = StatsColumns.from_aggregates([aggregate("/a/", 10), aggregate("/a/b/", 20)], "c1")
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(list(columns.data), [10, 20])
+
+        stats = list(columns.stats())
+        self.assertEqual([(record.path, record.cluster, record.data) for record in stats],
+                         [("/a/", "c1", 10), ("/a/b/", "c1", 20)])
+        self.assertEqual(stats[0].as_row(), DirStats.from_aggregate(aggregate("/a/", 10), "c1").as_row())
+
+    def test_rows_of_several_clusters(self):
+        columns = StatsColumns()
+        columns.append(DirStats("/a/", 2, 1, 1, 0, 0))
+        columns.append(DirStats("/a/", 4, 3, 1, 0, 0, "c2"))
+        self.assertEqual(list(columns.rows()), [("/a/", 2, 1, 1, 0, 0), ("c2:/a/", 4, 3, 1, 0, 0)])
+
+        columns.clear()
+        self.assertEqual(len(columns), 0)
+        self.assertEqual(list(columns.rows()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
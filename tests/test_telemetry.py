@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_telemetry.py
+#
+
+# Import Python system libraries
+import threading
+import unittest
+from unittest import mock
+
+#  Import local Python libraries
+from utils.ConfigFileParser import Config
+from utils.Telemetry import RunTelemetry
+
+
+# A perf_counter that only moves when the test says so
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeWriteApi(object):
+    def __init__(self, error=None):
+        self.error = error
+        self.writes = []
+
+    def write(self, bucket, record, write_precision):
+        if self.error is not None:
+            raise self.error
+        self.writes.append((bucket, record, write_precision))
+
+
+class TestRunTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("utils.Telemetry.time.perf_counter", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.telemetry = RunTelemetry("InfluxDBPush")
+        self.telemetry.started = 1700000000.5
+
+    def test_phases_add_up(self):
+        for seconds in (1.5, 0.25):
+            with self.telemetry.phase("collect"):
+                self.clock.now += seconds
+        self.telemetry.add_time("collect", 0.25)
+        self.assertEqual(self.telemetry.seconds["collect"], 2.0)
+        self.assertEqual(self.telemetry.failed_phases, [])
+
+    def test_failed_phase_is_timed_and_named(self):
+        with self.assertRaises(ValueError):
+            with self.telemetry.phase("email"):
+                self.clock.now += 3
+                raise ValueError("no SMTP server")
+        self.telemetry.fail("influxdb_close")
+
+        fields = self.telemetry.fields()
+        self.assertEqual(fields["email_seconds"], 3.0)
+        self.assertEqual(fields["failures"], 2)
+        self.assertEqual(fields["failed_phases"], "email,influxdb_close")
+
+    def test_counters_from_several_threads(self):
+        def count():
+            for index in range(1000):
+                self.telemetry.count("paths")
+                self.telemetry.count("api_calls", 2)
+
+        threads = [threading.Thread(target=count) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.telemetry.counters["paths"], 4000)
+        self.assertEqual(self.telemetry.counters["api_calls"], 8000)
+
+    def test_encode(self):
+        with self.telemetry.phase("collect"):
+            self.clock.now += 1.25
+        self.telemetry.count("paths", 42)
+        self.clock.now += 0.75
+
+        with mock.patch("utils.Telemetry.platform.node", return_value="collector 1"):
+            line = self.telemetry.encode()
+        self.assertEqual(line, "DirectoryTrendsRun,entry=InfluxDBPush,host=collector\\ 1 "
+                               "collect_seconds=1.25,paths=42i,total_seconds=2.0,failures=0i 1700000000")
+
+    def test_encode_failed_phases(self):
+        self.telemetry.fail("pipeline")
+        self.telemetry.fail("influxdb_close")
+        with mock.patch("utils.Telemetry.platform.node", return_value="host"):
+            line = self.telemetry.encode()
+        self.assertEqual(line, 'DirectoryTrendsRun,entry=InfluxDBPush,host=host '
+                               'total_seconds=0.0,failures=2i,failed_phases="pipeline,influxdb_close" 1700000000')
+
+    def test_publish(self):
+        config = Config({"telemetry": {"enabled": True}, "influxdb": {"bucket_name": "capacity"}})
+        write_api = FakeWriteApi()
+        self.telemetry.publish(config, write_api)
+        self.assertEqual(len(write_api.writes), 1)
+        bucket, record, write_precision = write_api.writes[0]
+        self.assertEqual((bucket, write_precision), ("capacity", "s"))
+        self.assertTrue(record.startswith("DirectoryTrendsRun,entry=InfluxDBPush,"))
+
+    def test_publish_disabled(self):
+        write_api = FakeWriteApi()
+        self.telemetry.publish(Config({"influxdb": {"bucket_name": "capacity"}}), write_api)
+        self.assertEqual(write_api.writes, [])
+
+    def test_publish_never_fails_the_run(self):
+        config = Config({"telemetry": {"enabled": True}, "influxdb": {"bucket_name": "capacity"}})
+        logger = mock.Mock()
+        self.telemetry.logger = logger
+        self.telemetry.publish(config, FakeWriteApi(ConnectionError("refused")))
+        self.assertIn("refused", logger.warning.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
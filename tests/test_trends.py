@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# test_trends.py
+#
+
+# Import Python system libraries
+import os
+import tempfile
+import unittest
+
+#  Import local Python libraries
+from utils.History import HistoryStore, DAY
+from utils.Stats import DirStats
+from utils.Trends import TrendEngine, numpy
+
+GB = 10 ** 9
+NOW = 1700000000
+
+
+def stats(path, data):
+    return DirStats(path, data, data, 0, 1, 0)
+
+
+def row(path, data):
+    return (path, data, data, 0, 1, 0)
+
+
+@unittest.skipIf(numpy is None, "needs numpy")
+class TestTrendEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "history.db")
+        self.history = HistoryStore(self.db_path)
+
+    def tearDown(self):
+        self.history.close()
+        self.directory.cleanup()
+
+    def engine(self, until=NOW, threshold=None, window_days=30):
+        engine = TrendEngine(HistoryStore(self.db_path), window_days, threshold)
+        engine.until = until
+        return engine
+
+    def trends(self, current, until=NOW, threshold=None, window_days=30, complete=True):
+        engine = self.engine(until, threshold, window_days)
+        try:
+            return {stats.path: stats.trend for stats in engine.annotate(stats(path, data)
+                                                                         for path, data in current.items())}
+        finally:
+            engine.close(complete)
+
+    def daily(self, path, sizes):
+        # sizes are oldest first, the last one is a day before NOW
+        for age, data in zip(range(len(sizes), 0, -1), sizes):
+            self.history.append(NOW - age * DAY, [row(path, data)])
+
+    def test_hand_computed_slope(self):
+        # t = -3, -2, -1, 0 days and y = 10, 12, 11, 15 GB: the means are -1.5 and 12,
+        # the slope is sum((t - -1.5) * (y - 12)) / sum((t - -1.5) ** 2) = 7 / 5 = 1.4 GB a day.
+        # The days to the threshold are projected from the current size, not from the
+        # 12 + 1.5 * 1.4 = 14.1 GB where the line crosses t = 0.
+        self.daily("/a/", [10 * GB, 12 * GB, 11 * GB])
+        trend = self.trends({"/a/": 15 * GB}, threshold=20 * GB)["/a/"]
+        self.assertAlmostEqual(trend.slope, 1.4 * GB, delta=1)
+        self.assertAlmostEqual(trend.growth_rate, 100 * 1.4 / 15, places=3)
+        self.assertAlmostEqual(trend.days_to_threshold, (20 - 15) / 1.4, places=3)
+
+    def test_flat(self):
+        self.daily("/a/", [5 * GB] * 10)
+        trend = self.trends({"/a/": 5 * GB}, threshold=20 * GB)["/a/"]
+        self.assertEqual((trend.slope, trend.growth_rate, trend.days_to_threshold), (0.0, 0.0, None))
+
+    def test_shrinking(self):
+        self.daily("/a/", [10 * GB, 8 * GB, 6 * GB])
+        trend = self.trends({"/a/": 4 * GB}, threshold=20 * GB)["/a/"]
+        self.assertEqual(trend.slope, -2 * GB)
+        self.assertEqual(trend.growth_rate, -50.0)
+        self.assertIsNone(trend.days_to_threshold)
+
+    def test_single_point(self):
+        trend = self.trends({"/new/": 5 * GB}, threshold=1 * GB)["/new/"]
+        self.assertEqual((trend.slope, trend.growth_rate), (None, None))
+
+        # The directory is over the threshold even without a slope
+        self.assertEqual(trend.days_to_threshold, 0.0)
+
+    def test_history_of_a_few_hours_is_too_short(self):
+        self.history.append(NOW - 3 * 3600, [row("/a/", GB)])
+        trend = self.trends({"/a/": 2 * GB})["/a/"]
+        self.assertIsNone(trend.slope)
+
+    def test_threshold_already_crossed(self):
+        self.daily("/a/", [10 * GB, 20 * GB])
+        trend = self.trends({"/a/": 30 * GB}, threshold=25 * GB)["/a/"]
+        self.assertEqual(trend.slope, 10 * GB)
+        self.assertEqual(trend.days_to_threshold, 0.0)
+
+    def test_newest_snapshot_of_each_day(self):
+        # Every six hours over the last three days, the earlier ones of a day do not count
+        day_start = NOW - NOW % DAY
+        for day in (3, 2, 1):
+            for hour in (0, 6, 12, 18):
+                self.history.append(day_start - day * DAY + hour * 3600, [row("/a/", (10 - day) * GB + hour)])
+        # An earlier run of the same day is replaced by this one
+        self.history.append(day_start + 3600, [row("/a/", 100 * GB)])
+
+        trend = self.trends({"/a/": 10 * GB + 18}, until=day_start + 18 * 3600)["/a/"]
+        self.assertAlmostEqual(trend.slope, GB, delta=1)
+
+    def test_window(self):
+        self.history.append(NOW - 40 * DAY, [row("/a/", 0)])
+        self.daily("/a/", [GB, 2 * GB])
+        self.assertEqual(self.trends({"/a/": 3 * GB})["/a/"].slope, GB)
+        self.assertEqual(self.trends({"/a/": 3 * GB}, window_days=1)["/a/"].slope, GB)
+
+    def test_series_replace_the_snapshots(self):
+        self.daily("/a/", [GB, 2 * GB])
+        self.trends({"/a/": 3 * GB})
+
+        # The next run reads the series written by the first one
+        self.history.db.execute("DELETE FROM snapshots")
+        self.history.db.commit()
+        self.assertEqual(self.trends({"/a/": 4 * GB}, until=NOW + DAY)["/a/"].slope, GB)
+        points = self.history.db.execute("SELECT points FROM series WHERE path = '/a/'").fetchone()[0]
+        self.assertEqual(numpy.frombuffer(points, dtype="<i8").tolist(),
+                         [NOW - 2 * DAY, GB, NOW - DAY, 2 * GB, NOW, 3 * GB, NOW + DAY, 4 * GB])
+
+    def test_incomplete_run_is_left_out(self):
+        self.daily("/a/", [GB, 2 * GB])
+        self.trends({"/a/": 100 * GB}, complete=False)
+        self.assertEqual(self.trends({"/a/": 4 * GB}, until=NOW + DAY)["/a/"].slope, GB)
+
+
+if __name__ == "__main__":
+    unittest.main()
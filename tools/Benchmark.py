@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Benchmark.py
+#
+# Measures how InfluxDBPush.check_capacity and EmailPush.check_capacity scale,
+# without a cluster or an InfluxDB server. Every scenario serves a synthetic
+# tree from FakeQumulo and counts the writes in FakeInfluxDB. Each entry point
+# then runs in its own process, so that its peak RSS is not mixed up with the
+# servers or with the other runs. The report lists run latency percentiles,
+# directories per second, peak RSS and the calls made to both APIs per run.
+#
+#   python3 tools/Benchmark.py
+#   python3 tools/Benchmark.py --scenario wide asyncio --entry influxdb --repeat 10
+#
+
+# Import Python system libraries
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+
+from FakeInfluxDB import FakeInfluxDBServer
+from FakeQumulo import FakeQumuloServer, FakeTree
+
+ENTRIES = ("influxdb", "email")
+
+# roots      - number of directories in dir_paths
+# width      - subdirectories per directory
+# max_depth  - levels read below every root, the tree is exactly that deep
+# latency    - seconds the fake cluster adds to every request
+# directories, adaptive and asyncio are merged into the directories section
+SCENARIOS = {
+    "baseline": {"roots": 4, "width": 10, "max_depth": 2},
+    "threads": {"roots": 32, "width": 10, "max_depth": 2, "latency": 0.005,
+                "directories": {"max_workers": 8}},
+    "asyncio": {"roots": 32, "width": 10, "max_depth": 2, "latency": 0.005,
+                "directories": {"asyncio": {"enabled": True, "max_connections": 8}}},
+    "wide": {"roots": 4, "width": 100, "max_depth": 2,
+             "directories": {"max_workers": 4}},
+    "adaptive": {"roots": 8, "width": 10, "max_depth": 3, "latency": 0.001,
+                 "directories": {"max_workers": 4, "adaptive": {"enabled": True}}},
+}
+
+
+# percentile - Return the value below which a fraction of the sorted values fall
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# make_certificate - Create a self-signed certificate, the Qumulo client only talks HTTPS
+
+def make_certificate(directory):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    if shutil.which("openssl") is None:
+        sys.exit("openssl is needed to create the certificate of the fake cluster")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", keyfile,
+                    "-out", certfile, "-days", "1", "-subj", "/CN=localhost"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+# write_config - Write the config file of one scenario run
+
+def write_config(directory, scenario, qumulo_port):
+    directories = {
+        "dir_paths": [f"/root{index}" for index in range(scenario["roots"])],
+        "max_depth": scenario["max_depth"],
+    }
+    for key, value in scenario.get("directories", {}).items():
+        directories[key] = dict(value) if isinstance(value, dict) else value
+    if "adaptive" in directories:
+        directories["adaptive"]["state_path"] = os.path.join(directory, "crawl_state.db")
+
+    config = {
+        "cluster": {"address": "127.0.0.1", "port": str(qumulo_port), "username": "benchmark",
+                    "password": "benchmark", "access_token": ""},
+        "influxdb": {"address": "127.0.0.1", "token": "benchmark", "bucket_name": "benchmark",
+                     "org_name": "benchmark", "enable_gzip": True,
+                     "state_path": os.path.join(directory, "last_written.db")},
+        "email": {"from": "benchmark@localhost", "to": "benchmark@localhost", "login": "", "password": "",
+                  "server": "localhost", "port": 25, "use": "none"},
+        "directories": directories,
+        "history": {"db_path": os.path.join(directory, "history.db")},
+    }
+
+    config_path = os.path.join(directory, "config.json")
+    with open(config_path, "w") as config_file:
+        json.dump(config, config_file, indent=4)
+
+    # The entry points validate the config file against the schema next to it
+    shutil.copy(os.path.join(REPO_DIR, "config", "config.schema.json"), directory)
+    return config_path
+
+
+# run_entry - Run one entry point in a child process and return what it measured
+
+def run_entry(entry, config_path, qumulo_port, influxdb_url, repeat, verbose=False):
+    spec = {"entry": entry, "config_file": config_path, "qumulo_port": qumulo_port,
+            "influxdb_url": influxdb_url, "repeat": repeat}
+    child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+                           cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=None if verbose else subprocess.DEVNULL,
+                           check=True)
+    return json.loads(child.stdout.decode().strip().splitlines()[-1])
+
+
+# run_scenario - Serve the tree of a scenario and run every entry point against it
+
+def run_scenario(name, scenario, entries, repeat, certificate, verbose=False):
+    results = []
+    tree = FakeTree(width=scenario["width"], depth=scenario["max_depth"] + 1)
+
+    qumulo = FakeQumuloServer(tree, latency=scenario.get("latency", 0.0), token_required=True,
+                              certfile=certificate[0], keyfile=certificate[1]).start()
+    influxdb = FakeInfluxDBServer().start()
+    try:
+        for entry in entries:
+            with tempfile.TemporaryDirectory(prefix="directorytrends-benchmark-") as directory:
+                config_path = write_config(directory, scenario, qumulo.port)
+                qumulo.reset()
+                influxdb.reset()
+
+                measured = run_entry(entry, config_path, qumulo.port, influxdb.url, repeat, verbose)
+                durations = measured["durations"]
+
+                results.append({
+                    "scenario": name,
+                    "entry": entry,
+                    "runs": repeat,
+                    "directories": qumulo.aggregates_sent // repeat,
+                    "p50": percentile(durations, 0.5),
+                    "p95": percentile(durations, 0.95),
+                    "max": max(durations),
+                    "dirs_per_second": qumulo.aggregates_sent / sum(durations),
+                    "rss_mb": measured["max_rss_kb"] / 1024,
+                    "rss_growth_mb": (measured["max_rss_kb"] - measured["start_rss_kb"]) / 1024,
+                    "qumulo_calls": {endpoint: count / repeat for endpoint, count in qumulo.calls.items()},
+                    "qumulo_bytes": qumulo.bytes_sent / repeat,
+                    "influxdb_writes": influxdb.counters["requests"] / repeat,
+                    "influxdb_lines": influxdb.counters["lines"] / repeat,
+                    "influxdb_bytes": influxdb.counters["wire_bytes"] / repeat,
+                })
+    finally:
+        qumulo.stop()
+        influxdb.stop()
+
+    return results
+
+
+# print_results - Print one line per scenario and entry point
+
+def print_results(results):
+    header = (f'{"scenario":<10} {"entry":<8} {"dirs":>7} {"p50 s":>8} {"p95 s":>8} {"max s":>8} '
+              f'{"dirs/s":>9} {"rss MB":>7} {"+rss MB":>7} {"api/run":>8} {"writes":>7} {"lines":>7} '
+              f'{"KB/run":>8}')
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        api_calls = sum(count for endpoint, count in result["qumulo_calls"].items() if endpoint != "login")
+        print(f'{result["scenario"]:<10} {result["entry"]:<8} {result["directories"]:>7} '
+              f'{result["p50"]:>8.3f} {result["p95"]:>8.3f} {result["max"]:>8.3f} '
+              f'{result["dirs_per_second"]:>9.0f} {result["rss_mb"]:>7.1f} {result["rss_growth_mb"]:>7.1f} '
+              f'{api_calls:>8.0f} {result["influxdb_writes"]:>7.0f} {result["influxdb_lines"]:>7.0f} '
+              f'{result["influxdb_bytes"] / 1024:>8.1f}')
+
+
+# child_main - Run an entry point the requested number of times and print the measurements
+
+def child_main(spec):
+    sys.path.insert(0, REPO_DIR)
+
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+    from qumulo.rest_client import RestClient
+
+    import EmailPush
+    import InfluxDBPush
+
+    config_file = spec["config_file"]
+    args = argparse.Namespace(config_file=config_file, cluster=None, directories=None, daemon=None)
+
+    rc = RestClient("127.0.0.1", spec["qumulo_port"])
+    rc.login("benchmark", "benchmark")
+
+    client = InfluxDBClient(url=spec["influxdb_url"], token="benchmark", org="benchmark", enable_gzip=True)
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+
+    start_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    durations = []
+    try:
+        for run in range(spec["repeat"]):
+            start = time.monotonic()
+            if spec["entry"] == "influxdb":
+                InfluxDBPush.check_capacity(args, rc, write_api)
+            else:
+                EmailPush.check_capacity(args, rc)
+            durations.append(time.monotonic() - start)
+    finally:
+        write_api.close()
+        client.close()
+
+    print(json.dumps({"durations": durations, "start_rss_kb": start_rss_kb,
+                      "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DirectoryTrends entry points against fake servers")
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS),
+                        help="Scenarios to run, all of them by default")
+    parser.add_argument("--entry", nargs="+", choices=ENTRIES, default=list(ENTRIES),
+                        help="Entry points to run, both by default")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of every entry point per scenario")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the log of the entry points")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(json.loads(args.child))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="directorytrends-certificate-") as directory:
+        certificate = make_certificate(directory)
+        for name in args.scenario:
+            results.extend(run_scenario(name, SCENARIOS[name], args.entry, args.repeat, certificate, args.verbose))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# FakeInfluxDB.py
+#
+# A local stand-in for the InfluxDB v2 write endpoint. Every write is accepted
+# and only counted: requests, line protocol lines and bytes, before and after
+# gzip. It can be given a latency and told to fail writes, to exercise the
+# batching and the spool.
+#
+#   python3 tools/FakeInfluxDB.py --port 8086
+#
+
+# Import Python system libraries
+import argparse
+import gzip
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+#
+# FakeInfluxDBHandler Class
+#
+# Answers /api/v2/write, /health and /ping.
+
+
+class FakeInfluxDBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            return self.__reply(200, b'{"name":"influxdb","status":"pass"}')
+        if path == "/ping":
+            return self.__reply(204)
+        self.__reply(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+
+        if urlsplit(self.path).path != "/api/v2/write":
+            return self.__reply(404)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.take_failure():
+            return self.__reply(503, b'{"code":"unavailable","message":"fake failure"}')
+
+        payload = gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body
+        lines = sum(1 for line in payload.split(b"\n") if line.strip())
+        self.server.count(requests=1, lines=lines, wire_bytes=len(body), payload_bytes=len(payload))
+        self.__reply(204)
+
+    def __reply(self, status, payload=b""):
+        self.send_response(status)
+        if payload:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+
+#
+# FakeInfluxDBServer Class
+#
+# A threading HTTP server that counts the writes it receives. It can run in the
+# background of another script through start() and stop().
+
+
+class FakeInfluxDBServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address="127.0.0.1", port=0, latency=0.0):
+        super().__init__((address, port), FakeInfluxDBHandler)
+        self.latency = latency
+
+        # requests, lines, wire_bytes and payload_bytes of the accepted writes
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+        self.__failures = 0
+        self.__thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.port}"
+
+    # count - Add to the write counters
+
+    def count(self, **counts):
+        with self.lock:
+            self.counters.update(counts)
+
+    # reset - Clear the write counters
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+
+    # fail_next - Answer the next writes with 503
+
+    def fail_next(self, count=1):
+        with self.lock:
+            self.__failures += count
+
+    # take_failure - Check whether this write must fail
+
+    def take_failure(self):
+        with self.lock:
+            if self.__failures <= 0:
+                return False
+            self.__failures -= 1
+            self.counters["failed"] += 1
+            return True
+
+    # handle_error - Ignore the clients that hang up before the answer is sent
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    # start - Serve in a background thread
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name="fake-influxdb", daemon=True)
+        self.__thread.start()
+        return self
+
+    # stop - Stop serving and close the socket
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accept and count InfluxDB writes")
+    parser.add_argument("--address", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8086, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every write")
+    args = parser.parse_args()
+
+    server = FakeInfluxDBServer(args.address, args.port, args.latency)
+    print(f"Accepting writes on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(dict(server.counters))
+
+
+if __name__ == "__main__":
+    main()
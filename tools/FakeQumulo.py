@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# FakeQumulo.py
+#
+# A local stand-in for the Qumulo REST API, so that the collectors can be run
+# and measured without a cluster. Every path is a directory of a synthetic tree:
+# a directory that is less than --depth levels below / has --width
+# subdirectories named dir0, dir1, ... and every directory holds --files files
+# of --file-size bytes.
+#
+#   python3 tools/FakeQumulo.py --port 8000 --width 10 --depth 4
+#
+
+# Import Python system libraries
+import argparse
+import json
+import ssl
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+BLOCK_SIZE = 4096
+
+#
+# FakeTree Class
+#
+# The synthetic tree. The totals of a directory only depend on its depth, so
+# they are computed instead of stored and any tree size can be served.
+
+
+class FakeTree(object):
+    def __init__(self, width=10, depth=3, files=10, file_size=1048576, page_size=0):
+        self.width = width
+        self.depth = depth
+        self.files = files
+        self.file_size = file_size
+
+        # With a page size, the entries of an aggregates response are split
+        # into pages that are linked with paging.next
+        self.page_size = page_size
+
+        self.__ids = {}
+        self.__paths = {}
+        self.__lock = threading.Lock()
+
+    # normalize - Return the path with a trailing slash
+
+    @staticmethod
+    def normalize(path):
+        return path if path.endswith("/") else path + "/"
+
+    # id_of - Return the file id of a path, assigning one on first use
+
+    def id_of(self, path):
+        with self.__lock:
+            if path not in self.__ids:
+                file_id = str(len(self.__ids) + 2)
+                self.__ids[path] = file_id
+                self.__paths[file_id] = path
+            return self.__ids[path]
+
+    # path_of - Return the path of a file id handed out before
+
+    def path_of(self, file_id):
+        with self.__lock:
+            return self.__paths.get(file_id)
+
+    # levels - Return the depth of a path
+
+    @staticmethod
+    def levels(path):
+        return len([part for part in path.split("/") if part])
+
+    # children - Return the subdirectory names of a path
+
+    def children(self, path):
+        if self.levels(path) >= self.depth:
+            return []
+        return [f"dir{index}" for index in range(self.width)]
+
+    # totals - Return (directories, files, data, metadata) of the subtree of a path
+
+    def totals(self, path):
+        below = max(0, self.depth - self.levels(path))
+        directories = sum(self.width ** level for level in range(below + 1))
+        files = directories * self.files
+        data = files * self.file_size
+        metadata = (directories + files) * BLOCK_SIZE
+        return directories, files, data, metadata
+
+    # aggregate - Return the aggregates response of a path
+
+    def aggregate(self, path):
+        directories, files, data, metadata = self.totals(path)
+        entries = []
+        for name in self.children(path):
+            child_directories, child_files, child_data, child_metadata = self.totals(path + name + "/")
+            entries.append({
+                "name": name,
+                "type": "FS_FILE_TYPE_DIRECTORY",
+                "id": self.id_of(path + name + "/"),
+                "capacity_usage": str(child_data + child_metadata),
+                "data_usage": str(child_data),
+                "meta_usage": str(child_metadata),
+                "named_stream_data_usage": "0",
+                "num_files": str(child_files),
+                "num_directories": str(child_directories),
+                "num_symlinks": "0",
+                "num_other": "0",
+            })
+
+        return {
+            "path": path,
+            "id": self.id_of(path),
+            "total_capacity": str(data + metadata),
+            "total_data": str(data),
+            "total_named_stream_data": "0",
+            "total_meta": str(metadata),
+            "total_files": str(files),
+            "total_directories": str(directories - 1),
+            "total_symlinks": "0",
+            "total_other": "0",
+            "files": entries,
+        }
+
+    # recursive_aggregates - Return the aggregates of a path and its subdirectories, breadth first
+
+    def recursive_aggregates(self, path, max_depth=None):
+        result = []
+        level = [path]
+        depth = 0
+        while level:
+            next_level = []
+            for current in level:
+                result.append(self.aggregate(current))
+                if max_depth is None or depth < max_depth:
+                    next_level.extend(current + name + "/" for name in self.children(current))
+            level = next_level
+            depth += 1
+        return result
+
+
+#
+# FakeQumuloHandler Class
+#
+# Answers the REST calls that DirectoryTrends makes and counts them per endpoint.
+
+
+class FakeQumuloHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+
+        if urlsplit(self.path).path == "/v1/session/login":
+            self.__count("login")
+            return self.__reply(200, {"bearer_token": self.server.new_session()})
+        self.__reply(404, {"description": f"Unknown endpoint {self.path}"})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        tree = self.server.tree
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.token_required and not self.server.is_session(self.headers.get("Authorization", "")):
+            self.__count("unauthorized")
+            return self.__reply(401, {"description": "Need to log in first"})
+
+        if url.path == "/v1/session/who-am-i":
+            self.__count("who-am-i")
+            return self.__reply(200, {"id": "500", "name": "admin"})
+        if url.path == "/v1/cluster/settings":
+            self.__count("cluster-settings")
+            return self.__reply(200, {"cluster_name": self.server.cluster_name})
+        if not url.path.startswith("/v1/files/"):
+            return self.__reply(404, {"description": f"Unknown endpoint {url.path}"})
+
+        ref, _, endpoint = url.path[len("/v1/files/"):].partition("/")
+        ref = unquote(ref)
+        path = tree.normalize(ref) if ref.startswith("/") else tree.path_of(ref)
+        if path is None:
+            return self.__reply(404, {"description": f"Unknown file id {ref}"})
+
+        if endpoint == "info/attributes":
+            self.__count("attributes")
+            return self.__reply(200, {"path": path, "id": tree.id_of(path), "type": "FS_FILE_TYPE_DIRECTORY"})
+        if endpoint == "recursive-aggregates/":
+            max_depth = int(query["max-depth"][0]) if "max-depth" in query else None
+            dir_aggregates = tree.recursive_aggregates(path, max_depth)
+            self.__count("recursive-aggregates", len(dir_aggregates))
+            return self.__reply(200, dir_aggregates)
+        if endpoint == "aggregates/":
+            self.__count("aggregates", 0 if "after" in query else 1)
+            return self.__reply(200, self.__page(tree.aggregate(path), url.path, query))
+        self.__reply(404, {"description": f"Unknown endpoint {url.path}"})
+
+    def __page(self, aggregate, uri, query):
+        page_size = self.server.tree.page_size
+        if not page_size:
+            return aggregate
+
+        after = int(query.get("after", ["0"])[0])
+        entries = aggregate["files"]
+        aggregate["files"] = entries[after:after + page_size]
+        aggregate["paging"] = {}
+        if after + page_size < len(entries):
+            aggregate["paging"]["next"] = f"{uri}?after={after + page_size}"
+        return aggregate
+
+    def __count(self, endpoint, aggregates=0):
+        with self.server.lock:
+            self.server.calls[endpoint] += 1
+            self.server.aggregates_sent += aggregates
+
+    def __reply(self, status, body):
+        payload = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.server.lock:
+            self.server.bytes_sent += len(payload)
+
+
+#
+# FakeQumuloServer Class
+#
+# A threading HTTP server around a FakeTree. It can run in the background of
+# another script through start() and stop().
+
+
+class FakeQumuloServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tree, address="127.0.0.1", port=0, latency=0.0, cluster_name="fake",
+                 token_required=False, certfile=None, keyfile=None):
+        super().__init__((address, port), FakeQumuloHandler)
+        self.tree = tree
+        self.latency = latency
+        self.cluster_name = cluster_name
+        self.token_required = token_required
+
+        # Requests per endpoint, directory aggregates and bytes sent
+        self.calls = Counter()
+        self.aggregates_sent = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+        self.__sessions = set()
+
+        # The qumulo RestClient always talks HTTPS, the aiohttp collector can
+        # use either
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+        self.__thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    # handle_error - Ignore the clients that hang up before the answer is sent
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    # reset - Clear the counters
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.aggregates_sent = 0
+            self.bytes_sent = 0
+
+    # new_session - Return the bearer token of a new session
+
+    def new_session(self):
+        with self.lock:
+            bearer_token = f"fake-session-{self.calls['login']}"
+            self.__sessions.add(bearer_token)
+            return bearer_token
+
+    # is_session - Check the Authorization header of a request
+
+    def is_session(self, authorization):
+        with self.lock:
+            return authorization[len("Bearer "):] in self.__sessions
+
+    # expire_sessions - Make every bearer token handed out so far invalid
+
+    def expire_sessions(self):
+        with self.lock:
+            self.__sessions.clear()
+
+    # start - Serve in a background thread
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name="fake-qumulo", daemon=True)
+        self.__thread.start()
+        return self
+
+    # stop - Stop serving and close the socket
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Qumulo directory tree")
+    parser.add_argument("--address", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--width", type=int, default=10, help="Subdirectories per directory")
+    parser.add_argument("--depth", type=int, default=3, help="Levels of subdirectories below /")
+    parser.add_argument("--files", type=int, default=10, help="Files per directory")
+    parser.add_argument("--file-size", type=int, default=1048576, help="Bytes per file")
+    parser.add_argument("--page-size", type=int, default=0, help="Entries per aggregates page, 0 for no paging")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--token-required", action="store_true", help="Answer 401 until the client logs in")
+    parser.add_argument("--certfile", help="Serve HTTPS with this certificate")
+    parser.add_argument("--keyfile", help="Private key of the certificate")
+    args = parser.parse_args()
+
+    tree = FakeTree(args.width, args.depth, args.files, args.file_size, args.page_size)
+    server = FakeQumuloServer(tree, args.address, args.port, args.latency, token_required=args.token_required,
+                              certfile=args.certfile, keyfile=args.keyfile)
+    print(f"Serving a tree of width {args.width} and depth {args.depth} on {args.address}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(dict(server.calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# ImportBudget.py
+#
+# Checks that the scripts start fast. Every entry point is imported in a fresh
+# interpreter with -X importtime, and the check fails when the best of a few
+# imports takes longer than the budget of that entry point, or when it loads
+# the library of a sink or backend that it only needs later, if at all.
+#
+#   python3 tools/ImportBudget.py
+#   python3 tools/ImportBudget.py --scale 2 --runs 5
+#
+
+# Import Python system libraries
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds of cumulative import time allowed per entry point, and the
+# modules that must not be loaded by the import. influxdb_client imports numpy
+# itself when it is installed, so numpy is only kept out of the other two.
+BUDGETS = {
+    "DirectoryTrends": (400, ["influxdb_client", "dominate", "aiohttp", "numpy"]),
+    "InfluxDBPush": (800, ["dominate", "aiohttp"]),
+    "EmailPush": (450, ["influxdb_client", "aiohttp", "numpy"]),
+}
+
+
+# import_time - Return the cumulative import time of a module in milliseconds
+
+def import_time(module):
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                           cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    for line in child.stderr.decode().splitlines():
+        if line.startswith("import time:") and line.split("|")[-1].strip() == module:
+            return int(line.split("|")[1]) / 1000
+    raise Exception(f"No import time was reported for {module}")
+
+
+# loaded_modules - Return the top-level modules loaded by importing a module
+
+def loaded_modules(module):
+    child = subprocess.run([sys.executable, "-c",
+                            f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"],
+                           cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return {name.split(".")[0] for name in json.loads(child.stdout.decode().splitlines()[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time budget of the DirectoryTrends scripts")
+    parser.add_argument("--runs", type=int, default=3, help="Imports per entry point, the fastest one counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the budgets, e.g. on a slow machine")
+    args = parser.parse_args()
+
+    failures = []
+    print(f'{"entry point":<16} {"best ms":>8} {"budget ms":>10}  unwanted modules')
+    for module, (budget, unwanted) in BUDGETS.items():
+        best = min(import_time(module) for run in range(args.runs))
+        loaded = sorted(loaded_modules(module).intersection(unwanted))
+        budget = budget * args.scale
+
+        print(f'{module:<16} {best:>8.1f} {budget:>10.0f}  {", ".join(loaded) or "-"}')
+        if best > budget:
+            failures.append(f"{module} took {best:.1f} ms to import, the budget is {budget:.0f} ms")
+        if loaded:
+            failures.append(f"{module} loads {', '.join(loaded)} at import")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,15 +36,26 @@ progname = "DirectoryTrends"
 progdesc = "Qumulo DirectoryTrends - Show the capacity changes of the defined directories daily and weekly basis."
 progvers = "6.1.0"
 
+# The outputs that DirectoryTrends.py can feed
+SINK_NAMES = ["influxdb", "email"]
+
 # Start by getting any command line arguments
 def parse_args(parser, commands):
     # Divide argv by commands
+    # "email" is both a sub-command and a value of --sinks, so the names that
+    # directly follow --sinks stay with it, unless the name was already given
     split_argv = [[]]
+    sinks = None
     for c in sys.argv[1:]:
-        if c in commands.choices:
+        if sinks is not None and c in SINK_NAMES and c not in sinks:
+            split_argv[-1].append(c)
+            sinks.append(c)
+        elif c in commands.choices:
             split_argv.append([c])
+            sinks = None
         else:
             split_argv[-1].append(c)
+            sinks = [] if c in ("-s", "--sinks") else None
     # Initialize namespace
     args = argparse.Namespace()
     for c in commands.choices:
@@ -84,6 +95,15 @@ def main():
             default = "",
             help="The configuration file which has the definitions of how to run this script"
         )
+        parser.add_argument(
+            "-s",
+            "--sinks",
+            dest="sinks",
+            nargs="+",
+            default=None,
+            choices=SINK_NAMES,
+            help="The outputs that DirectoryTrends.py feeds from one collection"
+        )
 
 
 
@@ -105,6 +125,12 @@ def main():
             default=0,
             help="Maximum depth",
         )
+        smb_parser.add_argument(
+            "--max-workers",
+            dest="max_workers",
+            default=None,
+            help="Number of directories to collect in parallel",
+        )
 
         # Create a subcommand parser for the "cluster" subcommand
         src_parser = commands.add_parser("cluster", help="Qumulo cluster details")
@@ -186,6 +212,22 @@ def main():
             help="SMTP server TLS, SSL, none",
         )
 
+        # Create a subcommand parser for the "daemon" subcommand
+        daemon_parser = commands.add_parser(
+            "daemon", help="Keep running and collect on a fixed interval"
+        )
+        daemon_parser.add_argument(
+            "--interval",
+            dest="interval",
+            default=None,
+            help="Seconds between two collections",
+        )
+        daemon_parser.add_argument(
+            "--jitter",
+            dest="jitter",
+            default=None,
+            help="Maximum random delay in seconds added to every collection",
+        )
 
         args = parse_args(parser, commands)
         
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# AsyncCollector.py
+#
+
+# Import Python system libraries
+import asyncio
+import queue
+import threading
+import time
+
+#  Import local Python libraries
+from utils.Collector import Collector, drill_children, log_latency_summary, shard_children
+
+#  Qumulo Python libraries
+from qumulo.lib.request import RequestError
+from qumulo.rest.fs import build_files_uri
+
+# aiohttp is only needed by the asyncio backend
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DEFAULT_SCHEME = "https"
+DEFAULT_MAX_CONNECTIONS = 16
+DEFAULT_MAX_IN_FLIGHT = 256
+DEFAULT_TIMEOUT = 600
+
+#
+# AsyncCollector Class
+#
+# This class reads the same aggregates endpoints as the Collector class, but
+# from one event loop thread over a pool of keep-alive connections, so hundreds
+# of roots, or every directory of a level in adaptive mode, can be in flight at
+# once without a thread per request. Pages that an endpoint links with
+# paging.next are followed while the other requests keep running. Each root is
+# handed back as soon as it finishes, and at most max_in_flight roots are held
+# at a time. The subtrees of a sharded root are read concurrently, as in
+# Collector, and put back together in path order.
+
+
+class AsyncCollector(object):
+    def __init__(self, base_url, bearer_token=None, max_depth=0, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, timeout=DEFAULT_TIMEOUT, logger=None, crawl_state=None,
+                 cluster=None, shard=False, shard_paths=None):
+
+        # Address of the REST API, e.g. https://cluster:8000
+        self.base_url = base_url.rstrip("/")
+        self.bearer_token = bearer_token
+
+        self.max_depth = max_depth
+        self.max_connections = max(1, int(max_connections))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.timeout = timeout
+
+        # Store the logger..
+        self.logger = logger
+
+        # Per-root latencies of the last collection, in seconds, and the number
+        # of HTTP requests it sent
+        self.latencies = {}
+        self.requests = 0
+
+        self.crawl_state = crawl_state
+        self.cluster = cluster
+
+        # With shard, the roots in shard_paths, or every root when it is None,
+        # are crawled one subdirectory per request
+        self.shard = shard
+        self.shard_paths = None if shard_paths is None else set(shard_paths)
+
+        self.__session = None
+        self.__in_flight = None
+
+    # from_client - Build the collector from the address and session of a RestClient
+
+    @staticmethod
+    def from_client(rc, config, logger=None, crawl_state=None, cluster=None):
+        if aiohttp is None:
+            if logger is not None:
+                logger.warning("The asyncio backend needs aiohttp, falling back to threads. "
+                               "Please run the following command: pip3 install aiohttp")
+            return None
+
+        settings = config["directories"].get("asyncio", {})
+        base_url = f'{settings.get("scheme", DEFAULT_SCHEME)}://{rc.conninfo.host}:{rc.conninfo.port}'
+        bearer_token = rc.credentials.bearer_token if rc.credentials is not None else None
+        shard_workers, shard_paths = Collector.get_shard(config)
+
+        return AsyncCollector(base_url, bearer_token,
+                              max_depth=config.max_depth,
+                              max_connections=settings.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+                              max_in_flight=settings.get("max_in_flight", DEFAULT_MAX_IN_FLIGHT),
+                              timeout=settings.get("timeout", DEFAULT_TIMEOUT),
+                              logger=logger, crawl_state=crawl_state, cluster=cluster,
+                              shard=shard_workers > 0, shard_paths=shard_paths)
+
+    # collect - Read the aggregates of every directory and yield them as they complete
+
+    def collect(self, directories):
+
+        # Yields (directory, aggregates, elapsed) tuples in completion order,
+        # like Collector.collect. The event loop runs in its own thread and at
+        # most max_in_flight roots are being read or waiting for the caller.
+
+        self.latencies = {}
+        self.requests = 0
+
+        results = queue.Queue()
+        stopped = threading.Event()
+        done = object()
+        loop = asyncio.new_event_loop()
+
+        def put(item):
+            if stopped.is_set():
+                return False
+            results.put(item)
+            return True
+
+        main = loop.create_task(self.__collect_all(directories, put))
+
+        def run():
+            try:
+                loop.run_until_complete(main)
+            except asyncio.CancelledError:
+                return
+            except Exception as err:
+                put(err)
+                return
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            put(done)
+
+        thread = threading.Thread(target=run, name="collect-asyncio", daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                items = [results.get()]
+                if items[0] is done:
+                    break
+                if isinstance(items[0], Exception):
+                    raise items[0]
+                # Popped, so the generator does not keep the root alive while the caller uses it
+                yield items.pop()
+
+                # The root is handled, let the loop start another one
+                item = None
+                loop.call_soon_threadsafe(self.__in_flight.release)
+        finally:
+            stopped.set()
+            loop.call_soon_threadsafe(main.cancel)
+            thread.join()
+            loop.close()
+
+        log_latency_summary(self.logger, self.latencies, f"{self.max_connections} connection(s)")
+
+    async def __collect_all(self, directories, put):
+        headers = {}
+        if self.bearer_token:
+            headers["Authorization"] = f"Bearer {self.bearer_token}"
+
+        # Clusters usually present a self-signed certificate. As with the
+        # qumulo RestClient, the certificate is not verified.
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ssl=False)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        self.__in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+            self.__session = session
+            tasks = [asyncio.ensure_future(self.__read_root(directory, put)) for directory in directories]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                self.__session = None
+
+    async def __read_root(self, directory, put):
+        # The slot is released by the caller once it is done with the root
+        await self.__in_flight.acquire()
+        try:
+            start = time.monotonic()
+            if self.shard and self.max_depth > 0 and (self.shard_paths is None or directory in self.shard_paths):
+                dir_aggregates = await self.__read_shards(directory)
+            else:
+                dir_aggregates = await self.__read_tree(directory, self.max_depth)
+            elapsed = time.monotonic() - start
+        except BaseException:
+            self.__in_flight.release()
+            raise
+
+        self.latencies[directory] = elapsed
+        if self.logger is not None:
+            self.logger.debug(f"Aggregates of {directory} were read in {elapsed:.3f}s")
+
+        if not put((directory, dir_aggregates, elapsed)):
+            raise asyncio.CancelledError()
+
+    async def __read_tree(self, directory, max_depth):
+        if self.crawl_state is not None:
+            return await self.__crawl_adaptive(directory, max_depth)
+        return await self.__read_dir_aggregates(directory, recursive=True, max_depth=max_depth)
+
+    async def __read_shards(self, directory):
+        # Same as Collector.__read_shards, with the subtrees read concurrently
+        root_aggregate = await self.__read_dir_aggregates(directory)
+        children = shard_children(root_aggregate, self.crawl_state, self.cluster)
+        shards = await asyncio.gather(*[self.__read_tree(child, self.max_depth - 1) for child in children])
+
+        dir_aggregates = [root_aggregate]
+        for shard_aggregates in shards:
+            dir_aggregates.extend(shard_aggregates)
+        return dir_aggregates
+
+    async def __crawl_adaptive(self, directory, max_depth):
+        # Same as Collector.__crawl_adaptive, but every directory of a level is
+        # read concurrently
+        dir_aggregates = []
+        level = [directory]
+
+        for depth in range(max_depth + 1):
+            if not level:
+                break
+            level_aggregates = await asyncio.gather(*[self.__read_dir_aggregates(path) for path in level])
+            dir_aggregates.extend(level_aggregates)
+
+            if depth == max_depth:
+                break
+            level = [child for dir_aggregate in level_aggregates
+                     for child in drill_children(self.crawl_state, dir_aggregate, self.cluster)]
+
+        return dir_aggregates
+
+    async def __read_dir_aggregates(self, path, recursive=False, max_depth=None):
+        uri = build_files_uri([path, "recursive-aggregates" if recursive else "aggregates"]).append_slash()
+        if max_depth is not None:
+            uri.add_query_param("max-depth", max_depth)
+
+        result = await self.__get(str(uri))
+
+        # Follow the paging links and merge the entries of every page
+        while isinstance(result, dict) and result.get("paging", {}).get("next"):
+            page = await self.__get(result["paging"]["next"])
+            result["files"].extend(page.get("files", []))
+            result["paging"] = page.get("paging", {})
+
+        return result
+
+    async def __get(self, uri):
+        self.requests += 1
+        async with self.__session.get(self.base_url + uri) as response:
+            if response.status >= 300:
+                # Raise the same error as the RestClient, so that an expired
+                # session is handled by Authentication.call_with_relogin
+                try:
+                    json_error = await response.json(content_type=None)
+                except ValueError:
+                    json_error = None
+                raise RequestError(response.status, response.reason,
+                                   json_error if isinstance(json_error, dict) else None)
+            return await response.json(content_type=None)
@@ -30,6 +30,7 @@ import sys
 
 #  Import local Python libraries
 from utils.Logger import Logger
+from utils.SessionCache import SessionCache
 
 logger = Logger()
 
@@ -47,13 +48,37 @@ except ImportError as error:
 
 
 
+session_cache = SessionCache(logger=logger)
+
+
+def login_with_password(address, port, username, password):
+    # Reuse the cached bearer token of this cluster user while the cluster accepts it
+    bearer_token = session_cache.get(address, port, username)
+    if bearer_token:
+        rc = RestClient(address, port, Credentials(bearer_token))
+        try:
+            rc.auth.who_am_i()
+            logger.debug(f"Reusing the cached session of {username} on {address}")
+            return rc
+        except qumulo.lib.request.RequestError as err:
+            if not is_auth_error(err):
+                raise
+            logger.debug(f"The cached session of {username} on {address} expired")
+            session_cache.remove(address, port, username)
+
+    rc = RestClient(address, port)
+    rc.login(username, password)
+    session_cache.put(address, port, username, rc.credentials.bearer_token)
+    return rc
+
+
 def login_with_args(args):
     #  Qumulo cluster login
     if args.cluster:
         if args.cluster.access_token:
             try: 
                 rc = RestClient(
-                    args.cluster.address, cluster.port, Credentials(args.cluster.access_token)
+                    args.cluster.address, args.cluster.cluster_port, Credentials(args.cluster.access_token)
                 )
                 logger.info(f"Connection established with {args.cluster.address}")
             except:
@@ -61,8 +86,8 @@ def login_with_args(args):
                 sys.exit(1)
         elif args.cluster.username and args.cluster.password:
             try:
-                rc = RestClient(args.cluster.address, cluster.port)
-                rc.login(args.cluster.username, args.cluster.password)
+                rc = login_with_password(args.cluster.address, args.cluster.cluster_port,
+                                         args.cluster.username, args.cluster.password)
                 logger.info(f"Connection established with {args.cluster.address}")
             except qumulo.lib.request.RequestError as err:
                 logger.error(f'{err}')
@@ -78,6 +103,9 @@ def login_with_args(args):
 
 def login_with_configs(configs):
     # Qumulo cluster login
+    if 'cluster' not in configs:
+        logger.error(f'A "clusters" list in the config file is only supported by DirectoryTrends.py')
+        sys.exit(1)
     if configs['cluster']['address']:
         if configs['cluster']['access_token']:
             try: 
@@ -90,8 +118,8 @@ def login_with_configs(configs):
                 sys.exit(1)
         elif configs['cluster']['username'] and configs['cluster']['password']:
             try:
-                rc = RestClient(configs['cluster']['address'], configs['cluster']['port'])
-                rc.login(configs['cluster']['username'], configs['cluster']['password'])
+                rc = login_with_password(configs['cluster']['address'], configs['cluster']['port'],
+                                         configs['cluster']['username'], configs['cluster']['password'])
                 logger.info(f"Connection established with {configs['cluster']['address']}")
             except qumulo.lib.request.RequestError as err:
                 logger.error(f'{err}')
@@ -103,3 +131,36 @@ def login_with_configs(configs):
             logger.error(f"Connection issue with {configs['cluster']['address']}")
             sys.exit(1)
     return rc
+
+
+def is_auth_error(err):
+    # The cluster answers 401 once a bearer token has expired
+    return isinstance(err, qumulo.lib.request.RequestError) and err.status_code == 401
+
+
+def relogin(rc, args=None, configs=None):
+    # Log in again on an existing RestClient, keeping its connection
+    if args is not None and args.cluster:
+        username, password = args.cluster.username, args.cluster.password
+    else:
+        username, password = configs['cluster']['username'], configs['cluster']['password']
+
+    if not (username and password):
+        logger.error(f'The session expired and an access token cannot be renewed')
+        raise Exception('Session expired')
+
+    rc.login(username, password)
+    session_cache.put(rc.conninfo.host, rc.conninfo.port, username, rc.credentials.bearer_token)
+    logger.info(f"Logged in again with {rc.conninfo.host}")
+
+
+def call_with_relogin(rc, func, args=None, configs=None):
+    # Run func, logging in again and retrying once if the session expired
+    try:
+        return func()
+    except Exception as err:
+        if not is_auth_error(err):
+            raise
+        logger.warning(f'Session expired, logging in again')
+        relogin(rc, args, configs)
+        return func()
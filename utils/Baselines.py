@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Baselines.py
+#
+
+# Import Python system libraries
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+
+#  Import local Python libraries
+from utils.History import BASELINE_SLACK
+
+DEFAULT_CACHE_PATH = "./config/baseline_cache.db"
+DEFAULT_CACHE_TTL = 60 * 60
+
+# The fields of the CapacityDetails points that the report compares
+FIELDS = ("data_capacity", "metadata_capacity")
+
+
+# flux_string - Quote a value as a Flux string literal
+#
+# Backslashes and double quotes are escaped, and so is the dollar sign of "${",
+# which would otherwise start an interpolation
+
+def flux_string(value):
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("${", "\\${")
+    return f'"{escaped}"'
+
+
+# build_query - Build the one Flux query that returns the baselines of every path
+#
+# Each window is a sub-query for the newest point of every series before the
+# window's cutoff, and a last one finds every path written before this run.
+# The sub-queries are joined with union(), so InfluxDB answers them in a single
+# request. The times are relative to now(), which keeps the query text, and
+# with it the cache key, the same from one run to the next.
+
+def build_query(bucket, ages):
+    bucket = flux_string(bucket)
+    lookback = 2 * max(ages)
+    fields = " or ".join(f'r._field == "{field}"' for field in FIELDS)
+
+    def last_before(name, stop):
+        return (f'{name} = from(bucket: {bucket})\n'
+                f'  |> range(start: -{lookback}s, stop: {stop})\n'
+                f'  |> filter(fn: (r) => r._measurement == "CapacityDetails" and ({fields}))\n'
+                f'  |> last()\n'
+                f'  |> keep(columns: ["_time", "_value", "_field", "path", "cluster"])\n'
+                f'  |> set(key: "window", value: "{name}")\n')
+
+    streams = [last_before(f"w{age}", f"-{int(age * (1 - BASELINE_SLACK))}s") for age in ages]
+    streams.append(last_before("known", "now()"))
+    names = ", ".join([f"w{age}" for age in ages] + ["known"])
+    return "".join(streams) + f"union(tables: [{names}])\n"
+
+
+# query_rows - Run the baseline query and return its rows as [key, window, field, value]
+#
+# The key is the path, prefixed with the cluster in a multi-cluster bucket, as
+# in DirStats.key
+
+def query_rows(config, query):
+    # The InfluxDB client is only loaded when the baselines come from InfluxDB
+    from utils.InfluxDBSink import create_client
+
+    client = create_client(config)
+    try:
+        rows = []
+        for record in client.query_api().query_stream(query):
+            values = record.values
+            cluster = values.get("cluster")
+            path = values["path"]
+            rows.append([f"{cluster}:{path}" if cluster else path, values["window"],
+                         values["_field"], int(values["_value"])])
+        return rows
+    finally:
+        client.close()
+
+
+#
+# BaselineCache Class
+#
+# This class keeps the rows of a baseline query in a small SQLite database for
+# ttl seconds, keyed by the SHA-256 of the query text, so that reports that run
+# again soon after, or several report runs of the same day, do not query
+# InfluxDB again. The InfluxDB sink empties the cache once it wrote to the
+# bucket, so that a directory it just wrote is never reported as new from a
+# result that was read before.
+
+
+class BaselineCache(object):
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, ttl=DEFAULT_CACHE_TTL, logger=None):
+
+        self.cache_path = cache_path
+        self.ttl = ttl
+
+        # Store the logger..
+        self.logger = logger
+
+        self.db = sqlite3.connect(self.cache_path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS query_results ("
+            " query_hash TEXT PRIMARY KEY,"
+            " created INTEGER NOT NULL,"
+            " rows BLOB NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self.db.commit()
+
+    # from_config - Open the cache defined in the "history" section of the config file
+
+    @staticmethod
+    def from_config(config, logger=None):
+        history = config.get("history", {})
+        return BaselineCache(history.get("cache_path", DEFAULT_CACHE_PATH),
+                             history.get("cache_ttl", DEFAULT_CACHE_TTL),
+                             logger)
+
+    # get - Return the cached rows of a query, or None when there are none younger than the TTL
+
+    def get(self, query, now=None):
+        now = time.time() if now is None else now
+        row = self.db.execute("SELECT created, rows FROM query_results WHERE query_hash = ?",
+                              (self.__hash(query),)).fetchone()
+        if row is None or now - row[0] >= self.ttl:
+            return None
+        return json.loads(zlib.decompress(row[1]))
+
+    # put - Store the rows of a query and drop the entries that expired
+
+    def put(self, query, rows, now=None):
+        now = int(time.time() if now is None else now)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO query_results VALUES (?, ?, ?)",
+                            (self.__hash(query), now, zlib.compress(json.dumps(rows).encode())))
+            self.db.execute("DELETE FROM query_results WHERE created <= ?", (now - self.ttl,))
+
+    # invalidate - Drop every cached result
+
+    def invalidate(self):
+        with self.db:
+            self.db.execute("DELETE FROM query_results")
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def __hash(query):
+        return hashlib.sha256(query.encode()).hexdigest()
+
+
+# invalidate_cache - Drop the cached baselines after points were written to InfluxDB
+#
+# Only a config whose report reads its baselines from InfluxDB has a cache
+
+def invalidate_cache(config, logger=None):
+    if config.get("history", {}).get("source", "sqlite") != "influxdb":
+        return
+
+    cache = BaselineCache.from_config(config, logger)
+    try:
+        cache.invalidate()
+    finally:
+        cache.close()
+
+
+#
+# InfluxDBBaselines Class
+#
+# The baselines of a report, read from the InfluxDB bucket instead of the
+# local history store. It answers baselines() like HistoryStore,
+# from the rows of one query that are held in memory for the run.
+
+
+class InfluxDBBaselines(object):
+    def __init__(self, rows, ages):
+
+        # (key, age) -> (timestamp, data, metadata), with the timestamp unknown
+        self.by_window = {}
+        self.known = set()
+
+        windows = {f"w{age}": age for age in ages}
+        values = {}
+        for key, window, field, value in rows:
+            if window == "known":
+                self.known.add(key)
+            elif window in windows:
+                values.setdefault((key, windows[window]), {})[field] = value
+
+        for (key, age), fields in values.items():
+            if all(field in fields for field in FIELDS):
+                self.by_window[(key, age)] = (None, fields["data_capacity"], fields["metadata_capacity"])
+
+    # load - Read the baselines of the report windows, from the cache when it is fresh
+
+    @staticmethod
+    def load(config, ages, logger=None):
+        query = build_query(config["influxdb"]["bucket_name"], ages)
+        cache = BaselineCache.from_config(config, logger)
+        try:
+            rows = cache.get(query)
+            if rows is not None:
+                if logger is not None:
+                    logger.info(f"Report baselines were taken from the cache ({len(rows)} row(s))")
+            else:
+                start = time.perf_counter()
+                rows = query_rows(config, query)
+                cache.put(query, rows)
+                if logger is not None:
+                    logger.info(f"Report baselines were read from InfluxDB in one query "
+                                f"({len(rows)} row(s), {time.perf_counter() - start:.3f}s)")
+        finally:
+            cache.close()
+
+        return InfluxDBBaselines(rows, ages)
+
+    # baselines - Return the (timestamp, data, metadata) of a path for every age, None when it is new
+
+    def baselines(self, path, timestamp, ages):
+        if path not in self.known:
+            return None
+        return [self.by_window.get((path, age)) for age in ages]
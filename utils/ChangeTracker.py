@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# ChangeTracker.py
+#
+
+# Import Python system libraries
+import sqlite3
+
+DEFAULT_STATE_PATH = "./config/last_written.db"
+DEFAULT_HEARTBEAT_INTERVAL = 24 * 60 * 60
+
+#
+# ChangeTracker Class
+#
+# This class remembers the values last written to InfluxDB for every path in
+# a small SQLite database, so that a run only writes the directories whose
+# fields changed. A path is written again after the heartbeat interval even
+# when nothing changed, which keeps every series alive in the dashboards.
+
+
+class ChangeTracker(object):
+    def __init__(self, state_path=DEFAULT_STATE_PATH, heartbeat_interval=DEFAULT_HEARTBEAT_INTERVAL, logger=None):
+
+        self.state_path = state_path
+        self.heartbeat_interval = heartbeat_interval
+
+        # Store the logger..
+        self.logger = logger
+
+        self.db = sqlite3.connect(self.state_path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS last_written ("
+            " path TEXT PRIMARY KEY,"
+            " capacity INTEGER NOT NULL,"
+            " data INTEGER NOT NULL,"
+            " metadata INTEGER NOT NULL,"
+            " files INTEGER NOT NULL,"
+            " directories INTEGER NOT NULL,"
+            " written_at INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self.db.commit()
+
+        # Counters of the current run
+        self.changed = 0
+        self.heartbeats = 0
+        self.skipped = 0
+
+    # from_config - Open the change tracker defined in the config file
+
+    @staticmethod
+    def from_config(config, logger=None):
+        influxdb = config["influxdb"]
+        return ChangeTracker(influxdb.get("state_path", DEFAULT_STATE_PATH),
+                             influxdb.get("heartbeat_interval", DEFAULT_HEARTBEAT_INTERVAL),
+                             logger)
+
+    # should_write - Tell whether the DirStats of a path must be written at `timestamp`
+
+    def should_write(self, stats, timestamp):
+        last = self.db.execute(
+            "SELECT capacity, data, metadata, files, directories, written_at"
+            " FROM last_written WHERE path = ?", (stats.key,)).fetchone()
+
+        if last is None or last[:5] != stats.as_row()[1:]:
+            self.changed += 1
+            return True
+
+        if timestamp - last[5] >= self.heartbeat_interval:
+            self.heartbeats += 1
+            return True
+
+        self.skipped += 1
+        return False
+
+    # mark_written - Remember the DirStats that InfluxDB accepted
+
+    def mark_written(self, stats_list, timestamp):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO last_written VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stats.as_row() + (int(timestamp),) for stats in stats_list))
+
+    def close(self):
+        if self.logger is not None:
+            self.logger.info(f"Change-only writes: {self.changed} changed, {self.heartbeats} heartbeat(s), "
+                             f"{self.skipped} unchanged path(s) skipped")
+        self.db.close()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Collector.py
+#
+
+# Import Python system libraries
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+DEFAULT_SHARD_WORKERS = 8
+
+
+# child_directories - Return the subdirectory paths listed in an aggregate
+
+def child_directories(dir_aggregate):
+    return [dir_aggregate["path"] + entry["name"] + "/"
+            for entry in dir_aggregate.get("files", [])
+            if entry["type"] == "FS_FILE_TYPE_DIRECTORY"]
+
+
+# drill_children - Return the subdirectory paths of an aggregate that changed enough to be read
+#
+# The cluster name keeps the paths of different clusters apart in the state
+
+def drill_children(crawl_state, dir_aggregate, cluster=None):
+    key = dir_aggregate["path"] if cluster is None else f'{cluster}:{dir_aggregate["path"]}'
+    if not crawl_state.should_drill(key, int(dir_aggregate["total_data"]), int(dir_aggregate["total_meta"]),
+                                    cluster):
+        return []
+
+    return child_directories(dir_aggregate)
+
+
+# shard_children - Return the subtrees of a sharded root, in path order
+#
+# In adaptive mode only the subtrees that changed enough are read
+
+def shard_children(dir_aggregate, crawl_state=None, cluster=None):
+    if crawl_state is not None:
+        return sorted(drill_children(crawl_state, dir_aggregate, cluster))
+    return sorted(child_directories(dir_aggregate))
+
+
+# read_listing - Read the aggregates of one directory, following the paging links
+#
+# The adaptive crawl and a sharded root need every subdirectory, not only the
+# first page. Returns the aggregate and the number of calls it took.
+
+def read_listing(rc, path):
+    dir_aggregate = rc.fs.read_dir_aggregates(path=path, recursive=False)
+    calls = 1
+    while dir_aggregate.get("paging", {}).get("next"):
+        page = rc.conninfo.send_request("GET", dir_aggregate["paging"]["next"]).data
+        dir_aggregate["files"].extend(page.get("files", []))
+        dir_aggregate["paging"] = page.get("paging", {})
+        calls += 1
+    return dir_aggregate, calls
+
+
+# log_latency_summary - Log min, avg, p95 and max of the per-root latencies of a collection
+
+def log_latency_summary(logger, latencies, description):
+    if logger is None or not latencies:
+        return
+
+    latencies = sorted(latencies.values())
+    count = len(latencies)
+    p95 = latencies[min(count - 1, int(count * 0.95))]
+    logger.info(f"Collected {count} root(s) with {description}: "
+                f"min {latencies[0]:.3f}s, avg {sum(latencies) / count:.3f}s, "
+                f"p95 {p95:.3f}s, max {latencies[-1]:.3f}s")
+
+
+#
+# Collector Class
+#
+# This class reads the directory aggregates of every configured root. The roots
+# are spread over a bounded pool of worker threads and the results are handed
+# back to the caller as soon as each root finishes, so the writer can work on
+# one root while the others are still being crawled. In adaptive mode a root is
+# read level by level and only the subtrees that changed are drilled into. A
+# sharded root is read as its own listing plus one crawl per subdirectory, each
+# with the depth left below the root. The subtrees are spread over a second
+# pool of shard_workers threads and put back together in path order, so one
+# very large root no longer waits on a single recursive call.
+
+
+class Collector(object):
+    def __init__(self, rc, max_depth=0, max_workers=1, logger=None, crawl_state=None, cluster=None,
+                 shard_workers=0, shard_paths=None):
+
+        # Store the REST client. Each worker gets its own clone because a
+        # RestClient holds a single HTTP connection.
+        self.rc = rc
+
+        self.max_depth = max_depth
+        self.max_workers = max(1, int(max_workers))
+
+        # Store the logger..
+        self.logger = logger
+
+        # Per-root latencies of the last collection, in seconds, and the
+        # number of read_dir_aggregates calls per root
+        self.latencies = {}
+        self.calls = {}
+
+        # With a CrawlState, the tree is crawled adaptively up to max_depth. The
+        # cluster name keeps the paths of different clusters apart in the state.
+        self.crawl_state = crawl_state
+        self.cluster = cluster
+
+        # With shard_workers, the roots in shard_paths, or every root when it
+        # is None, are crawled one subdirectory per task
+        self.shard_workers = max(0, int(shard_workers))
+        self.shard_paths = None if shard_paths is None else set(shard_paths)
+
+        self.__local = threading.local()
+        self.__shard_executor = None
+
+    # get_max_workers - Read the pool size from the "directories" sub-command or the config file
+
+    @staticmethod
+    def get_max_workers(args, config):
+        max_workers = config["directories"].get("max_workers", 1)
+        if args is not None and args.directories and args.directories.max_workers:
+            max_workers = int(args.directories.max_workers)
+        return max_workers
+
+    # get_shard - Read the shard pool size and the sharded roots from the config file
+
+    @staticmethod
+    def get_shard(config):
+        shard = config["directories"].get("shard", {})
+        if not shard.get("enabled", False):
+            return 0, None
+        return shard.get("max_workers", DEFAULT_SHARD_WORKERS), shard.get("paths")
+
+    # collect - Read the aggregates of every directory and yield them as they complete
+
+    def collect(self, directories):
+
+        # Yields (directory, aggregates, elapsed) tuples in completion order.
+        # With a single worker the roots are read in the calling thread, in order.
+        # Only max_workers roots are in flight at a time and a finished root is
+        # dropped as soon as the caller moves on, so memory stays bounded by the
+        # pool size instead of growing with the number of roots.
+
+        self.latencies = {}
+        self.calls = {}
+
+        if self.shard_workers and self.max_depth > 0:
+            self.__shard_executor = ThreadPoolExecutor(max_workers=self.shard_workers,
+                                                       thread_name_prefix="collect-shard")
+        try:
+            yield from self.__collect_roots(directories)
+        finally:
+            if self.__shard_executor is not None:
+                self.__shard_executor.shutdown(cancel_futures=True)
+                self.__shard_executor = None
+
+        log_latency_summary(self.logger, self.latencies, f"{self.max_workers} worker(s)")
+
+    # requests - The number of read_dir_aggregates calls of the last collection
+
+    @property
+    def requests(self):
+        return sum(self.calls.values())
+
+    def __collect_roots(self, directories):
+        if self.max_workers == 1 or len(directories) <= 1:
+            for directory in directories:
+                yield self.__read_root(directory, self.rc)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = iter(directories)
+                in_flight = set()
+                for directory in itertools.islice(pending, self.max_workers):
+                    in_flight.add(executor.submit(self.__read_root, directory))
+
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for directory in itertools.islice(pending, 1):
+                            in_flight.add(executor.submit(self.__read_root, directory))
+                    # Let go of the futures before handing the roots over, so a
+                    # root is released as soon as the caller is done with it
+                    results = [future.result() for future in done]
+                    done = future = None
+                    while results:
+                        yield results.pop(0)
+
+    def __read_root(self, directory, rc=None):
+        if rc is None:
+            rc = self.__worker_client()
+
+        start = time.monotonic()
+        if self.__shard_executor is not None and (self.shard_paths is None or directory in self.shard_paths):
+            dir_aggregates, calls = self.__read_shards(rc, directory)
+        else:
+            dir_aggregates, calls = self.__read_tree(rc, directory, self.max_depth)
+        elapsed = time.monotonic() - start
+
+        self.latencies[directory] = elapsed
+        self.calls[directory] = calls
+        if self.logger is not None:
+            self.logger.debug(f"Aggregates of {directory} were read in {elapsed:.3f}s")
+
+        return directory, dir_aggregates, elapsed
+
+    def __read_tree(self, rc, directory, max_depth):
+        # Return the aggregates of a directory down to max_depth and the number of calls made
+        if self.crawl_state is not None:
+            return self.__crawl_adaptive(rc, directory, max_depth)
+        return rc.fs.read_dir_aggregates(path=directory, max_depth=max_depth, recursive=True), 1
+
+    def __read_shards(self, rc, directory):
+        # The root itself, then its subtrees side by side, each one level less deep
+        root_aggregate, calls = read_listing(rc, directory)
+        children = shard_children(root_aggregate, self.crawl_state, self.cluster)
+
+        dir_aggregates = [root_aggregate]
+        for shard_aggregates, shard_calls in self.__shard_executor.map(self.__read_shard, children):
+            dir_aggregates.extend(shard_aggregates)
+            calls += shard_calls
+
+        if self.logger is not None:
+            self.logger.debug(f"{directory} was read in {len(children)} shard(s)")
+        return dir_aggregates, calls
+
+    def __read_shard(self, path):
+        return self.__read_tree(self.__worker_client(), path, self.max_depth - 1)
+
+    def __crawl_adaptive(self, rc, directory, max_depth):
+        # Read one level at a time and only go down into the directories
+        # whose totals changed enough since their children were last read
+        dir_aggregates = []
+        calls = 0
+        level = [directory]
+
+        for depth in range(max_depth + 1):
+            next_level = []
+            for path in level:
+                dir_aggregate, listing_calls = read_listing(rc, path)
+                dir_aggregates.append(dir_aggregate)
+                calls += listing_calls
+
+                if depth == max_depth:
+                    continue
+                next_level.extend(drill_children(self.crawl_state, dir_aggregate, self.cluster))
+            level = next_level
+
+        return dir_aggregates, calls
+
+    def __worker_client(self):
+        rc = getattr(self.__local, "rc", None)
+        if rc is None:
+            rc = self.rc.clone()
+            self.__local.rc = rc
+        return rc
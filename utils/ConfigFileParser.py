@@ -28,16 +28,76 @@
 # Import Python system libraries
 import json
 import argparse
+import hashlib
 import json
 import os
 import sys
 
 import jsonschema
-from jsonschema import validate
 
 
 from utils.Logger import Logger
 
+# Compiled schema validators, by the SHA-256 of the schema file contents
+validators = {}
+
+
+# get_validator - Return the compiled validator of a schema, checking and compiling it only once
+
+def get_validator(schema_text):
+    key = hashlib.sha256(schema_text.encode()).hexdigest()
+    validator = validators.get(key)
+    if validator is None:
+        schema = json.loads(schema_text)
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        validator = validator_class(schema)
+        validators[key] = validator
+    return validator
+
+
+#
+# Config Class
+#
+# A validated configuration. It is a dict, so the collectors and sinks keep
+# reading their sections as before, with typed accessors for the settings that
+# the scripts and the pipeline use. It remembers the file it was loaded from.
+
+
+class Config(dict):
+    def __init__(self, data, path=None):
+        super().__init__(data)
+
+        # The config file, if the configuration was loaded from one
+        self.path = path
+
+    # derive - Return a copy with some top-level sections replaced
+
+    def derive(self, **sections):
+        return Config(dict(self, **sections), self.path)
+
+    @property
+    def dir_paths(self):
+        return [str(dir_path) for dir_path in self["directories"]["dir_paths"]]
+
+    @property
+    def max_depth(self):
+        return int(self["directories"]["max_depth"])
+
+    @property
+    def sink_names(self):
+        return list(self["sinks"]) if "sinks" in self else None
+
+    @property
+    def cluster_entries(self):
+        return list(self["clusters"]) if "clusters" in self else [self["cluster"]]
+
+    @property
+    def influxdb_connection(self):
+        influxdb = self.get("influxdb", {})
+        return (influxdb.get("address"), influxdb.get("token"), influxdb.get("org_name"),
+                bool(influxdb.get("enable_gzip", False)))
+
 
 #
 # ConfigFileParser Class
@@ -60,6 +120,17 @@ class ConfigFileParser(object):
         self.schema = None
         self.config = None
 
+        # Modification times of the config and schema files when they were validated
+        self.mtimes = None
+
+    # load - Validate a config file and return it as a Config
+
+    @staticmethod
+    def load(config_path, logger=None):
+        parser = ConfigFileParser(config_path, logger)
+        parser.validate()
+        return parser.get_configs()
+
     # validate - Take the schema and validate that it matches the config file
     def validate(self):
 
@@ -68,28 +139,33 @@ class ConfigFileParser(object):
 
         config_base = os.path.splitext(self.config_path)[0]
 
+        # Take the modification times first, so a change made while reading is seen by reload
+        self.mtimes = self.__get_mtimes()
+
         try:
             with open(f'{config_base}.schema.json', "r") as schemaFile:
-                self.schema = json.load(schemaFile)
+                schema_text = schemaFile.read()
+            validator = get_validator(schema_text)
+            self.schema = validator.schema
         except (Exception,) as err:
             if self.logger is not None:
                 self.logger.error(f'{config_base}.schema reported error of: {err}')
-                raise Exception(err)
+            raise Exception(err)
 
         # Get the configuration file...
 
         try:
             with open(self.config_path, "r") as configFile:
-                self.config = json.load(configFile)
+                config = json.load(configFile)
         except Exception as err:
             if self.logger is not None:
                 self.logger.error(f'{self.config_path} reported error of {err}')
-                raise Exception(err)
+            raise Exception(err)
 
         # Now, validate the config file against the schema
 
-        is_valid, msg = self.__validate_json(configdata=self.config,
-                                             schemadata=self.schema)
+        is_valid, msg = self.__validate_json(configdata=config,
+                                             validator=validator)
 
         # If the configuration is not valid, print out the error message and exit
 
@@ -97,13 +173,49 @@ class ConfigFileParser(object):
             if self.logger is not None:
                 self.logger.error(f'{self.config_path} did not validate!')
                 self.logger.error(f'Error was: {msg}')
-                raise jsonschema.exceptions.ValidationError(msg)
+            raise jsonschema.exceptions.ValidationError(msg.message)
+
+        self.config = Config(config, self.config_path)
     
+    # reload - Validate the config file again if it or its schema changed since the last validation
+    #
+    # Returns the new Config, or None when nothing changed. A file that does not
+    # validate is logged and the previous configuration stays in use.
+
+    def reload(self):
+        mtimes = self.__get_mtimes()
+        if mtimes == self.mtimes:
+            return None
+
+        previous = self.config
+        try:
+            self.validate()
+        except Exception as err:
+            self.config = previous
+            if self.logger is not None:
+                self.logger.error(f'{self.config_path} changed but is not valid, keeping the previous '
+                                  f'configuration. Error was {err}')
+            return None
+
+        if self.logger is not None:
+            self.logger.info(f'{self.config_path} changed, the new configuration is used from now on')
+        return self.config
+
+    def __get_mtimes(self):
+        config_base = os.path.splitext(self.config_path)[0]
+        mtimes = []
+        for path in (self.config_path, f'{config_base}.schema.json'):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
     @staticmethod
-    def __validate_json(configdata, schemadata):
+    def __validate_json(configdata, validator):
 
         try:
-            validate(instance=configdata, schema=schemadata)
+            validator.validate(configdata)
         except jsonschema.exceptions.ValidationError as err:
             return False, err
 
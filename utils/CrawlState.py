@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# CrawlState.py
+#
+
+# Import Python system libraries
+import sqlite3
+import threading
+
+DEFAULT_STATE_PATH = "./config/crawl_state.db"
+DEFAULT_THRESHOLD_PERCENT = 1.0
+DEFAULT_THRESHOLD_BYTES = 0
+
+#
+# CrawlState Class
+#
+# This class drives the adaptive crawl. For every directory it remembers the
+# data and metadata totals seen the last time its children were read, and a
+# directory is drilled into again only when its totals moved by more than the
+# threshold since then. Because the reference is only updated on a drill, slow
+# growth adds up until it crosses the threshold instead of going unnoticed.
+# The store is shared by the collector threads. The totals of a run are only
+# committed when the run completes, so a crawl that failed halfway does not
+# become the reference for subtrees it never read. When several clusters are
+# crawled in one run, the totals of each cluster are kept apart until then, so
+# that a cluster whose crawl failed can be left out while the others are kept.
+
+
+class CrawlState(object):
+    def __init__(self, state_path=DEFAULT_STATE_PATH, threshold_percent=DEFAULT_THRESHOLD_PERCENT,
+                 threshold_bytes=DEFAULT_THRESHOLD_BYTES, logger=None):
+
+        self.state_path = state_path
+        self.threshold_percent = threshold_percent
+        self.threshold_bytes = threshold_bytes
+
+        # Store the logger..
+        self.logger = logger
+
+        self.__lock = threading.Lock()
+        self.db = sqlite3.connect(self.state_path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS drilled ("
+            " path TEXT PRIMARY KEY,"
+            " data INTEGER NOT NULL,"
+            " metadata INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self.db.commit()
+
+        # The totals of the current run, by cluster, until the run completes
+        self.db.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS pending ("
+            " path TEXT PRIMARY KEY,"
+            " cluster TEXT,"
+            " data INTEGER NOT NULL,"
+            " metadata INTEGER NOT NULL"
+            ")"
+        )
+        self.failed = set()
+
+        # Counters of the current run
+        self.drilled = 0
+        self.skipped = 0
+
+    # from_config - Open the crawl state when the adaptive crawl is enabled, or return None
+
+    @staticmethod
+    def from_config(config, logger=None):
+        adaptive = config["directories"].get("adaptive", {})
+        if not adaptive.get("enabled", False):
+            return None
+        return CrawlState(adaptive.get("state_path", DEFAULT_STATE_PATH),
+                          adaptive.get("threshold_percent", DEFAULT_THRESHOLD_PERCENT),
+                          adaptive.get("threshold_bytes", DEFAULT_THRESHOLD_BYTES),
+                          logger)
+
+    # should_drill - Tell whether the children of a directory must be read again
+
+    def should_drill(self, path, data, metadata, cluster=None):
+        with self.__lock:
+            last = self.db.execute("SELECT data, metadata FROM drilled WHERE path = ?", (path,)).fetchone()
+
+        if last is None:
+            drill = True
+        else:
+            previous = last[0] + last[1]
+            change = abs((data + metadata) - previous)
+            drill = change > self.threshold_bytes and \
+                change * 100 > self.threshold_percent * max(previous, 1)
+
+        if drill:
+            with self.__lock:
+                self.drilled += 1
+                self.db.execute("INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?)",
+                                (path, cluster, data, metadata))
+        else:
+            with self.__lock:
+                self.skipped += 1
+
+        return drill
+
+    # discard - Leave the totals of a cluster whose crawl failed out of the run
+
+    def discard(self, cluster=None):
+        with self.__lock:
+            self.failed.add(cluster)
+        if self.logger is not None:
+            name = "" if cluster is None else f" of {cluster}"
+            self.logger.warning(f"The crawl{name} did not complete, its adaptive crawl state is not updated")
+
+    # close - Keep the totals of a complete run, roll them back otherwise
+
+    def close(self, complete=True):
+        if self.logger is not None:
+            self.logger.info(f"Adaptive crawl: drilled into {self.drilled} directories, "
+                             f"skipped {self.skipped} stable directories")
+            if not complete:
+                self.logger.warning("The run did not complete, the adaptive crawl state is not updated")
+        with self.__lock:
+            if complete:
+                self.db.executemany("DELETE FROM pending WHERE cluster IS ?", [(cluster,) for cluster in self.failed])
+                self.db.execute("INSERT OR REPLACE INTO drilled SELECT path, data, metadata FROM pending")
+                self.db.commit()
+            else:
+                self.db.rollback()
+            self.db.close()
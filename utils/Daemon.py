@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Daemon.py
+#
+
+# Import Python system libraries
+import random
+import signal
+import threading
+import time
+
+#  Import local Python libraries
+from utils.Telemetry import RunTelemetry
+
+DEFAULT_INTERVAL = 3600
+DEFAULT_JITTER = 0
+
+#
+# Scheduler Class
+#
+# This class runs a collection cycle on a fixed cadence for as long as the
+# process lives. Cycles are anchored to the start time, so a slow cycle does not
+# push every later one back, and a random jitter spreads the load when many
+# daemons share a cluster. A failing cycle is logged and the next one still runs.
+
+
+class Scheduler(object):
+    def __init__(self, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, logger=None):
+
+        self.interval = max(1, int(interval))
+        self.jitter = max(0, int(jitter))
+
+        # Store the logger..
+        self.logger = logger
+
+        self.stopped = threading.Event()
+
+    # get_settings - Read the interval and jitter from the "daemon" sub-command or the config file
+
+    @staticmethod
+    def get_settings(args, configs=None):
+        daemon = {}
+        if configs is not None:
+            daemon = configs.get("daemon", {})
+
+        interval = daemon.get("interval", DEFAULT_INTERVAL)
+        jitter = daemon.get("jitter", DEFAULT_JITTER)
+
+        if args.daemon:
+            if args.daemon.interval:
+                interval = int(args.daemon.interval)
+            if args.daemon.jitter:
+                jitter = int(args.daemon.jitter)
+
+        return interval, jitter
+
+    # reschedule - Change the interval and jitter from the next cycle on
+
+    def reschedule(self, interval, jitter):
+        interval, jitter = max(1, int(interval)), max(0, int(jitter))
+        if (interval, jitter) == (self.interval, self.jitter):
+            return
+
+        self.interval, self.jitter = interval, jitter
+        if self.logger is not None:
+            self.logger.info(f"Now running every {self.interval}s with up to {self.jitter}s of jitter")
+
+    # stop - Ask the scheduler to leave after the running cycle
+
+    def stop(self, *args):
+        self.stopped.set()
+
+    # run - Call the cycle function every interval until stopped
+
+    def run(self, cycle):
+        signal.signal(signal.SIGTERM, self.stop)
+
+        if self.logger is not None:
+            self.logger.info(f"Daemon mode, running every {self.interval}s with up to {self.jitter}s of jitter")
+
+        next_run = time.monotonic()
+
+        try:
+            while not self.stopped.is_set():
+                delay = next_run - time.monotonic() + random.uniform(0, self.jitter)
+                if delay > 0 and self.stopped.wait(delay):
+                    break
+
+                start = time.monotonic()
+                try:
+                    cycle()
+                except Exception as err:
+                    if self.logger is not None:
+                        self.logger.error(f"Collection cycle failed, error was {err}")
+
+                if self.logger is not None:
+                    self.logger.info(f"Collection cycle finished in {time.monotonic() - start:.1f}s")
+
+                # Skip the slots that were missed by a cycle longer than the interval
+                next_run += self.interval
+                now = time.monotonic()
+                if next_run < now:
+                    next_run += ((now - next_run) // self.interval + 1) * self.interval
+        except KeyboardInterrupt:
+            pass
+
+        if self.logger is not None:
+            self.logger.info("Daemon stopped")
+
+
+# run_daemon - Run a collection cycle on the scheduler's cadence, reloading the config before each one
+#
+# cycle_fn(configs, write_api, telemetry) runs one collection. The first cycle
+# carries the startup telemetry with its config and login phases, every later
+# one gets a new RunTelemetry named telemetry_name. When the config file changed,
+# on_reload may adjust to the new Config and returns the one to use, or None to
+# keep the previous configuration. With use_influxdb(configs), an InfluxDB write
+# API stays open across cycles and is replaced when its connection changes.
+
+def run_daemon(cycle_fn, parser, scheduler, telemetry_name, args, configs, telemetry=None,
+               on_reload=None, use_influxdb=None, logger=None):
+    client = write_api = None
+
+    def needs_influxdb():
+        return use_influxdb is not None and use_influxdb(configs)
+
+    def connect():
+        nonlocal client, write_api
+        if client is None and needs_influxdb():
+            # The InfluxDB client is only loaded by the daemons that write to it
+            from utils.InfluxDBSink import create_write_api
+            client, write_api = create_write_api(configs)
+
+    def disconnect():
+        nonlocal client, write_api
+        if client is not None:
+            write_api.close()
+            client.close()
+            client = write_api = None
+
+    def reload(cycle_telemetry):
+        nonlocal configs
+        with cycle_telemetry.phase("config"):
+            reloaded = parser.reload()
+        if reloaded is not None and on_reload is not None:
+            reloaded = on_reload(reloaded)
+        if reloaded is None:
+            return
+
+        # A new InfluxDB connection, or a daemon that stopped writing to it, drops the client
+        old_connection = configs.influxdb_connection
+        configs = reloaded
+        if not needs_influxdb() or configs.influxdb_connection != old_connection:
+            disconnect()
+        connect()
+        scheduler.reschedule(*Scheduler.get_settings(args, configs))
+
+    # The first cycle also carries the config and login phases
+    startup = [telemetry] if telemetry is not None else []
+
+    def cycle():
+        cycle_telemetry = startup.pop() if startup else RunTelemetry(telemetry_name, logger)
+        if parser is not None:
+            reload(cycle_telemetry)
+        try:
+            cycle_fn(configs, write_api, cycle_telemetry)
+        finally:
+            cycle_telemetry.publish(configs, write_api)
+
+    # Keep the cluster sessions and the InfluxDB client open across cycles
+    connect()
+    try:
+        scheduler.run(cycle)
+    finally:
+        disconnect()
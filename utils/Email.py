@@ -41,7 +41,6 @@ from email.utils import formatdate
 from email.base64mime import body_encode as encode_base64
 from smtplib import SMTPAuthenticationError as SMTPAuthenticationError
 
-from utils.ConfigFileParser import ConfigFileParser
 from utils.Logger import Logger
 
 #
@@ -94,6 +93,168 @@ class Kade_SSL(smtplib.SMTP_SSL):
             self.password.encode('utf-8'), challenge, 'md5').hexdigest()
 
 
+# parse_recipients - Turn a "to" setting into a list of addresses
+#
+# A single string may hold several addresses separated by commas or semicolons
+
+def parse_recipients(send_to):
+    if isinstance(send_to, str):
+        send_to = send_to.replace(";", ",").split(",")
+    return [address.strip() for address in send_to if address.strip()]
+
+
+# compose_message - Build the MIME message of a report with its attachments
+#
+# attachments is a list of (file name, bytes) pairs
+
+def compose_message(send_from, send_to, subject, message, attachments=None):
+    msg = MIMEMultipart()
+    msg["From"] = send_from
+    msg["To"] = ", ".join(parse_recipients(send_to))
+    msg["Date"] = formatdate(localtime=True)
+    msg["Subject"] = subject
+
+    # Attach the message body to the email
+
+    msg.attach(MIMEText(f'{message}', "html"))
+
+    # Attach the files, if any
+
+    for filename, content in attachments or []:
+        part = MIMEApplication(content, Name=filename)
+        part["Content-Disposition"] = f'attachment; filename="{filename}"'
+        msg.attach(part)
+
+    return msg
+
+
+#
+# EmailSession Class
+#
+# This class keeps one connection to the SMTP server open, with TLS or SSL and
+# the login done once, and sends any number of messages through it. Every
+# message goes to all of its recipients in a single mail transaction. When the
+# server drops the connection, for instance after an idle timeout, the session
+# connects again and retries the message once. Use it as a context manager so
+# that the connection is closed.
+
+class EmailSession(object):
+    def __init__(self, server="localhost", port=25, login=None, password=None, use_what=None,
+                 logger=None, timeout=30):
+
+        self.server = server
+        self.port = port
+        self.login = login
+        self.password = password
+        self.use_what = use_what
+        self.timeout = timeout
+
+        # Store the logger..
+        self.logger = logger
+
+        self.smtp = None
+
+        # Counters of the session
+        self.connects = 0
+        self.messages = 0
+
+    # from_settings - Build a session from the email settings of the config file
+
+    @staticmethod
+    def from_settings(settings, logger=None):
+        return EmailSession(settings["server"], settings["port"], settings["login"],
+                            settings["password"], settings["use"], logger)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # connect - Open the connection, start TLS or SSL and log in
+
+    def connect(self):
+        if self.logger is not None:
+            self.logger.debug("Initializing SMTP server")
+
+        # Either use TLS or SSL
+
+        try:
+            if self.use_what == "ssl":
+                smtp = Kade_SSL(self.server, self.port, timeout=self.timeout)
+            else:
+                smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        except (Exception,) as excpt:
+            if self.logger is not None:
+                self.logger.error(f"Could not connect to email server, error was {excpt}")
+            raise
+
+        try:
+            if self.use_what == "tls":
+                smtp.starttls()
+
+            # It is possible that we are talking to an email relay. In some cases, those
+            # are owned by organizations that only allow email from within the organization.
+            # In that case, they may not require a login/password combination
+            if self.logger is not None:
+                self.logger.info(f"SMTP connection is established with {self.login}")
+            if self.login:
+                if self.logger is not None:
+                    self.logger.debug("Logging into SMTP server")
+
+                try:
+                    smtp.login(self.login, self.password)
+                except Exception as excpt:
+                    if self.logger is not None:
+                        self.logger.error(f"Error while logging into email. Error: {excpt}")
+                    raise
+        except (Exception,):
+            smtp.close()
+            raise
+
+        self.smtp = smtp
+        self.connects += 1
+
+    # send - Send one message to all of its recipients
+
+    def send(self, send_from, send_to, subject, message, attachments=None):
+        recipients = parse_recipients(send_to)
+        data = compose_message(send_from, recipients, subject, message, attachments).as_string()
+
+        if self.logger is not None:
+            self.logger.debug(f"Sending email to {len(recipients)} recipient(s)")
+
+        for attempt in range(2):
+            if self.smtp is None:
+                self.connect()
+            try:
+                refused = self.smtp.sendmail(send_from, recipients, data)
+                break
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as excpt:
+                self.smtp.close()
+                self.smtp = None
+                if attempt:
+                    raise
+                if self.logger is not None:
+                    self.logger.warning(f"SMTP connection was lost ({excpt}), connecting again")
+
+        self.messages += 1
+        if refused and self.logger is not None:
+            self.logger.warning(f"The email server refused {', '.join(refused)}")
+        return refused
+
+    # close - Say goodbye to the server, a connection that is already gone is fine
+
+    def close(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        self.smtp = None
+
+
 #
 # EmailReport Class
 #
@@ -109,84 +270,36 @@ class Email(object):
     # send_mail - Routine to send email report as an attachment to a given user
 
     def send_mail(self, send_from, send_to, subject, message, server="localhost",
-                  port=25, login=None, password=None, use_what=None):
+                  port=25, login=None, password=None, use_what=None, attachments=None):
 
         # Compose and send email with provided info and attachments
         #
         # Args:
         #
         # send_from - email from name
-        # send_to - email to name
+        # send_to - email to name, or several separated by commas
         # subject - String with a subject line
         # message - String with a message body
-        # attachment - path to a file to attach to the email
         # server - mail server host name
         # port - port number
         # username - username to login to SMTP server (if required)
         # password - password to login to SMTP server (if required)
         # use_what - Must be either `tls` or `ssl`
+        # attachments - list of (file name, bytes) pairs to attach to the email
+        #
+        # Use an EmailSession to send several messages over one connection
 
-        if self.logger is not None:
-            self.logger.debug("Encoding From, To, Date, and Subject for email")
-
-        msg = MIMEMultipart()
-        msg["From"] = send_from
-        msg["To"] = send_to
-        msg["Date"] = formatdate(localtime=True)
-        msg["Subject"] = subject
-
-        # Attach the message body to the email
-
-        msg.attach(MIMEText(f'{message}', "html"))
-
-        # Send the email
-
-        if self.logger is not None:
-            self.logger.debug("Initializing SMTP server")
-
-        # Either use TLS or SSL
-
-        if use_what == "ssl":
-            try:
-                smtp = Kade_SSL(server, port, timeout=30)
-            except (Exception,) as excpt:
-                self.logger.error(f"Could not connect to email server, error was {excpt}")
-                raise
-        else:
-            try:
-                smtp = smtplib.SMTP(server, port, timeout=30)
-            except (Exception,) as excpt:
-                self.logger.error(f"Could not connect to email server, error was {excpt}")
-                raise
-
-            if use_what == "tls":
-                smtp.starttls()
-
-        # It is possible that we are talking to an email relay. In some cases, those
-        # are owned by organizations that only allow email from within the organization.
-        # In that case, they may not require a login/password combination
-        self.logger.info(f"SMTP connection is established with {login}")
-        if login != "":
-            if self.logger is not None:
-                self.logger.debug("Logging into SMTP server")
-
-            try:
-                smtp.login(login, password)
-            except Exception as excpt:
-                self.logger.error(f"Error while logging into email. Error: {excpt}")
-                raise
-
-        if self.logger is not None:
-            self.logger.debug("Sending email")
-
-        smtp.sendmail(send_from, send_to, msg.as_string())
-        smtp.quit()
+        with EmailSession(server, port, login, password, use_what, self.logger) as session:
+            session.send(send_from, send_to, subject, message, attachments)
 
 
 # Test Main Routine - This is not normally used as this class is usually imported
 
 
 def main():
+    # Only the test needs the config file parser, so the scripts do not pay for jsonschema twice
+    from utils.ConfigFileParser import ConfigFileParser
+
     # Define the name of the Program, Description, and Version.
 
     progname = "Test-Email"
@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# EmailSink.py
+#
+
+# Import Python system libraries
+import csv
+import gzip
+import io
+import smtplib
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dominate.tags import tr, td, th, span, p, h3
+
+#  Import local Python libraries
+from utils.Email import EmailSession
+from utils.History import HistoryStore, DAY
+from utils.Ranking import TopK
+from utils.Stats import StatsColumns
+
+# The report compares every directory with these earlier points in time
+WINDOWS = [("1 day", DAY), ("7 days", 7 * DAY), ("30 days", 30 * DAY)]
+WINDOW_AGES = [window for window_name, window in WINDOWS]
+
+# Rows are handed to the history store in chunks of this size
+HISTORY_CHUNK_SIZE = 1000
+
+# The 1 day changes of a directory that the report ranks it by, see change_scores
+DATA_CHANGE, DATA_PERCENT, METADATA_CHANGE, METADATA_PERCENT = range(4)
+
+# The rankings of the email as (title, score, direction). A direction of -1
+# ranks the largest decreases. Each ranking lists at most max_rows directories.
+RANKINGS = [
+    ("Largest data growth", DATA_CHANGE, 1),
+    ("Largest data shrink", DATA_CHANGE, -1),
+    ("Fastest relative data growth", DATA_PERCENT, 1),
+    ("Fastest relative data shrink", DATA_PERCENT, -1),
+    ("Largest metadata growth", METADATA_CHANGE, 1),
+    ("Largest metadata shrink", METADATA_CHANGE, -1),
+    ("Fastest relative metadata growth", METADATA_PERCENT, 1),
+    ("Fastest relative metadata shrink", METADATA_PERCENT, -1),
+]
+PERCENT_SCORES = (DATA_PERCENT, METADATA_PERCENT)
+DEFAULT_MAX_ROWS = 10
+
+# Every directory goes to a compressed CSV attachment instead. It stays in
+# memory up to this size and spills to disk above it.
+ATTACHMENT_NAME = "directory_trends.csv.gz"
+ATTACHMENT_SPOOL_SIZE = 1024 * 1024
+
+# There can be hundreds of team reports, so theirs spill to disk much earlier
+TEAM_SPOOL_SIZE = 64 * 1024
+
+# Upper bound of the threads that finish the reports
+MAX_RENDER_WORKERS = 8
+
+REPORT_HEADER = "<!DOCTYPE html>\n<html><head><title>Qumulo Storage Report</title></head><body>"
+REPORT_FOOTER = "</body></html>\n"
+
+
+# format_change - Format a change in bytes as a signed GB string
+
+def format_change(change):
+    change = round(change / 10 ** 9, 2)
+    if change > 0:
+        return "+" + str(change) + " GB"
+    return str(change) + " GB"
+
+
+# compute_changes - Compare the DirStats of one directory with its history
+#
+# Returns None for a new directory, otherwise the data and metadata changes of
+# every window, with None where the history does not reach back that far.
+
+def compute_changes(history, current_time, stats):
+    baselines = history.baselines(stats.key, current_time, WINDOW_AGES)
+    if baselines is None:
+        return None
+
+    data_changes = [stats.data - baseline[1] if baseline else None for baseline in baselines]
+    metadata_changes = [stats.metadata - baseline[2] if baseline else None for baseline in baselines]
+    return data_changes, metadata_changes
+
+
+# relative_change - A change in percent of the size before it, None when there was nothing before
+
+def relative_change(change, current):
+    if change is None:
+        return None
+    baseline = current - change
+    return 100.0 * change / baseline if baseline > 0 else None
+
+
+# change_scores - The 1 day data and metadata changes of a directory, in bytes and in percent
+#
+# A new directory counts as grown by its whole size, without a relative change.
+# A score is None when there is no 1 day old snapshot.
+
+def change_scores(stats, changes):
+    if changes is None:
+        return stats.data, None, stats.metadata, None
+
+    data_changes, metadata_changes = changes
+    return (data_changes[0], relative_change(data_changes[0], stats.data),
+            metadata_changes[0], relative_change(metadata_changes[0], stats.metadata))
+
+
+# format_score - Format the score that a ranking is ordered by
+
+def format_score(score, index):
+    if index in PERCENT_SCORES:
+        return f"{score:+.1f} %"
+    return format_change(score)
+
+
+# tally - Count a directory in the totals of the report by its 1 day data change
+#
+# sign is -1 to take a directory out of the totals again
+
+def tally(totals, data, changes, sign=1):
+    if changes is None:
+        totals["new"] += sign
+        totals["new_bytes"] += sign * data
+        return
+
+    change = changes[0][0]
+    if change is None:
+        totals["not_compared"] += sign
+    elif change > 0:
+        totals["grew"] += sign
+        totals["grew_bytes"] += sign * change
+    elif change < 0:
+        totals["shrank"] += sign
+        totals["shrank_bytes"] += sign * change
+    else:
+        totals["unchanged"] += sign
+
+
+# new_totals - Empty totals for tally
+
+def new_totals():
+    return dict.fromkeys(("new", "new_bytes", "not_compared", "grew", "grew_bytes",
+                          "shrank", "shrank_bytes", "unchanged"), 0)
+
+
+# render_summary - Render the line at the top of the report
+
+def render_summary(shown, total, attached, name=None):
+    summary = (f"{shown} of {total} directories are listed, ranked by their 1 day data and "
+               f"metadata change. Growth and shrink are listed separately.")
+    if name is not None:
+        summary = f"{name}: {summary}"
+    if attached:
+        summary += f" Every directory is listed in the attached {ATTACHMENT_NAME}."
+    return p(summary).render(pretty=False)
+
+
+# render_rest - Render the line that sums up the directories that no ranking lists
+
+def render_rest(rest, count):
+    if count <= 0:
+        return ""
+
+    parts = []
+    if rest["grew"]:
+        parts.append(f'{rest["grew"]} grew by {format_change(rest["grew_bytes"])}')
+    if rest["shrank"]:
+        parts.append(f'{rest["shrank"]} shrank by {format_change(rest["shrank_bytes"])}')
+    if rest["unchanged"]:
+        parts.append(f'{rest["unchanged"]} did not change')
+    if rest["new"]:
+        parts.append(f'{rest["new"]} are new with {format_change(rest["new_bytes"])}')
+    if rest["not_compared"]:
+        parts.append(f'{rest["not_compared"]} have no 1 day old snapshot')
+    return p(f"{count} other directories: {', '.join(parts)}.").render(pretty=False)
+
+
+# render_ranking - Render the table of one ranking
+
+def render_ranking(title, index, direction, entries, trends=False):
+    ranked_by = "Change (1 day, %)" if index in PERCENT_SCORES else "Change (1 day)"
+    return "".join([h3(title).render(pretty=False), "<table>", render_header(trends, ranked_by)]
+                   + [render_row(directory, changes, trend, trends, format_score(direction * score, index))
+                      for score, (directory, changes, trend, data) in entries]
+                   + ["</table>"])
+
+
+# render_header - Render the header row of the report table
+
+def render_header(trends=False, ranked_by=None):
+    row = tr()
+    row.add(th(span("Directory"), style="text-align:left"))
+    if ranked_by is not None:
+        row.add(th(span(ranked_by), style="text-align:center"))
+    for window_name, window in WINDOWS:
+        row.add(th(span(f"Data Change ({window_name})"), style="text-align:center"))
+    for window_name, window in WINDOWS:
+        row.add(th(span(f"Metadata Change ({window_name})"), style="text-align:center"))
+    if trends:
+        row.add(th(span("Data Growth per Day"), style="text-align:center"))
+        row.add(th(span("Days to Threshold"), style="text-align:center"))
+    return row.render(pretty=False)
+
+
+# render_row - Render the report row of one directory
+
+def render_row(directory, changes, trend=None, trends=False, score=None):
+    row = tr()
+    row.add(td(span(directory), style="text-align:left"))
+    if score is not None:
+        row.add(td(span(score), style="text-align:center"))
+
+    if changes is None:
+        for i in range(2 * len(WINDOWS)):
+            row.add(td(span("New directory"), style="text-align:center"))
+    else:
+        data_changes, metadata_changes = changes
+        for change in data_changes + metadata_changes:
+            row.add(td(span(format_change(change) if change is not None else "-"), style="text-align:center"))
+
+    if trends:
+        slope = trend.slope if trend is not None else None
+        days_to_threshold = trend.days_to_threshold if trend is not None else None
+        row.add(td(span(format_change(slope) if slope is not None else "-"), style="text-align:center"))
+        row.add(td(span(str(int(days_to_threshold)) if days_to_threshold is not None else "-"),
+                   style="text-align:center"))
+
+    return row.render(pretty=False)
+
+
+# csv_header - The columns of the CSV attachment
+
+def csv_header(trends=False):
+    return (["directory", "data", "metadata", "new"]
+            + [f"data_change_{window_name.replace(' ', '_')}" for window_name, window in WINDOWS]
+            + [f"metadata_change_{window_name.replace(' ', '_')}" for window_name, window in WINDOWS]
+            + (["data_growth_per_day", "data_growth_rate", "days_to_threshold"] if trends else []))
+
+
+# csv_row - The CSV attachment row of one directory, in bytes
+
+def csv_row(stats, changes, trends=False):
+    if changes is None:
+        row = [stats.key, stats.data, stats.metadata, 1] + [""] * (2 * len(WINDOWS))
+    else:
+        data_changes, metadata_changes = changes
+        row = ([stats.key, stats.data, stats.metadata, 0]
+               + ["" if change is None else change for change in data_changes + metadata_changes])
+
+    if trends:
+        trend = stats.trend
+        values = (trend.slope, trend.growth_rate, trend.days_to_threshold) if trend is not None else (None,) * 3
+        row += ["" if value is None else value for value in values]
+    return row
+
+
+# email_settings - Get the email settings from the config file
+
+def email_settings(config):
+    email = config["email"]
+    return {
+        "from": email["from"],
+        "to": email["to"],
+        "login": email["login"],
+        "password": email["password"],
+        "server": email["server"],
+        "port": email["port"],
+        "use": email["use"],
+    }
+
+
+# get_routes - Read the per-team routing rules of the config file
+#
+# Returns the teams as {name: recipients} and the path prefixes as {prefix: name}
+
+def get_routes(config):
+    teams = {}
+    prefixes = {}
+    for route in config.get("email", {}).get("routes", []):
+        teams[route["name"]] = route["to"]
+        for prefix in route["prefixes"]:
+            prefixes[prefix.rstrip("/") + "/"] = route["name"]
+    return teams, prefixes
+
+
+# route_owner - Return the team that owns a directory, or None
+#
+# The directory and its parents are looked up from the bottom, so the longest
+# matching prefix wins and the cost does not grow with the number of teams.
+
+def route_owner(prefixes, path):
+    if not path.endswith("/"):
+        path += "/"
+
+    end = len(path)
+    while end > 0:
+        owner = prefixes.get(path[:end])
+        if owner is not None:
+            return owner
+        end = path.rfind("/", 0, end - 1) + 1
+    return None
+
+
+#
+# Report Class
+#
+# One report of the email sink. Every ranking keeps its max_rows directories in
+# a TopK heap while the rows stream by, the totals of all rows are counted, and
+# every row goes into a gzip compressed CSV attachment on a spooled temporary
+# file, so memory stays at O(max_rows) per ranking. The kept rows are only
+# rendered when the report is finished, and the directories that no ranking
+# lists are summed up in one line.
+
+
+class Report(object):
+    def __init__(self, name=None, to=None, max_rows=DEFAULT_MAX_ROWS, attach_csv=True,
+                 spool_size=ATTACHMENT_SPOOL_SIZE, trends=False):
+
+        # The team and its recipients, None for the report of every directory
+        self.name = name
+        self.to = to
+
+        self.max_rows = max_rows
+        self.rows = 0
+
+        # Whether the rows carry the trend columns
+        self.trends = trends
+
+        # The rankings of RANKINGS, holding (directory, changes, trend, data) rows
+        self.rankings = [TopK(max_rows) for ranking in RANKINGS]
+        self.totals = new_totals()
+
+        # The CSV attachment, written through gzip into a spooled temporary file
+        self.attachment_file = None
+        self.attachment_csv = None
+        if attach_csv:
+            self.attachment_file = tempfile.SpooledTemporaryFile(max_size=spool_size, mode="w+b")
+            self.attachment_csv = io.TextIOWrapper(gzip.GzipFile(fileobj=self.attachment_file, mode="wb"),
+                                                   encoding="utf-8", newline="")
+            csv.writer(self.attachment_csv).writerow(csv_header(trends))
+
+        self.html = None
+        self.attachment = None
+
+    # add - Offer the row of a directory to the rankings and count it in the totals
+
+    def add(self, stats, changes):
+        self.rows += 1
+
+        scores = change_scores(stats, changes)
+        row = (stats.key, changes, stats.trend, stats.data)
+        for ranking, (title, index, direction) in zip(self.rankings, RANKINGS):
+            score = scores[index]
+            if score is not None and direction * score > 0:
+                ranking.push(direction * score, row)
+        tally(self.totals, stats.data, changes)
+
+        if self.attachment_csv is not None:
+            csv.writer(self.attachment_csv).writerow(csv_row(stats, changes, self.trends))
+
+    # finish - Render the HTML report of the rankings and close the attachment
+
+    def finish(self):
+        sections = []
+        shown = {}
+        for ranking, (title, index, direction) in zip(self.rankings, RANKINGS):
+            entries = ranking.items()
+            if not entries:
+                continue
+            sections.append(render_ranking(title, index, direction, entries, self.trends))
+            for score, row in entries:
+                shown[row[0]] = row
+        self.rankings = [TopK(self.max_rows) for ranking in RANKINGS]
+
+        # A directory may be listed by several rankings but is taken out of the rest once
+        rest = dict(self.totals)
+        for directory, changes, trend, data in shown.values():
+            tally(rest, data, changes, -1)
+
+        attached = self.attachment_csv is not None
+        self.html = "".join([REPORT_HEADER, render_summary(len(shown), self.rows, attached, self.name)]
+                            + sections
+                            + [render_rest(rest, self.rows - len(shown)), REPORT_FOOTER])
+
+        if self.attachment_csv is not None:
+            self.attachment_csv.close()
+            self.attachment_file.seek(0)
+            self.attachment = self.attachment_file.read()
+        self.discard()
+        return self
+
+    # discard - Drop the temporary file of the attachment
+
+    def discard(self):
+        # Closing the text wrapper also closes the gzip stream
+        if self.attachment_csv is not None and not self.attachment_csv.closed:
+            self.attachment_csv.close()
+        if self.attachment_file is not None:
+            self.attachment_file.close()
+        self.attachment_file = self.attachment_csv = None
+
+    # attachments - The (file name, content) pairs to send along with the report
+
+    def attachments(self):
+        if self.attachment is None:
+            return []
+        return [(ATTACHMENT_NAME, self.attachment)]
+
+
+#
+# EmailSink Class
+#
+# This sink builds the HTML capacity change report against the 1, 7 and 30 day
+# old snapshots in the history store, or in the InfluxDB bucket. Every aggregate
+# is compared once, as soon as it arrives, and goes to the report of every
+# directory and to the report of the team that owns it under the routing rules. Each report keeps only its
+# largest changes and streams the rest into its attachment, and the raw byte
+# counts go to the store in chunks, so memory does not grow with the number of
+# directories. The reports are finished in parallel and, when email settings
+# are given, mailed through one SMTP session when the sink closes.
+
+
+class EmailSink(object):
+    name = "email"
+
+    # The sink appends every run to the history store that trends are read from
+    records_history = True
+
+    def __init__(self, config, logger=None, settings=None, cluster=None):
+
+        # Store the config
+        self.config = config
+
+        # Store the logger..
+        self.logger = logger
+
+        # Email settings and the cluster name for the subject line
+        self.settings = settings
+        self.cluster = cluster
+
+        email = config.get("email", {})
+        self.max_rows = max(1, int(email.get("max_rows", DEFAULT_MAX_ROWS)))
+        self.attach_csv = bool(email.get("attach_csv", True))
+        self.teams, self.prefixes = get_routes(config)
+        self.trends = bool(config.get("trends", {}).get("enabled", False))
+
+        # Where the baselines come from, the history store or the InfluxDB bucket
+        self.source = config.get("history", {}).get("source", "sqlite")
+
+        self.history = None
+        self.baselines = None
+        self.pending_usages = StatsColumns()
+        self.current_time = None
+
+        # The report of every directory and the reports of the teams that own
+        # some of them. The HTML and the attachment of the first stay here.
+        self.main_report = None
+        self.team_reports = {}
+        self.report = None
+        self.attachment = None
+
+        # Counters of the last run, for the run telemetry
+        self.rows = 0
+        self.send_seconds = 0.0
+
+    # open - Start a run
+
+    def open(self):
+        self.history = HistoryStore.from_config(self.config, self.logger)
+        self.baselines = self.history
+        if self.source == "influxdb":
+            self.baselines = self.__load_baselines()
+        self.pending_usages.clear()
+        self.current_time = int(time.time())
+        self.report = None
+        self.attachment = None
+        self.rows = 0
+        self.send_seconds = 0.0
+
+        self.main_report = Report(max_rows=self.max_rows, attach_csv=self.attach_csv, trends=self.trends)
+        self.team_reports = {}
+
+    # __load_baselines - Read the baselines from InfluxDB, falling back on the history store
+
+    def __load_baselines(self):
+        # The InfluxDB client is only loaded when the baselines come from InfluxDB
+        from utils.Baselines import InfluxDBBaselines
+
+        try:
+            return InfluxDBBaselines.load(self.config, WINDOW_AGES, self.logger)
+        except Exception as err:
+            if self.logger is not None:
+                self.logger.warning(f"The report baselines could not be read from InfluxDB, "
+                                    f"the history store is used instead: {err}")
+            return self.history
+
+    # write - Compare one directory with its history and add it to its reports
+
+    def write(self, stats):
+        changes = compute_changes(self.baselines, self.current_time, stats)
+        self.rows += 1
+        self.main_report.add(stats, changes)
+
+        owner = route_owner(self.prefixes, stats.path) if self.prefixes else None
+        if owner is not None:
+            team_report = self.team_reports.get(owner)
+            if team_report is None:
+                team_report = Report(owner, self.teams[owner], self.max_rows, self.attach_csv, TEAM_SPOOL_SIZE,
+                                     self.trends)
+                self.team_reports[owner] = team_report
+            team_report.add(stats, changes)
+
+        self.pending_usages.append(stats)
+        if len(self.pending_usages) >= HISTORY_CHUNK_SIZE:
+            self.history.append(self.current_time, self.pending_usages.rows())
+            self.pending_usages.clear()
+
+    # close - Finish the reports of a complete run and send them if email settings were given
+
+    def close(self, complete=True):
+        reports = [self.main_report] + list(self.team_reports.values())
+        try:
+            if not complete:
+                if self.logger is not None:
+                    self.logger.warning("The collection did not complete, no report is built")
+                self.history.discard(self.current_time)
+                return
+
+            self.history.append(self.current_time, self.pending_usages.rows())
+            self.history.prune(self.current_time)
+            self.pending_usages.clear()
+
+            # Compressing the attachments releases the GIL, so the reports are finished side by side
+            with ThreadPoolExecutor(max_workers=min(len(reports), MAX_RENDER_WORKERS)) as executor:
+                list(executor.map(Report.finish, reports))
+
+            self.report = self.main_report.html
+            self.attachment = self.main_report.attachment
+        finally:
+            self.history.close()
+            for report in reports:
+                report.discard()
+
+        if self.settings is not None:
+            start = time.perf_counter()
+            self.send_report()
+            self.send_seconds = time.perf_counter() - start
+
+    # attachments - The (file name, content) pairs to send along with the report of every directory
+
+    def attachments(self):
+        if self.main_report is None:
+            return []
+        return self.main_report.attachments()
+
+    # counters - Return what the last run reported, for the run telemetry
+
+    def counters(self):
+        counters = {"report_rows": self.rows, "report_bytes": len(self.report) if self.report else 0,
+                    "report_attachment_bytes": len(self.attachment) if self.attachment else 0,
+                    "team_reports": len(self.team_reports)}
+        if self.send_seconds:
+            counters["smtp_send_seconds"] = round(self.send_seconds, 6)
+        return counters
+
+    # send_report - Mail the report of every directory and the team reports through one SMTP session
+    #
+    # A team whose report cannot be delivered does not stop the others, the
+    # failures are raised together once every report was tried.
+
+    def send_report(self, settings=None, subject=None):
+        settings = settings if settings is not None else self.settings
+        if subject is None:
+            subject = f'Latest directory trend report for "{self.cluster}"'
+
+        failed = []
+        with EmailSession.from_settings(settings, self.logger) as session:
+            session.send(settings["from"], settings["to"], subject, self.report, self.attachments())
+
+            for team, team_report in self.team_reports.items():
+                try:
+                    session.send(settings["from"], team_report.to, f'{subject} - {team}',
+                                 team_report.html, team_report.attachments())
+                except (smtplib.SMTPException, OSError) as err:
+                    if self.logger is not None:
+                        self.logger.error(f'The report of "{team}" could not be sent, error was {err}')
+                    failed.append(team)
+
+        if self.logger is not None and self.team_reports:
+            self.logger.info(f"{len(self.team_reports) - len(failed)} of {len(self.team_reports)} "
+                             f"team report(s) sent over {session.connects} SMTP connection(s)")
+        if failed:
+            raise Exception(f"The reports of {', '.join(failed)} could not be sent")
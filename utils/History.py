@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# History.py
+#
+
+# Import Python system libraries
+import sqlite3
+
+DEFAULT_DB_PATH = "./config/history.db"
+DEFAULT_RETENTION_DAYS = 400
+
+DAY = 24 * 60 * 60
+
+# A baseline may be up to this fraction of its window younger than the window,
+# so that a daily run that starts a few seconds early still finds yesterday.
+BASELINE_SLACK = 0.1
+
+# Every snapshot of the last days is kept, older days keep only their newest
+# snapshot of each path, so a daemon that runs every few minutes does not grow
+# the history by hundreds of rows per path and day.
+RAW_DAYS = 2
+
+#
+# HistoryStore Class
+#
+# This class keeps the raw byte counts of every run in an SQLite database. Rows
+# are keyed on (path, timestamp), so finding the newest snapshot of a path
+# before some point in time is a single index lookup however long the history
+# grows, and a second index on the timestamp keeps pruning and discarding a
+# run from scanning the whole table. Pruning also thins the days older than
+# RAW_DAYS down to one snapshot per path and day. The trend engine keeps the
+# daily points of every path over its window in one row per path, so that a
+# run reads one row per directory instead of one per directory and day.
+
+
+class HistoryStore(object):
+    def __init__(self, db_path=DEFAULT_DB_PATH, retention_days=DEFAULT_RETENTION_DAYS, logger=None):
+
+        self.db_path = db_path
+        self.retention_days = retention_days
+
+        # Store the logger..
+        self.logger = logger
+
+        self.db = sqlite3.connect(self.db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " path TEXT NOT NULL,"
+            " timestamp INTEGER NOT NULL,"
+            " capacity INTEGER NOT NULL,"
+            " data INTEGER NOT NULL,"
+            " metadata INTEGER NOT NULL,"
+            " files INTEGER NOT NULL,"
+            " directories INTEGER NOT NULL,"
+            " PRIMARY KEY (path, timestamp)"
+            ") WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS snapshots_timestamp ON snapshots (timestamp)")
+
+        # The start of the first day that was not thinned out yet
+        self.db.execute("CREATE TABLE IF NOT EXISTS downsampled (until INTEGER NOT NULL)")
+
+        # The daily points of a path as packed (timestamp, data) pairs, with the
+        # time of the newest one, and the runs that did not complete
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS series ("
+            " path TEXT PRIMARY KEY,"
+            " until INTEGER NOT NULL,"
+            " points BLOB NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS discarded (timestamp INTEGER PRIMARY KEY)")
+        self.db.commit()
+
+        # The baselines query of each number of windows
+        self.__queries = {}
+
+    # from_config - Open the history store defined in the config file
+
+    @staticmethod
+    def from_config(config, logger=None):
+        history = config.get("history", {})
+        return HistoryStore(history.get("db_path", DEFAULT_DB_PATH),
+                            history.get("retention_days", DEFAULT_RETENTION_DAYS),
+                            logger)
+
+    # append - Store rows of one run, possibly in several calls
+    #
+    # rows is an iterable of (path, capacity, data, metadata, files, directories)
+
+    def append(self, timestamp, rows):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((path, int(timestamp), capacity, data, metadata, files, directories)
+                 for path, capacity, data, metadata, files, directories in rows))
+
+    # prune - Remove the snapshots that are older than the retention period and thin out the older days
+
+    def prune(self, timestamp):
+        with self.db:
+            if self.retention_days:
+                since = int(timestamp) - self.retention_days * DAY
+                self.db.execute("DELETE FROM snapshots WHERE timestamp < ?", (since,))
+                self.db.execute("DELETE FROM series WHERE until < ?", (since,))
+                self.db.execute("DELETE FROM discarded WHERE timestamp < ?", (since,))
+            self.__downsample(int(timestamp) - RAW_DAYS * DAY)
+
+    def __downsample(self, until):
+        # Keep the newest snapshot of every path and day between the last
+        # thinning and the start of the day of until, then remember where it stopped
+        until -= until % DAY
+        row = self.db.execute("SELECT until FROM downsampled").fetchone()
+        since = row[0] if row is not None else 0
+        if since >= until:
+            return
+
+        # A snapshot goes when a newer one of the same path and day exists, one primary key lookup each
+        self.db.execute(
+            "DELETE FROM snapshots WHERE timestamp >= ? AND timestamp < ? AND EXISTS"
+            " (SELECT 1 FROM snapshots newer WHERE newer.path = snapshots.path"
+            "  AND newer.timestamp > snapshots.timestamp AND newer.timestamp < (snapshots.timestamp / ? + 1) * ?)",
+            (since, until, DAY, DAY))
+        self.db.execute("DELETE FROM downsampled")
+        self.db.execute("INSERT INTO downsampled VALUES (?)", (until,))
+
+    # discard - Remove the rows of a run that did not complete
+
+    def discard(self, timestamp):
+        with self.db:
+            self.db.execute("DELETE FROM snapshots WHERE timestamp = ?", (int(timestamp),))
+            self.db.execute("INSERT OR IGNORE INTO discarded VALUES (?)", (int(timestamp),))
+
+    # discarded - Return the timestamps of the runs that did not complete since some point in time
+
+    def discarded(self, since):
+        return [timestamp for (timestamp,) in
+                self.db.execute("SELECT timestamp FROM discarded WHERE timestamp >= ?", (int(since),))]
+
+    # baselines - Return the newest (timestamp, data, metadata) of a path at least `age` seconds old, for every age
+    #
+    # Returns None for a path that no earlier run saw, otherwise a list with
+    # None where the history does not reach back that far. The snapshot before
+    # this run and the one of every window are index lookups of one query.
+
+    def baselines(self, path, timestamp, ages):
+        parameters = [path, int(timestamp) - 1]
+        for age in ages:
+            parameters += [path, int(timestamp - age * (1 - BASELINE_SLACK))]
+
+        found = {row[0]: row[1:] for row in self.db.execute(self.__baselines_query(len(ages)), parameters)}
+        if -1 not in found:
+            return None
+        return [found.get(position) for position in range(len(ages))]
+
+    def __baselines_query(self, count):
+        query = self.__queries.get(count)
+        if query is None:
+            query = " UNION ALL ".join(
+                f"SELECT * FROM (SELECT {position}, timestamp, data, metadata FROM snapshots"
+                f" WHERE path = ? AND timestamp <= ? ORDER BY timestamp DESC LIMIT 1)"
+                for position in range(-1, count))
+            self.__queries[count] = query
+        return query
+
+    # window - Iterate over the (position, timestamp, data) of some paths between two points in time
+    #
+    # position is the index of the path in paths. The paths go to a temporary
+    # table that the snapshots are joined with, so the rows come back as plain
+    # numbers in one query, ordered by position and time without a sort.
+
+    def window(self, paths, since, until):
+        self.__window_paths(paths)
+        return self.db.execute(
+            "SELECT w.position, s.timestamp, s.data FROM window_paths w"
+            " JOIN snapshots s ON s.path = w.path AND s.timestamp >= ? AND s.timestamp < ?"
+            " ORDER BY w.position, s.timestamp",
+            (int(since), int(until)))
+
+    # series - Iterate over the (position, packed points) of the paths that have a series
+
+    def series(self, paths):
+        self.__window_paths(paths)
+        return self.db.execute("SELECT w.position, s.points FROM window_paths w JOIN series s ON s.path = w.path")
+
+    # put_series - Store the series of some paths
+    #
+    # rows is an iterable of (path, timestamp of the newest point, packed points)
+
+    def put_series(self, rows):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO series VALUES (?, ?, ?)", rows)
+
+    def __window_paths(self, paths):
+        with self.db:
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS window_paths"
+                            " (position INTEGER PRIMARY KEY, path TEXT NOT NULL)")
+            self.db.execute("DELETE FROM window_paths")
+            self.db.executemany("INSERT INTO window_paths VALUES (?, ?)", enumerate(paths))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# InfluxDBSink.py
+#
+
+# Standard Python libaries
+import datetime
+
+# InfluxDB libraries
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+#  Import local Python libraries
+from utils.Baselines import invalidate_cache
+from utils.ChangeTracker import ChangeTracker
+from utils.LineProtocol import LineProtocolBatcher, encode_line, encode_typed_line, DEFAULT_BATCH_SIZE
+from utils.Spool import Spool
+
+
+# create_client - Build the InfluxDB client from the config
+
+def create_client(config):
+    influxdb_address = config["influxdb"]["address"]
+    return InfluxDBClient(
+        url=f"http://{influxdb_address}:8086",
+        token=config["influxdb"]["token"],
+        org=config["influxdb"]["org_name"],
+        enable_gzip=config["influxdb"].get("enable_gzip", False),
+    )
+
+
+# create_write_api - Build the InfluxDB client and a synchronous write API from the config
+
+def create_write_api(config):
+    # Create an instance of the InfluxDB client
+    client = create_client(config)
+
+    # Create a write API instance. Rows are batched by us, so the writes are synchronous.
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    return client, write_api
+
+
+#
+# InfluxDBSink Class
+#
+# This sink writes one CapacityDetails row per directory to InfluxDB.
+# A write API can be handed in so that a daemon keeps one client across runs;
+# otherwise the sink creates its own client and closes it with the sink. With
+# influxdb.change_only set, only the directories that changed since the last
+# write, or whose heartbeat is due, are written. With influxdb.spool enabled,
+# failed writes are spooled to disk and replayed by the following runs.
+
+
+class InfluxDBSink(object):
+    name = "influxdb"
+
+    def __init__(self, config, logger=None, write_api=None):
+
+        # Store the config
+        self.config = config
+
+        # Store the logger..
+        self.logger = logger
+
+        self.client = None
+        self.write_api = write_api
+        self.batcher = None
+        self.current_time = None
+
+        # The change tracker and the DirStats waiting for their batch to be written
+        self.tracker = None
+        self.unflushed = []
+
+        self.spool = None
+
+        # The spool is replayed through its own client, so that the replay
+        # thread never shares a write API with the writes of the run
+        self.replay_client = None
+
+    # open - Start a run
+
+    def open(self):
+        if self.write_api is None:
+            self.client, self.write_api = create_write_api(self.config)
+
+        self.spool = Spool.from_config(self.config, self.logger)
+
+        self.batcher = LineProtocolBatcher(self.write_api, self.config["influxdb"]["bucket_name"],
+                                           batch_size=self.config["influxdb"].get("batch_size", DEFAULT_BATCH_SIZE),
+                                           logger=self.logger, on_flush=self.__flushed, spool=self.spool)
+
+        # Drain what earlier runs could not write while this run crawls
+        if self.spool is not None and self.spool.segments():
+            self.replay_client, replay_write_api = create_write_api(self.config)
+            replay_batcher = LineProtocolBatcher(replay_write_api, self.config["influxdb"]["bucket_name"],
+                                                 logger=self.logger)
+            self.spool.start_replay(replay_batcher.write_payload)
+
+        self.current_time = datetime.datetime.now(datetime.timezone.utc)
+
+        if self.config["influxdb"].get("change_only", False):
+            self.tracker = ChangeTracker.from_config(self.config, self.logger)
+            self.unflushed = []
+
+    # write - Queue the row of one directory
+
+    def write(self, stats):
+        if self.tracker is not None:
+            if not self.tracker.should_write(stats, self.current_time.timestamp()):
+                return
+            self.unflushed.append(stats)
+
+        self.write_data_points(stats.path, stats.capacity, stats.data, stats.metadata,
+                               stats.directories, stats.files, stats.cluster, stats.trend)
+
+    def __flushed(self, written):
+        # When InfluxDB accepted the batch, its values become the last written ones.
+        # Spooled rows are not marked, the next run writes them again in case the
+        # replay never gets them through.
+        if self.tracker is not None:
+            if written:
+                self.tracker.mark_written(self.unflushed, self.current_time.timestamp())
+            self.unflushed = []
+
+    def write_data_points(self, path, capacity, data, metadata, dir_count, file_count, cluster=None, trend=None):
+        # One row per path carrying every field. Multi-cluster runs also tag the cluster.
+        tags = {"path": path}
+        if cluster is not None:
+            tags["cluster"] = cluster
+        fields = {
+            "capacity": capacity,
+            "data_capacity": data,
+            "metadata_capacity": metadata,
+            "dir_count": dir_count,
+            "file_count": file_count,
+        }
+
+        # With trends enabled, the row also carries the float trend fields that are known
+        trend_fields = trend.fields() if trend is not None else None
+        if trend_fields:
+            fields.update(trend_fields)
+            self.batcher.add(encode_typed_line("CapacityDetails", tags, fields, self.current_time.timestamp()))
+        else:
+            self.batcher.add(encode_line("CapacityDetails", tags, fields, self.current_time.timestamp()))
+
+    # counters - Return what the last run wrote, for the run telemetry
+
+    def counters(self):
+        if self.batcher is None:
+            return {}
+        return {
+            "points": self.batcher.lines_written,
+            "points_spooled": self.batcher.lines_spooled,
+            "influxdb_writes": self.batcher.requests,
+            "influxdb_bytes": self.batcher.bytes_written,
+            "influxdb_flush_seconds": round(self.batcher.write_seconds, 6),
+        }
+
+    # close - Send the remaining rows, even of an incomplete run, and close the client if the sink created it
+
+    def close(self, complete=True):
+        try:
+            self.batcher.flush()
+            if self.logger is not None:
+                self.logger.info(f"{self.batcher.lines_written} point(s) written to InfluxDB "
+                                 f"in {self.batcher.requests} request(s)")
+                if self.batcher.lines_spooled:
+                    self.logger.warning(f"{self.batcher.lines_spooled} point(s) spooled for a later run")
+        finally:
+            if self.spool is not None:
+                self.spool.stop_replay()
+
+            # The cached report baselines were read before these points
+            if self.batcher.lines_written or (self.spool is not None and self.spool.replayed):
+                invalidate_cache(self.config, self.logger)
+
+            if self.replay_client is not None:
+                self.replay_client.close()
+                self.replay_client = None
+            if self.tracker is not None:
+                self.tracker.close()
+                self.tracker = None
+            if self.client is not None:
+                self.write_api.close()
+                self.client.close()
+                self.client = None
+                self.write_api = None
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# LineProtocol.py
+#
+
+# Import Python system libraries
+import time
+
+# Characters that must be escaped in measurement names and tag keys/values. A
+# line break cannot be escaped and would end the row, so it is written as the
+# two characters \n (or \r) instead. A backslash is doubled, so a name that
+# ends with one does not escape the separator that follows it.
+TAG_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\\": "\\\\", "\n": "\\n", "\r": "\\r"})
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Timestamps are written in seconds. This is WritePrecision.S of influxdb_client,
+# spelled out so that encoding does not import the client library.
+WRITE_PRECISION = "s"
+
+
+# escape_tag - Escape a tag key or value for InfluxDB line protocol
+
+def escape_tag(value):
+    return str(value).translate(TAG_ESCAPES)
+
+
+# encode_line - Encode a single line protocol row with integer fields and a timestamp in seconds
+
+def encode_line(measurement, tags, fields, timestamp):
+    # InfluxDB indexes tags fastest when they arrive sorted by key
+    tag_set = "".join(f",{escape_tag(key)}={escape_tag(value)}" for key, value in sorted(tags.items()))
+    field_set = ",".join(f"{escape_tag(key)}={int(value)}i" for key, value in fields.items())
+    return f"{escape_tag(measurement)}{tag_set} {field_set} {int(timestamp)}"
+
+
+# encode_field - Encode a field value of any type: integer, float, boolean or string
+
+def encode_field(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+# encode_typed_line - Encode a line protocol row whose fields are not all integers
+
+def encode_typed_line(measurement, tags, fields, timestamp):
+    tag_set = "".join(f",{escape_tag(key)}={escape_tag(value)}" for key, value in sorted(tags.items()))
+    field_set = ",".join(f"{escape_tag(key)}={encode_field(value)}" for key, value in fields.items())
+    return f"{escape_tag(measurement)}{tag_set} {field_set} {int(timestamp)}"
+
+
+#
+# LineProtocolBatcher Class
+#
+# This class collects pre-encoded line protocol rows and sends them to InfluxDB
+# as a few large payloads instead of one request per row. The client decides
+# whether the payloads are gzip compressed on the wire. With a spool, a payload
+# that cannot be written is spooled to disk instead, and after the first failure
+# the rest of the run goes straight to the spool without waiting for InfluxDB.
+
+
+class LineProtocolBatcher(object):
+    def __init__(self, write_api, bucket, batch_size=DEFAULT_BATCH_SIZE, logger=None, on_flush=None, spool=None):
+
+        # Store the synchronous write API and the destination bucket
+        self.write_api = write_api
+        self.bucket = bucket
+        self.batch_size = max(1, int(batch_size))
+
+        # Store the logger..
+        self.logger = logger
+
+        # Called after every write, with True when InfluxDB accepted the payload
+        # and False when it was spooled instead
+        self.on_flush = on_flush
+
+        self.spool = spool
+        self.failed = False
+
+        self.lines = []
+
+        # Counters of what has been written so far
+        self.lines_written = 0
+        self.bytes_written = 0
+        self.requests = 0
+        self.lines_spooled = 0
+        self.write_seconds = 0.0
+
+    # add - Queue one encoded row and send the batch once it is full
+
+    def add(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    # flush - Send all queued rows as one payload
+
+    def flush(self):
+        if not self.lines:
+            return
+
+        line_count = len(self.lines)
+        payload = "\n".join(self.lines)
+        self.lines = []
+
+        if self.failed:
+            self.__spool(payload, line_count)
+            return
+
+        if self.logger is not None:
+            self.logger.debug(f"Writing {line_count} line(s) to bucket {self.bucket}")
+
+        start = time.perf_counter()
+        try:
+            self.write_payload(payload)
+        except Exception as err:
+            self.write_seconds += time.perf_counter() - start
+            if self.spool is None:
+                raise
+            if self.logger is not None:
+                self.logger.warning(f"InfluxDB write failed, spooling the rest of the run. Error was {err}")
+            self.failed = True
+            self.__spool(payload, line_count)
+            return
+
+        self.write_seconds += time.perf_counter() - start
+        self.lines_written += line_count
+        self.bytes_written += len(payload)
+        self.requests += 1
+
+        if self.on_flush is not None:
+            self.on_flush(True)
+
+    # write_payload - Send one line protocol payload to the bucket
+
+    def write_payload(self, payload):
+        self.write_api.write(bucket=self.bucket, record=payload, write_precision=WRITE_PRECISION)
+
+    def __spool(self, payload, line_count):
+        self.spool.append(payload)
+        self.lines_spooled += line_count
+
+        if self.on_flush is not None:
+            self.on_flush(False)
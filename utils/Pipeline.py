@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Pipeline.py
+#
+
+# Import Python system libraries
+import queue
+import threading
+import time
+
+#  Import local Python libraries
+from utils.Collector import Collector
+from utils.CrawlState import CrawlState
+from utils.Stats import StatsColumns
+
+# The number of DirStats that the cluster threads may queue ahead of the sinks
+MERGE_QUEUE_SIZE = 10000
+
+#
+# Pipeline
+#
+# A run crawls every configured root once and hands the DirStats of each
+# directory aggregate to all of the sinks. A sink is any object with open(),
+# write(stats) and close(complete) methods. When the crawl fails, the sinks are
+# closed with complete=False so that they can keep what they already have
+# without reporting a partial run. Several clusters are crawled concurrently,
+# each in its own thread, and their DirStats are merged into the one stream
+# that feeds the sinks, so the sinks themselves are only used by one thread.
+# A cluster whose crawl fails is logged and left out of the adaptive crawl
+# state, and the run goes on with the others; it only fails when every
+# cluster failed.
+# With a RunTelemetry, the time spent waiting for the crawl and in every sink
+# is measured, and a sink with a counters() method adds its own counters. With
+# trends enabled, the stream passes through the TrendEngine on its way to the
+# sinks, so every DirStats carries its Trend.
+
+
+# collect_stats - Yield the DirStats of the configured directories of one cluster
+
+def collect_stats(args, rc, config, logger=None, cluster=None, crawl_state=None, telemetry=None):
+    directories = config.dir_paths
+    max_workers = Collector.get_max_workers(args, config)
+
+    # The asyncio backend and aiohttp are only loaded when the config file asks for them
+    collector = None
+    if config["directories"].get("asyncio", {}).get("enabled", False):
+        from utils.AsyncCollector import AsyncCollector
+        collector = AsyncCollector.from_client(rc, config, logger, crawl_state, cluster)
+    if collector is None:
+        shard_workers, shard_paths = Collector.get_shard(config)
+        collector = Collector(rc, max_depth=config.max_depth, max_workers=max_workers,
+                              logger=logger, crawl_state=crawl_state, cluster=cluster,
+                              shard_workers=shard_workers, shard_paths=shard_paths)
+
+    try:
+        for directory, dir_aggregates, elapsed in collector.collect(directories):
+            # The aggregate dicts of a root are let go as soon as it is in columns,
+            # before the sinks see its first directory
+            columns = StatsColumns.from_aggregates(dir_aggregates, cluster)
+            dir_aggregates = None
+            yield from columns.stats()
+    finally:
+        if telemetry is not None:
+            telemetry.count("roots", len(collector.latencies))
+            telemetry.count("api_calls", collector.requests)
+            telemetry.add_time("read_dir_aggregates", sum(collector.latencies.values()))
+
+
+# merge_clusters - Yield the DirStats of several clusters that are crawled concurrently
+#
+# targets is a list of (cluster name, RestClient, config of that cluster). With
+# call, the crawl of each cluster runs as call(rc, config, crawl), which can log
+# in again and retry when the session of that cluster expired.
+
+def merge_clusters(args, targets, logger=None, crawl_state=None, telemetry=None, call=None):
+    results = queue.Queue(maxsize=MERGE_QUEUE_SIZE)
+    stopped = threading.Event()
+    done = object()
+    errors = []
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(cluster, rc, config):
+        sent = 0
+
+        def crawl():
+            nonlocal sent
+            # A retry must not send the directories that already went to the sinks again
+            if sent:
+                raise Exception(f"The session expired after {sent} directories were collected")
+            for stats in collect_stats(args, rc, config, logger, cluster, crawl_state, telemetry):
+                if not put(stats):
+                    return
+                sent += 1
+
+        try:
+            if call is None:
+                crawl()
+            else:
+                call(rc, config, crawl)
+        except Exception as err:
+            if logger is not None:
+                logger.error(f'Collection from {cluster} failed, error was {err}')
+            if crawl_state is not None:
+                crawl_state.discard(cluster)
+            if telemetry is not None:
+                telemetry.fail(f"collect_{cluster}")
+            errors.append(err)
+        put(done)
+
+    threads = [threading.Thread(target=produce, args=target, name=f"collect-{target[0]}", daemon=True)
+               for target in targets]
+    for thread in threads:
+        thread.start()
+
+    try:
+        remaining = len(threads)
+        while remaining:
+            item = results.get()
+            if item is done:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+    if len(errors) == len(targets):
+        raise errors[0]
+
+
+# feed_sinks - Open the sinks, write every DirStats to all of them and close them
+
+def feed_sinks(stats_stream, sinks, logger=None, telemetry=None):
+    for sink in sinks:
+        sink.open()
+
+    complete = False
+    paths = 0
+    collect_seconds = 0.0
+    write_seconds = [0.0] * len(sinks)
+    try:
+        mark = time.perf_counter()
+        for stats in stats_stream:
+            now = time.perf_counter()
+            collect_seconds += now - mark
+            mark = now
+            paths += 1
+            for index, sink in enumerate(sinks):
+                sink.write(stats)
+                now = time.perf_counter()
+                write_seconds[index] += now - mark
+                mark = now
+        complete = True
+    finally:
+        if telemetry is not None:
+            telemetry.add_time("collect", collect_seconds)
+            telemetry.count("paths", paths)
+            if not complete:
+                telemetry.fail("pipeline")
+
+        errors = []
+        for index, sink in enumerate(sinks):
+            start = time.perf_counter()
+            try:
+                sink.close(complete)
+            except Exception as err:
+                if logger is not None:
+                    logger.error(f'The {sink.name} sink could not be closed, error was {err}')
+                errors.append(err)
+                if telemetry is not None:
+                    telemetry.fail(f"{sink.name}_close")
+
+            if telemetry is not None:
+                telemetry.add_time(f"{sink.name}_write", write_seconds[index])
+                telemetry.add_time(f"{sink.name}_close", time.perf_counter() - start)
+                if hasattr(sink, "counters"):
+                    for name, value in sink.counters().items():
+                        telemetry.count(name, value)
+
+    if errors:
+        raise errors[0]
+
+    return sinks
+
+
+# load_trends - Return the TrendEngine of the config file, or None when trends are not enabled
+#
+# The engine is built before the sinks are opened, so that it only reads the
+# history of earlier runs. Unless one of the sinks keeps the history store up
+# to date, the engine records the run in it.
+
+def load_trends(config, sinks, logger=None):
+    # The trend engine and numpy are only loaded when the config file asks for them
+    if not config.get("trends", {}).get("enabled", False):
+        return None
+
+    from utils.Trends import TrendEngine
+    record = not any(getattr(sink, "records_history", False) for sink in sinks)
+    return TrendEngine.from_config(config, logger, record)
+
+
+# close_trends - Close the TrendEngine of a run and count what it did
+
+def close_trends(trends, telemetry=None, complete=True):
+    if trends is None:
+        return
+
+    trends.close(complete)
+    if telemetry is not None:
+        telemetry.count("trend_paths", trends.paths)
+        telemetry.add_time("trends", trends.seconds)
+
+
+# run_pipeline - Collect the configured directories once and feed every sink
+
+def run_pipeline(args, rc, config, sinks, logger=None, telemetry=None):
+    crawl_state = CrawlState.from_config(config, logger)
+    trends = load_trends(config, sinks, logger)
+    complete = False
+    try:
+        stats_stream = collect_stats(args, rc, config, logger, crawl_state=crawl_state, telemetry=telemetry)
+        if trends is not None:
+            stats_stream = trends.annotate(stats_stream)
+        sinks = feed_sinks(stats_stream, sinks, logger, telemetry)
+        complete = True
+        return sinks
+    finally:
+        if crawl_state is not None:
+            crawl_state.close(complete)
+        close_trends(trends, telemetry, complete)
+
+
+# run_clusters_pipeline - Collect several clusters concurrently and feed every sink from all of them
+
+def run_clusters_pipeline(args, targets, config, sinks, logger=None, telemetry=None, call=None):
+    crawl_state = CrawlState.from_config(config, logger)
+    trends = load_trends(config, sinks, logger)
+    complete = False
+    try:
+        stats_stream = merge_clusters(args, targets, logger, crawl_state, telemetry, call)
+        if trends is not None:
+            stats_stream = trends.annotate(stats_stream)
+        sinks = feed_sinks(stats_stream, sinks, logger, telemetry)
+        complete = True
+        return sinks
+    finally:
+        if crawl_state is not None:
+            crawl_state.close(complete)
+        close_trends(trends, telemetry, complete)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Ranking.py
+#
+
+# Import Python system libraries
+import heapq
+
+#
+# TopK Class
+#
+# This class keeps the k items with the highest scores of a stream in a bounded
+# min-heap, so memory stays at O(k) however many items are pushed. On equal
+# scores the earlier item wins, so a ranking keeps the order of the stream.
+
+
+class TopK(object):
+    def __init__(self, k):
+        self.k = max(1, int(k))
+
+        # (score, -sequence number, item), lowest score first
+        self.heap = []
+        self.pushed = 0
+
+    # push - Offer an item, it is kept while it is among the k highest scores
+
+    def push(self, score, item):
+        self.pushed += 1
+        entry = (score, -self.pushed, item)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    # items - Return the kept (score, item) pairs, highest score first
+
+    def items(self):
+        return [(score, item) for score, order, item in sorted(self.heap, key=lambda entry: entry[:2],
+                                                               reverse=True)]
+
+    def __len__(self):
+        return len(self.heap)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# SessionCache.py
+#
+
+# Import Python system libraries
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "directorytrends", "sessions.json")
+
+#
+# SessionCache Class
+#
+# This class keeps the bearer tokens of the Qumulo clusters that the scripts
+# logged into, keyed by cluster address, port and user, so that later runs and
+# other processes can reuse a session instead of logging in again. The file is
+# only readable by its owner and is locked while it is read or rewritten.
+
+
+class SessionCache(object):
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, logger=None):
+
+        self.cache_path = cache_path
+
+        # Store the logger..
+        self.logger = logger
+
+    @staticmethod
+    def key(address, port, username):
+        return f"{address}:{port}:{username}"
+
+    # get - Return the cached bearer token of a cluster user, or None
+
+    def get(self, address, port, username):
+        try:
+            with self.__locked(fcntl.LOCK_SH) as sessions:
+                return sessions.get(self.key(address, port, username))
+        except (OSError, ValueError) as err:
+            if self.logger is not None:
+                self.logger.debug(f"Session cache could not be read, error was {err}")
+            return None
+
+    # put - Store the bearer token of a cluster user
+
+    def put(self, address, port, username, bearer_token):
+        self.__update(self.key(address, port, username), bearer_token)
+
+    # remove - Forget the bearer token of a cluster user
+
+    def remove(self, address, port, username):
+        self.__update(self.key(address, port, username), None)
+
+    def __update(self, key, bearer_token):
+        try:
+            with self.__locked(fcntl.LOCK_EX) as sessions:
+                if bearer_token is None:
+                    sessions.pop(key, None)
+                else:
+                    sessions[key] = bearer_token
+
+                # Write a private temporary file and move it over the cache
+                temp_path = f"{self.cache_path}.{os.getpid()}"
+                fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w") as temp_file:
+                    json.dump(sessions, temp_file)
+                os.replace(temp_path, self.cache_path)
+        except (OSError, ValueError) as err:
+            if self.logger is not None:
+                self.logger.warning(f"Session cache could not be updated, error was {err}")
+
+    @contextmanager
+    def __locked(self, operation):
+        cache_dir = os.path.dirname(self.cache_path)
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+        # A separate lock file, because the cache itself is replaced on every update
+        fd = os.open(f"{self.cache_path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, operation)
+            sessions = {}
+            if os.path.exists(self.cache_path):
+                with open(self.cache_path, "r") as cache_file:
+                    sessions = json.load(cache_file)
+            yield sessions
+        finally:
+            os.close(fd)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Spool.py
+#
+
+# Import Python system libraries
+import glob
+import gzip
+import os
+import threading
+import time
+
+DEFAULT_SPOOL_PATH = "./spool"
+DEFAULT_REPLAY_RATE = 1024 * 1024
+DEFAULT_REPLAY_BATCH_BYTES = 4 * 1024 * 1024
+DEFAULT_REPLAY_WAIT = 5
+DEFAULT_REPLAY_MAX_ATTEMPTS = 3
+
+# The HTTP statuses of a write that InfluxDB rejected for its content. Any
+# other error means InfluxDB is unreachable or struggling, and the replay
+# waits for the next run instead of blaming the segment.
+REJECTED_STATUSES = (400, 413, 422)
+
+QUARANTINE_DIR = "quarantine"
+
+#
+# Spool Class
+#
+# This class is a write-ahead spool for InfluxDB. A payload that could not be
+# written is stored as a gzip compressed line protocol segment on local disk.
+# The segments are replayed oldest first, several at a time, at a bounded rate
+# and each one is only removed once InfluxDB accepted it, so no sample is lost
+# while the database is slow or down. A segment that InfluxDB rejects for its
+# content is skipped, and after replay_max_attempts rejections it is moved to
+# the quarantine directory, so it does not hold back the segments behind it.
+
+
+class Spool(object):
+    def __init__(self, spool_path=DEFAULT_SPOOL_PATH, replay_rate=DEFAULT_REPLAY_RATE,
+                 replay_batch_bytes=DEFAULT_REPLAY_BATCH_BYTES, replay_wait=DEFAULT_REPLAY_WAIT,
+                 replay_max_attempts=DEFAULT_REPLAY_MAX_ATTEMPTS, logger=None):
+
+        self.spool_path = spool_path
+        self.replay_rate = replay_rate
+        self.replay_batch_bytes = replay_batch_bytes
+        self.replay_wait = replay_wait
+        self.replay_max_attempts = max(1, int(replay_max_attempts))
+
+        # Store the logger..
+        self.logger = logger
+
+        os.makedirs(self.spool_path, exist_ok=True)
+
+        self.stopped = threading.Event()
+        self.__thread = None
+        self.__sequence = 0
+
+        # Counters of the current run
+        self.spooled = 0
+        self.replayed = 0
+        self.quarantined = 0
+
+    # from_config - Open the spool when it is enabled in the config file, or return None
+
+    @staticmethod
+    def from_config(config, logger=None):
+        spool = config["influxdb"].get("spool", {})
+        if not spool.get("enabled", False):
+            return None
+        return Spool(spool.get("path", DEFAULT_SPOOL_PATH),
+                     spool.get("replay_rate", DEFAULT_REPLAY_RATE),
+                     spool.get("replay_batch_bytes", DEFAULT_REPLAY_BATCH_BYTES),
+                     spool.get("replay_wait", DEFAULT_REPLAY_WAIT),
+                     spool.get("replay_max_attempts", DEFAULT_REPLAY_MAX_ATTEMPTS),
+                     logger)
+
+    # append - Store one payload that could not be written
+
+    def append(self, payload):
+        self.__sequence += 1
+        name = f"segment-{time.time_ns():020d}-{os.getpid()}-{self.__sequence:06d}.lp.gz"
+        segment_path = os.path.join(self.spool_path, name)
+
+        # Write under a temporary name so that a replay never sees half a segment
+        with gzip.open(f"{segment_path}.tmp", "wt") as segment:
+            segment.write(payload)
+        os.replace(f"{segment_path}.tmp", segment_path)
+
+        self.spooled += 1
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.spool_path, "segment-*.lp.gz")))
+
+    # replay - Write the spooled segments with write_payload until done, stopped or failing
+
+    def replay(self, write_payload):
+        batch = []
+        batch_bytes = 0
+
+        for segment_path in self.segments():
+            if self.stopped.is_set():
+                break
+
+            try:
+                with gzip.open(segment_path, "rt") as segment:
+                    payload = segment.read()
+            except FileNotFoundError:
+                # Another process replayed it first
+                continue
+
+            batch.append((segment_path, payload))
+            batch_bytes += len(payload)
+            if batch_bytes >= self.replay_batch_bytes:
+                if not self.__replay_batch(write_payload, batch):
+                    return
+                batch = []
+                batch_bytes = 0
+
+        if batch and not self.stopped.is_set():
+            self.__replay_batch(write_payload, batch)
+
+    def __replay_batch(self, write_payload, batch):
+        start = time.monotonic()
+        payload = "\n".join(payload for segment_path, payload in batch)
+
+        try:
+            write_payload(payload)
+        except Exception as err:
+            if getattr(err, "status", None) not in REJECTED_STATUSES:
+                if self.logger is not None:
+                    self.logger.warning(f"Spool replay stopped, error was {err}")
+                return False
+
+            # Write the segments of the batch one by one to find the rejected ones
+            if len(batch) > 1:
+                for item in batch:
+                    if not self.__replay_batch(write_payload, [item]):
+                        return False
+                return True
+
+            self.__reject(batch[0][0], err)
+            return True
+
+        for segment_path, segment_payload in batch:
+            for path in (segment_path, f"{segment_path}.attempts"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.replayed += len(batch)
+
+        if self.logger is not None:
+            self.logger.info(f"Replayed {len(batch)} spooled segment(s), {len(payload)} bytes")
+
+        # Keep the replay under the configured rate
+        if self.replay_rate:
+            delay = len(payload) / self.replay_rate - (time.monotonic() - start)
+            if delay > 0:
+                self.stopped.wait(delay)
+
+        return True
+
+    def __reject(self, segment_path, err):
+        # Count the rejections of a segment next to it, and quarantine it after the last attempt
+        attempts_path = f"{segment_path}.attempts"
+        try:
+            with open(attempts_path) as attempts_file:
+                attempts = int(attempts_file.read() or 0)
+        except (FileNotFoundError, ValueError):
+            attempts = 0
+        attempts += 1
+
+        if attempts < self.replay_max_attempts:
+            with open(attempts_path, "w") as attempts_file:
+                attempts_file.write(str(attempts))
+            if self.logger is not None:
+                self.logger.warning(f"InfluxDB rejected spooled segment {os.path.basename(segment_path)} "
+                                    f"(attempt {attempts} of {self.replay_max_attempts}), skipped. Error was {err}")
+            return
+
+        quarantine_path = os.path.join(self.spool_path, QUARANTINE_DIR)
+        os.makedirs(quarantine_path, exist_ok=True)
+        try:
+            os.replace(segment_path, os.path.join(quarantine_path, os.path.basename(segment_path)))
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(attempts_path)
+        except FileNotFoundError:
+            pass
+        self.quarantined += 1
+
+        if self.logger is not None:
+            self.logger.error(f"InfluxDB rejected spooled segment {os.path.basename(segment_path)} "
+                              f"{attempts} times, moved to {quarantine_path}. Error was {err}")
+
+    # start_replay - Replay the backlog in a background thread
+
+    def start_replay(self, write_payload):
+        if not self.segments():
+            return
+
+        if self.logger is not None:
+            self.logger.info(f"Replaying {len(self.segments())} spooled segment(s) in the background")
+
+        self.stopped.clear()
+        self.__thread = threading.Thread(target=self.replay, args=(write_payload,), daemon=True)
+        self.__thread.start()
+
+    # stop_replay - Give the background replay up to replay_wait seconds, then stop it
+
+    def stop_replay(self):
+        if self.__thread is None:
+            return
+
+        self.__thread.join(self.replay_wait)
+        self.stopped.set()
+        self.__thread.join()
+        self.__thread = None
+
+        if self.logger is not None and self.segments():
+            self.logger.info(f"{len(self.segments())} spooled segment(s) left for the next run")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Stats.py
+#
+
+# Import Python system libraries
+import sys
+from array import array
+
+# The integer fields of a directory, in the order used by rows and columns
+FIELDS = ("capacity", "data", "metadata", "files", "directories")
+
+#
+# DirStats Class
+#
+# The usage of one directory. Records use __slots__ instead of a per-instance
+# dict and the paths are interned, so a path shared by the collectors, the
+# history store and the report is only kept once. In a multi-cluster run the
+# record also carries the name of its cluster, and with trends enabled its Trend.
+
+
+class DirStats(object):
+    __slots__ = ("path", "cluster", "trend") + FIELDS
+
+    def __init__(self, path, capacity, data, metadata, files, directories, cluster=None):
+        self.path = sys.intern(path)
+        self.cluster = cluster
+        self.trend = None
+        self.capacity = capacity
+        self.data = data
+        self.metadata = metadata
+        self.files = files
+        self.directories = directories
+
+    # from_aggregate - Build the record of one read_dir_aggregates entry
+
+    @classmethod
+    def from_aggregate(cls, dir_aggregate, cluster=None):
+        return cls(dir_aggregate["path"],
+                   int(dir_aggregate["total_capacity"]),
+                   int(dir_aggregate["total_data"]),
+                   int(dir_aggregate["total_meta"]),
+                   int(dir_aggregate["total_files"]),
+                   int(dir_aggregate["total_directories"]),
+                   cluster)
+
+    # key - The path, prefixed with the cluster name in a multi-cluster run
+
+    @property
+    def key(self):
+        if self.cluster is None:
+            return self.path
+        return sys.intern(f"{self.cluster}:{self.path}")
+
+    # as_row - Return (key, capacity, data, metadata, files, directories)
+
+    def as_row(self):
+        return (self.key, self.capacity, self.data, self.metadata, self.files, self.directories)
+
+    def __repr__(self):
+        return f"DirStats{self.as_row()}"
+
+
+#
+# StatsColumns Class
+#
+# Many DirStats kept as one column per field. Every integer column is an
+# array of signed 64-bit values next to a list of the interned paths and a
+# list of the cluster names, which costs about 50 bytes per directory on top
+# of its path, instead of about 900 for an aggregate dict and 260 for a DirStats.
+
+
+class StatsColumns(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.paths = []
+        self.clusters = []
+        self.capacity = array("q")
+        self.data = array("q")
+        self.metadata = array("q")
+        self.files = array("q")
+        self.directories = array("q")
+
+    # from_aggregates - Build the columns of a list of read_dir_aggregates entries
+
+    @classmethod
+    def from_aggregates(cls, dir_aggregates, cluster=None):
+        columns = cls()
+        for dir_aggregate in dir_aggregates:
+            columns.paths.append(sys.intern(dir_aggregate["path"]))
+            columns.clusters.append(cluster)
+            columns.capacity.append(int(dir_aggregate["total_capacity"]))
+            columns.data.append(int(dir_aggregate["total_data"]))
+            columns.metadata.append(int(dir_aggregate["total_meta"]))
+            columns.files.append(int(dir_aggregate["total_files"]))
+            columns.directories.append(int(dir_aggregate["total_directories"]))
+        return columns
+
+    # append - Add the values of one DirStats
+
+    def append(self, stats):
+        self.paths.append(stats.path)
+        self.clusters.append(stats.cluster)
+        self.capacity.append(stats.capacity)
+        self.data.append(stats.data)
+        self.metadata.append(stats.metadata)
+        self.files.append(stats.files)
+        self.directories.append(stats.directories)
+
+    def __len__(self):
+        return len(self.paths)
+
+    # stats - Iterate over the rows as DirStats, each one only built when it is reached
+
+    def stats(self):
+        for path, capacity, data, metadata, files, directories, cluster in zip(
+                self.paths, self.capacity, self.data, self.metadata, self.files, self.directories, self.clusters):
+            yield DirStats(path, capacity, data, metadata, files, directories, cluster)
+
+    # rows - Iterate (key, capacity, data, metadata, files, directories) tuples
+
+    def rows(self):
+        return (stats.as_row() for stats in self.stats())
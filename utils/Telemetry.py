@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Telemetry.py
+#
+
+# Import Python system libraries
+import platform
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+#  Import local Python libraries
+from utils.LineProtocol import LineProtocolBatcher, encode_typed_line
+
+MEASUREMENT = "DirectoryTrendsRun"
+
+#
+# RunTelemetry Class
+#
+# This class measures where one run of a script spends its time and what it did.
+# Phases add up to <phase>_seconds fields, counters to integer fields, and a
+# phase that raises is counted in failures and named in failed_phases. At the
+# end of the run everything is written as one DirectoryTrendsRun point, tagged
+# with the script and the host, to the bucket of the capacity data. Counters may
+# be updated from several threads.
+
+
+class RunTelemetry(object):
+    def __init__(self, entry, logger=None):
+
+        # Name of the script, e.g. InfluxDBPush
+        self.entry = entry
+
+        # Store the logger..
+        self.logger = logger
+
+        self.started = time.time()
+        self.__start = time.perf_counter()
+
+        self.seconds = Counter()
+        self.counters = Counter()
+        self.failed_phases = []
+        self.__lock = threading.Lock()
+
+    # is_enabled - Check whether the config file asks for the run telemetry
+
+    @staticmethod
+    def is_enabled(config):
+        return config is not None and config.get("telemetry", {}).get("enabled", False)
+
+    # phase - Time a block of code as one phase of the run
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        except BaseException:
+            self.fail(name)
+            raise
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    # add_time - Add seconds to a phase
+
+    def add_time(self, name, seconds):
+        with self.__lock:
+            self.seconds[name] += seconds
+
+    # count - Add to a counter
+
+    def count(self, name, value=1):
+        with self.__lock:
+            self.counters[name] += value
+
+    # fail - Record a failed phase
+
+    def fail(self, name):
+        with self.__lock:
+            self.failed_phases.append(name)
+
+    # fields - Return the fields of the DirectoryTrendsRun point
+
+    def fields(self):
+        with self.__lock:
+            fields = {f"{name}_seconds": round(seconds, 6) for name, seconds in self.seconds.items()}
+            fields.update(self.counters)
+            fields["total_seconds"] = round(time.perf_counter() - self.__start, 6)
+            fields["failures"] = len(self.failed_phases)
+            if self.failed_phases:
+                fields["failed_phases"] = ",".join(self.failed_phases)
+        return fields
+
+    # encode - Return the DirectoryTrendsRun point as line protocol
+
+    def encode(self):
+        tags = {"entry": self.entry, "host": platform.node()}
+        return encode_typed_line(MEASUREMENT, tags, self.fields(), self.started)
+
+    # publish - Write the point to InfluxDB when the config file enables it
+    #
+    # A write API of a daemon may be reused. Telemetry never fails the run, so
+    # errors are only logged.
+
+    def publish(self, config, write_api=None):
+        if not RunTelemetry.is_enabled(config):
+            return
+
+        line = self.encode()
+        if self.logger is not None:
+            self.logger.debug(f"Run telemetry: {line}")
+
+        client = None
+        try:
+            if write_api is None:
+                # The InfluxDB client is only loaded when a point is written
+                from utils.InfluxDBSink import create_write_api
+                client, write_api = create_write_api(config)
+            batcher = LineProtocolBatcher(write_api, config["influxdb"]["bucket_name"], logger=self.logger)
+            batcher.add(line)
+            batcher.flush()
+        except Exception as err:
+            if self.logger is not None:
+                self.logger.warning(f"The run telemetry could not be written, error was {err}")
+        finally:
+            if client is not None:
+                write_api.close()
+                client.close()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2022 Qumulo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# -----------------------------------------------------------------------------
+# Trends.py
+#
+
+# Import Python system libraries
+import itertools
+import time
+
+#  Import local Python libraries
+from utils.History import HistoryStore, DAY, BASELINE_SLACK
+
+# numpy is only needed when trends are enabled
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_WINDOW_DAYS = 30
+DEFAULT_CHUNK_SIZE = 5000
+
+# A trend needs history that reaches back about a day, so that two snapshots a
+# few minutes apart do not make a small change look like a huge slope
+MIN_SPAN_DAYS = 1 - BASELINE_SLACK
+
+# The points of a series are stored as little-endian int64 (timestamp, data) pairs
+POINT_DTYPE = "<i8"
+
+#
+# Trend Class
+#
+# The trend of the data capacity of one directory over the window: the slope
+# of the least-squares line in bytes per day, that slope as a percentage of the
+# current size, and the days until the directory reaches the threshold at that
+# slope. A value that cannot be computed is None.
+
+
+class Trend(object):
+    __slots__ = ("slope", "growth_rate", "days_to_threshold")
+
+    def __init__(self, slope, growth_rate, days_to_threshold):
+        self.slope = slope
+        self.growth_rate = growth_rate
+        self.days_to_threshold = days_to_threshold
+
+    # fields - The trend as InfluxDB fields, without the values that are not known
+
+    def fields(self):
+        fields = {"data_growth_per_day": self.slope, "data_growth_rate": self.growth_rate,
+                  "days_to_threshold": self.days_to_threshold}
+        return {name: value for name, value in fields.items() if value is not None}
+
+
+#
+# TrendEngine Class
+#
+# This class gives every DirStats of a run its Trend. The stream is cut into
+# chunks, the history of a whole chunk is read with a few queries, and the
+# regressions of all of its directories are computed at once with numpy, so no
+# Python loop runs per history point. The current run counts as the newest
+# point of every directory, the history gives the newest point of every day
+# before the day of the run, and a directory needs history of about a day ago
+# to get a trend. Those daily points are kept in one series row per directory
+# that every run reads and writes back with its own point, so the history of
+# a run is one row per directory whatever the window. A directory without a
+# series gets its points from the snapshots once. When no sink of the run
+# keeps the history, as in a run with only the InfluxDB sink, the engine also
+# records the run itself, so that the email report has a history to use.
+
+
+class TrendEngine(object):
+    def __init__(self, history, window_days=DEFAULT_WINDOW_DAYS, threshold=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, logger=None, record=False):
+
+        self.history = history
+        self.window_days = window_days
+        self.threshold = threshold
+        self.chunk_size = max(1, int(chunk_size))
+
+        # Whether the engine appends the run to the history store
+        self.record = record
+
+        # Store the logger..
+        self.logger = logger
+
+        # Only the snapshots of earlier runs are used, even when a sink of this
+        # run already stored some of its own
+        self.until = int(time.time())
+
+        # The runs whose points are left out of the series, read with the first chunk
+        self.discarded = None
+
+        # Counters of the run
+        self.paths = 0
+        self.seconds = 0.0
+
+    # since - The start of the window of this run
+
+    @property
+    def since(self):
+        return self.until - self.window_days * DAY
+
+    # from_config - Build the engine of the "trends" section, or None when trends are not enabled
+
+    @staticmethod
+    def from_config(config, logger=None, record=False):
+        settings = config.get("trends", {})
+        if not settings.get("enabled", False):
+            return None
+
+        if numpy is None:
+            if logger is not None:
+                logger.warning("Trends need numpy and are not computed. "
+                               "Please run the following command: pip3 install numpy")
+            return None
+
+        threshold_gb = settings.get("threshold_gb")
+        return TrendEngine(HistoryStore.from_config(config, logger),
+                           settings.get("window_days", DEFAULT_WINDOW_DAYS),
+                           threshold_gb * 10 ** 9 if threshold_gb is not None else None,
+                           settings.get("chunk_size", DEFAULT_CHUNK_SIZE),
+                           logger, record)
+
+    # annotate - Yield the DirStats of a stream with their trends, a chunk at a time
+
+    def annotate(self, stats_stream):
+        chunk = []
+        for stats in stats_stream:
+            chunk.append(stats)
+            if len(chunk) >= self.chunk_size:
+                yield from self.__annotate_chunk(chunk)
+                chunk = []
+        yield from self.__annotate_chunk(chunk)
+
+    def __annotate_chunk(self, chunk):
+        if not chunk:
+            return []
+
+        start = time.perf_counter()
+        for stats, trend in zip(chunk, self.compute(chunk)):
+            stats.trend = trend
+        if self.record:
+            self.history.append(self.until, (stats.as_row() for stats in chunk))
+        self.seconds += time.perf_counter() - start
+        self.paths += len(chunk)
+        return chunk
+
+    # compute - Return the Trend of every DirStats of a list
+
+    def compute(self, stats_list):
+        count = len(stats_list)
+        keys = [stats.key for stats in stats_list]
+        sizes = numpy.fromiter((stats.data for stats in stats_list), dtype=numpy.int64, count=count)
+        current = sizes.astype(numpy.float64)
+
+        # Only the newest point of each day before the day of this run counts,
+        # so a daemon that runs every hour does not outweigh the days with one run
+        points = self.__load_points(keys)
+        day = points[:, 1] // DAY
+        keep = (points[:, 1] >= self.since) & (day < self.until // DAY)
+        if len(self.discarded):
+            keep &= ~numpy.isin(points[:, 1], self.discarded)
+        points, day = points[keep], day[keep]
+        newest = numpy.ones(len(points), dtype=bool)
+        newest[:-1] = (points[1:, 0] != points[:-1, 0]) | (day[1:] != day[:-1])
+        points = points[newest]
+
+        self.__store_series(keys, points, sizes)
+
+        # Every history point as days relative to this run and size relative to
+        # this run. Measuring from the current size keeps the sums small enough for float64.
+        group = points[:, 0]
+        days = (points[:, 1] - self.until) / DAY
+        delta = (points[:, 2] - sizes[group]).astype(numpy.float64)
+        oldest = numpy.zeros(count)
+        numpy.minimum.at(oldest, group, days)
+
+        # Least squares per directory from the per-group sums. The current run
+        # is the point (0, 0) of every directory, so it only adds to the counts.
+        samples = numpy.bincount(group, minlength=count) + 1
+        sum_t = numpy.bincount(group, days, minlength=count)
+        sum_y = numpy.bincount(group, delta, minlength=count)
+        sum_tt = numpy.bincount(group, days * days, minlength=count)
+        sum_ty = numpy.bincount(group, days * delta, minlength=count)
+        denominator = samples * sum_tt - sum_t * sum_t
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            slope = numpy.where((denominator > 0) & (oldest <= -MIN_SPAN_DAYS),
+                                (samples * sum_ty - sum_t * sum_y) / denominator, numpy.nan)
+            growth_rate = numpy.where(current > 0, 100 * slope / current, numpy.nan)
+            if self.threshold is None:
+                days_to_threshold = numpy.full(count, numpy.nan)
+            else:
+                days_to_threshold = numpy.where(current >= self.threshold, 0.0,
+                                                numpy.where(slope > 0, (self.threshold - current) / slope,
+                                                            numpy.nan))
+
+        columns = [numpy.round(values, 3).tolist() for values in (slope, growth_rate, days_to_threshold)]
+        return [Trend(*(None if value != value else value for value in values)) for values in zip(*columns)]
+
+    # __load_points - Return the (position, timestamp, data) history points of some paths, in order
+
+    def __load_points(self, keys):
+        if self.discarded is None:
+            self.discarded = numpy.array(self.history.discarded(self.since), dtype=numpy.int64)
+
+        rows = list(self.history.series(keys))
+        positions = numpy.fromiter((position for position, packed in rows), dtype=numpy.int64, count=len(rows))
+        lengths = [len(packed) // 16 for position, packed in rows]
+        pairs = numpy.frombuffer(b"".join(packed for position, packed in rows), dtype=POINT_DTYPE).reshape(-1, 2)
+        parts = [numpy.column_stack((numpy.repeat(positions, lengths), pairs))]
+
+        # The directories without a series read their window of snapshots once
+        found = numpy.zeros(len(keys), dtype=bool)
+        found[positions] = True
+        missing = numpy.flatnonzero(~found)
+        if not len(missing):
+            # The series come in the order of the paths, each one oldest first
+            return parts[0]
+
+        rows = self.history.window([keys[position] for position in missing.tolist()], self.since, self.until)
+        snapshots = numpy.fromiter(itertools.chain.from_iterable(rows), dtype=numpy.int64).reshape(-1, 3)
+        snapshots[:, 0] = missing[snapshots[:, 0]]
+        parts.append(snapshots)
+
+        points = numpy.concatenate(parts)
+        return points[numpy.lexsort((points[:, 1], points[:, 0]))]
+
+    # __store_series - Write back the series of some paths with the point of this run
+
+    def __store_series(self, keys, points, sizes):
+        # The points are ordered by path and time and this run is the newest point of every path
+        count = len(keys)
+        bounds = (16 * numpy.searchsorted(points[:, 0], numpy.arange(count + 1))).tolist()
+        packed = numpy.ascontiguousarray(points[:, 1:], dtype=POINT_DTYPE).tobytes()
+        this_run = numpy.column_stack((numpy.full(count, self.until), sizes)).astype(POINT_DTYPE).tobytes()
+        self.history.put_series((key, self.until, packed[bounds[position]:bounds[position + 1]]
+                                 + this_run[16 * position:16 * position + 16])
+                                for position, key in enumerate(keys))
+
+    # close - Keep what the engine recorded of a complete run, remove it otherwise
+    #
+    # The series already hold the point of this run, an incomplete run is only
+    # left out of them when they are read.
+
+    def close(self, complete=True):
+        try:
+            if complete:
+                if self.record:
+                    self.history.prune(self.until)
+            else:
+                self.history.discard(self.until)
+        finally:
+            self.history.close()